@@ -4,50 +4,62 @@ import plotly.express as px
 import datetime
 import datetime as dt
 import json
-from auth import get_connection, calc_hours, get_projects, add_user, hash_password, add_project
+from auth import get_connection, calc_hours_vectorized, hash_password, add_project
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, JsCode, DataReturnMode
-import io  # đảm bảo có import này ở đầu file
-import re
+import repository
+import task_store
+import task_stats
+import job_catalog
+import timesheet
+import presence
+import project_service
+import cong_export
+import project_members
+import loader
+import db_client
+import perf
+import sessions
+import storage
+from attendance import (
+    NOTE_USER, build_month_grid, load_attendance_month, month_codes_by_user, month_summary,
+    save_attendance_month
+)
+import math
 import time
-import uuid   # 👈 thêm dòng này
 
 # ====== CACHE DỮ LIỆU TỪ SUPABASE ======
-@st.cache_data(ttl=15)
+# (cache dùng chung cho mọi phiên nằm trong repository.py)
 def load_users_cached():
-    supabase = get_connection()
-    data = supabase.table("users").select("id, stt, username, display_name, dob, role, project_manager_of, project_leader_of").order("stt").execute()
-
-    return pd.DataFrame(data.data)
+    return repository.load_users()
 
 def load_users_fresh():
     supabase = get_connection()
     data = supabase.table("users").select("*").execute()
     return pd.DataFrame(data.data)
-@st.cache_data(ttl=15)
 def load_projects_cached():
-    supabase = get_connection()
-    data = supabase.table("projects").select("id, name, deadline, project_type, design_step").execute()
-    return pd.DataFrame(data.data)
+    return repository.load_projects()
 
-@st.cache_data(ttl=30)
 def load_job_catalog_cached():
-    supabase = get_connection()
-    data = supabase.table("job_catalog").select("id, name, unit, parent_id, project_type").execute()
-    return pd.DataFrame(data.data)
+    return repository.load_job_catalog()
 
 def refresh_all_cache():
     """Xóa cache và session_state khi có cập nhật thêm/xóa"""
     st.cache_data.clear()
-    for k in ["users_df", "projects_df", "jobs_df"]:
+    repository.invalidate()
+    project_service.invalidate_visible()
+    for k in ["df_users", "df_projects", "df_jobs"]:
+        st.session_state.pop(k, None)
+
+def clear_cong_exports():
+    """Bỏ các file Excel công nhật đã dựng trong session (dữ liệu công nhật vừa thay đổi)."""
+    for k in [k for k in st.session_state if str(k).startswith("cong_export_")]:
         st.session_state.pop(k, None)
 
 
 st.set_page_config(layout="wide")
 
 def load_projects_fresh():
-    supabase = get_connection()
-    data = supabase.table("projects").select("id, name, deadline, project_type, design_step").execute()
-    return pd.DataFrame(data.data)
+    return repository.load_projects(refresh=True)
 
 
 
@@ -60,8 +72,7 @@ def search_units(query: str):
     return [o for o in options if query.lower() in o.lower()]
 
 def update_last_seen(username):
-    supabase = get_connection()
-    supabase.table("users").update({"last_seen": datetime.datetime.now().isoformat()}).eq("username", username).execute()
+    presence.heartbeat(username)
 
     
 
@@ -72,13 +83,20 @@ def get_supabase_client():
 def admin_app(user):
     supabase = get_supabase_client()
 
-    # 🔹 Tải dữ liệu có cache
-    if "df_users" not in st.session_state:
-        st.session_state["df_users"] = load_users_cached()
-    if "df_projects" not in st.session_state:
-        st.session_state["df_projects"] = load_projects_cached()
-    if "df_jobs" not in st.session_state:
-        st.session_state["df_jobs"] = load_job_catalog_cached()
+    # 🔹 Tải dữ liệu có cache — các bảng còn thiếu được tải song song
+    loaders = {
+        "df_users": load_users_cached,
+        "df_projects": load_projects_cached,
+        "df_jobs": load_job_catalog_cached,
+    }
+    missing = {key: fn for key, fn in loaders.items() if key not in st.session_state}
+    if missing:
+        loaded = loader.gather(missing)
+        for key, err in loaded.errors.items():
+            st.error(f"❌ Lỗi khi tải {key[3:]}: {err}")
+        if not loaded.ok:
+            st.stop()
+        st.session_state.update(loaded.values)
 
     df_users = st.session_state["df_users"]
     df_projects = st.session_state["df_projects"]
@@ -88,26 +106,21 @@ def admin_app(user):
     user_map = dict(zip(df_users["username"], df_users["display_name"]))
 
 
-    # ✅ cập nhật trạng thái online (last_seen)
-    # ✅ Cập nhật thời gian đăng nhập nếu có user
-    try:
-        current_user = user if user else st.session_state.get("username") or st.session_state.get("user")
-        if current_user:
-            supabase.table("users").update({
-                "last_seen": datetime.datetime.now().isoformat()
-            }).eq("username", current_user).execute()
-        else:
-            print("⚠️ Không thể cập nhật last_seen vì chưa xác định user.")
-    except Exception as e:
-        print(f"⚠️ Lỗi khi cập nhật last_seen: {e}")
+    # ✅ cập nhật trạng thái online (last_seen) – ghi nền theo lô, không chặn trang
+    current_user = user if user else st.session_state.get("username") or st.session_state.get("user")
+    if current_user:
+        update_last_seen(current_user)
+    else:
+        print("⚠️ Không thể cập nhật last_seen vì chưa xác định user.")
 
 
     
 
-    menu = ["Quản lý người dùng", "Mục lục công việc", "Quản lý dự án", "Quản lý Giao Việc", "Chấm công – Nghỉ phép", "Thống kê công việc"]
+    menu = ["Quản lý người dùng", "Mục lục công việc", "Quản lý dự án", "Quản lý Giao Việc", "Chấm công – Nghỉ phép", "Thống kê công việc", "Chẩn đoán kết nối", "Hiệu năng"]
 
 
     choice = st.sidebar.radio("Chức năng", menu)
+    perf.set_section(choice)
     if choice == "Quản lý người dùng":
         st.subheader("👥 Quản lý user")
 
@@ -159,9 +172,10 @@ def admin_app(user):
         for col in ["Vai trò", "Chủ nhiệm dự án", "Chủ trì dự án"]:
             df_users[col] = df_users[col].astype(str).fillna("")
 
-        # ✅ Chuyển dữ liệu dự án từ chuỗi -> danh sách (để MultiSelectColumn hiểu)
-        for col in ["Chủ nhiệm dự án", "Chủ trì dự án"]:
-            df_users[col] = df_users[col].apply(lambda x: x.split("|") if x else [])
+        # ✅ Danh sách dự án của từng user lấy từ project_members (để MultiSelectColumn hiểu)
+        for col, role in [("Chủ nhiệm dự án", "manager"), ("Chủ trì dự án", "leader")]:
+            by_user = project_members.projects_by_user(role)
+            df_users[col] = df_users["Tên đăng nhập"].map(lambda u: by_user.get(u, []))
 
 
         # === Bảng chỉnh sửa ===
@@ -205,13 +219,18 @@ def admin_app(user):
                     original = df_users.loc[df_users["Tên đăng nhập"] == username].iloc[0]
                     update_data = {}
 
+                    # Dự án quản lý: ghi vào project_members, chỉ khi danh sách đổi
+                    member_changes = {
+                        role: list(row[col])
+                        for col, role in [("Chủ nhiệm dự án", "manager"), ("Chủ trì dự án", "leader")]
+                        if sorted(row[col] or []) != sorted(original[col] or [])
+                    }
+
                     for col, db_field in [
                         ("STT", "stt"),
                         ("Tên hiển thị", "display_name"),
                         ("Ngày sinh", "dob"),
                         ("Vai trò", "role"),
-                        ("Chủ nhiệm dự án", "project_manager_of"),
-                        ("Chủ trì dự án", "project_leader_of"),
                     ]:
                         new_val = row[col]
                         old_val = original[col]
@@ -236,9 +255,12 @@ def admin_app(user):
                             update_data[db_field] = new_val
 
                     # ✅ Chỉ update nếu có thay đổi
-                    if update_data:
+                    if update_data or member_changes:
                         try:
-                            supabase.table("users").update(update_data).eq("username", username).execute()
+                            if update_data:
+                                supabase.table("users").update(update_data).eq("username", username).execute()
+                            for role, names in member_changes.items():
+                                project_members.set_user_projects(username, role, names)
                             changed_count += 1
                         except Exception as e:
                             st.error(f"⚠️ Lỗi khi cập nhật {username}: {e}")
@@ -278,6 +300,8 @@ def admin_app(user):
                     if st.button("✅ Yes, xoá ngay"):
                         for _, row in to_delete.iterrows():
                             supabase.table("users").delete().eq("username", row["Tên đăng nhập"]).execute()
+                            sessions.revoke_user(row["Tên đăng nhập"])
+                            project_members.remove_user(row["Tên đăng nhập"])
                         st.success("🗑️ Đã xoá user được chọn")
                         refresh_all_cache()
                         st.session_state.df_users = load_users_cached()
@@ -309,6 +333,8 @@ def admin_app(user):
                     supabase.table("users").update({
                         "password": hashed
                     }).eq("username", selected_user).execute()
+                    # 🔒 Thu hồi mọi phiên đang đăng nhập bằng mật khẩu cũ
+                    sessions.revoke_user(selected_user)
 
                     st.success(f"✅ Đã đổi mật khẩu cho user **{selected_user}** ✔️")
                     time.sleep(1)
@@ -325,9 +351,7 @@ def admin_app(user):
         # =======================
         st.markdown("#### ➕ Thêm công việc mới")
 
-        jobs_all = df_jobs.copy()
-
-        parent_jobs = jobs_all[jobs_all["parent_id"].isnull()].sort_values("name")
+        catalog = job_catalog.get_catalog()
 
         col1, col2, col3, col4 = st.columns([2, 1, 2, 1])
         with col1:
@@ -335,7 +359,7 @@ def admin_app(user):
         with col2:
             new_unit = st.text_input("Đơn vị", placeholder="Ví dụ: m, Km, cái, Công…")
         with col3:
-            parent_options = ["— Không chọn (tạo Đầu mục công việc) —"] + parent_jobs["name"].tolist()
+            parent_options = ["— Không chọn (tạo Đầu mục công việc) —"] + catalog.root_names()
             parent_choice = st.selectbox("Thuộc công việc lớn", parent_options)
         with col4:
             new_project_type = st.selectbox("Nhóm dự án", ["public", "group"], index=1)
@@ -344,7 +368,7 @@ def admin_app(user):
             try:
                 parent_id = None
                 if parent_choice != "— Không chọn (tạo Đầu mục công việc) —":
-                    parent_id = int(parent_jobs[parent_jobs["name"] == parent_choice]["id"].iloc[0])
+                    parent_id = catalog.id_of(parent_choice)
                 
                 supabase.table("job_catalog").insert({
                     "name": new_job.strip(),
@@ -370,15 +394,15 @@ def admin_app(user):
         # 2) HIỂN THỊ & CHỈNH SỬA CHA – CON – ĐƠN VỊ – NHÓM DỰ ÁN (AG-GRID)
         # ======================================
 
-        jobs = df_jobs.copy()
+        catalog = job_catalog.get_catalog()
 
-        if jobs.empty:
+        if catalog.frame.empty:
             st.info("⚠️ Chưa có công việc nào trong mục lục")
         else:
 
             # ===== CHUẨN BỊ BẢNG CHA – CON =====
             rows = []
-            for _, p in jobs[jobs["parent_id"].isnull()].iterrows():
+            for p in catalog.roots:
 
                 rows.append({
                     "Cha": p["name"],
@@ -391,8 +415,7 @@ def admin_app(user):
                     "_orig_name": p["name"]
                 })
 
-                children = jobs[jobs["parent_id"] == p["id"]]
-                for _, c in children.iterrows():
+                for c in catalog.children_of(p["id"]):
                     rows.append({
                         "Cha": "",
                         "Con": c["name"],
@@ -447,14 +470,15 @@ def admin_app(user):
 
             st.markdown("### ✏️ Danh sách công việc – AG Grid (Editable)")
 
-            grid = AgGrid(
-                df_display,
-                gridOptions=grid_options,
-                update_mode=GridUpdateMode.NO_UPDATE,   # ❗ KHÔNG RERUN KHI EDIT
-                allow_unsafe_jscode=True,
-                fit_columns_on_grid_load=True,
-                height=500
-            )
+            with perf.span("grid:admin.job_catalog", rows=len(df_display)):
+                grid = AgGrid(
+                    df_display,
+                    gridOptions=grid_options,
+                    update_mode=GridUpdateMode.NO_UPDATE,   # ❗ KHÔNG RERUN KHI EDIT
+                    allow_unsafe_jscode=True,
+                    fit_columns_on_grid_load=True,
+                    height=500
+                )
 
             edited = pd.DataFrame(grid["data"])
             selected = edited[edited["Xóa?"] == True]
@@ -491,8 +515,8 @@ def admin_app(user):
                                 "project_type": new_project_type
                             }).eq("id", job_id).execute()
 
-                            if new_name != old_name:
-                                # cập nhật tasks liên quan
+                            # Đổi tên → tasks.task được DB đồng bộ theo job_id (migrations/tasks_fk_ids.sql)
+                            if new_name != old_name and not task_store.has_id_columns():
                                 supabase.table("tasks").update({"task": new_name}).eq("task", old_name).execute()
 
                         except Exception as e:
@@ -500,6 +524,8 @@ def admin_app(user):
 
                     st.success("✔ Đã cập nhật mục lục công việc")
                     refresh_all_cache()
+                    task_store.invalidate_project()
+                    clear_cong_exports()
 
             # ====================
             # NÚT XOÁ
@@ -530,12 +556,17 @@ def admin_app(user):
                             job_id = int(row["_id"])
                             job_name = row["_orig_name"]
 
-                            supabase.table("tasks").delete().eq("task", job_name).execute()
+                            if task_store.has_id_columns():
+                                supabase.table("tasks").delete().eq("job_id", job_id).execute()
+                            else:
+                                supabase.table("tasks").delete().eq("task", job_name).execute()
                             supabase.table("job_catalog").delete().eq("id", job_id).execute()
 
                         st.success("🗑️ Đã xoá các công việc được chọn")
                         del st.session_state["confirm_delete_jobs"]
                         refresh_all_cache()
+                        task_store.invalidate_project()
+                        clear_cong_exports()
 
                 with c2:
                     if st.button("❌ No, huỷ"):
@@ -623,6 +654,7 @@ def admin_app(user):
             # ===== Cập nhật =====
             with col1:
                 if st.button("💾 Cập nhật dự án", key="update_project_btn"):
+                    renamed = []
                     for idx, row in edited_proj.iterrows():
                         row_id   = int(df_proj.loc[idx, "id"])
                         old_name = df_proj.loc[idx, "name"]
@@ -635,36 +667,24 @@ def admin_app(user):
                             dl_str = pd.to_datetime(dl, errors="coerce")
                             dl_str = dl_str.strftime("%Y-%m-%d") if pd.notna(dl_str) else None
 
-                        # Update project
+                        # Update project (tên dự án đổi riêng ở dưới)
                         supabase.table("projects").update({
-                            "name": row["name"],
                             "deadline": dl_str,
                             "project_type": row["project_type"],
                             "design_step": row["design_step"]
                         }).eq("id", row_id).execute()
 
-
-                        # Nếu đổi tên dự án → cập nhật tasks + users
+                        # Nếu đổi tên dự án → đổi cùng lúc ở projects + tasks + users (1 transaction)
                         if row["name"] != old_name:
-                            supabase.table("tasks").update({"project": row["name"]}).eq("project", old_name).execute()
-                            for colu in ("project_manager_of", "project_leader_of"):
-                                
-                                data_users = supabase.table("users").select(f"username, {colu}").not_.is_(colu, None).execute()
-                                for user in data_users.data:
-                                    username = user["username"]
-                                    csv_vals = user.get(colu) or ""
-                                    parts = [p.strip() for p in re.split(r"[|,]", csv_vals) if p.strip()]
-                                    changed = False
-                                    for i, p in enumerate(parts):
-                                        if p == old_name:
-                                            parts[i] = row["name"]
-                                            changed = True
-                                    if changed:
-                                        new_csv = ",".join(parts) if parts else None
-                                        supabase.table("users").update({colu: new_csv}).eq("username", username).execute()
-
-
-                    
+                            try:
+                                counts = project_service.rename_project(old_name, row["name"])
+                                renamed.append(f"{old_name} → {row['name']} "
+                                               f"({counts['tasks']} task, {counts['members']} thành viên)")
+                            except ValueError as e:
+                                st.error(f"⚠️ Không đổi tên được {old_name}: {e}")
+
+                    if renamed:
+                        st.info("✏️ Đã đổi tên: " + "; ".join(renamed))
                     st.success("✅ Đã cập nhật thông tin dự án")
                     refresh_all_cache()
 
@@ -690,22 +710,10 @@ def admin_app(user):
                 c1, c2 = st.columns(2)
                 with c1:
                     if st.button("✅ Yes, xoá ngay", key="confirm_delete_yes"):
-                        for proj_name in proj_list:
-                            supabase.table("tasks").delete().eq("project", proj_name).execute()
-                            supabase.table("projects").delete().eq("name", proj_name).execute()
-
-                            # Cập nhật lại trường project_manager_of / project_leader_of trong users
-                            for colu in ("project_manager_of", "project_leader_of"):
-                                data_users = supabase.table("users").select(f"username, {colu}").not_.is_(colu, None).execute()
-                                for user in data_users.data:
-                                    username = user["username"]
-                                    csv_vals = user.get(colu) or ""
-                                    parts = [p.strip() for p in re.split(r"[|,]", csv_vals) if p.strip()]
-                                    parts = [p for p in parts if p != proj_name]
-                                    new_csv = ",".join(parts) if parts else None
-                                    supabase.table("users").update({colu: new_csv}).eq("username", username).execute()
-
-                        st.success("🗑️ Đã xoá các dự án được chọn.")
+                        counts = project_service.delete_projects(proj_list)
+                        st.success(f"🗑️ Đã xoá {counts['projects']} dự án "
+                                   f"({counts['tasks']} task, {counts['payments']} thanh toán, "
+                                   f"{counts['members']} thành viên).")
                         refresh_all_cache()
                         st.session_state["df_projects"] = load_projects_fresh()
                         st.session_state["confirm_delete"] = None
@@ -795,11 +803,13 @@ def admin_app(user):
         
         if "fixed_job_catalog" not in st.session_state:
             supabase.table("job_catalog").update({"project_type": "group"}).is_("project_type", None).execute()
+            repository.invalidate("job_catalog")
             st.session_state["fixed_job_catalog"] = True
         
 
         # --- Lọc job_catalog theo project_type ---
-        jobs = df_jobs[df_jobs["project_type"] == proj_type][["id", "name", "unit", "parent_id"]].copy()
+        catalog = job_catalog.get_catalog()
+        jobs = catalog.jobs_of_type(proj_type)
 
 
         users_display = df_users["display_name"].tolist()
@@ -808,8 +818,7 @@ def admin_app(user):
 
 
         # ======== Đầu mục công việc ========
-        parent_jobs = jobs[jobs["parent_id"].isnull()].sort_values("name")
-        parent_options = parent_jobs["name"].tolist()
+        parent_options = catalog.root_names(proj_type)
 
 
 
@@ -850,40 +859,44 @@ def admin_app(user):
             pub_note = st.text_area("📝 Ghi chú chung", key="pub_note")
 
             if st.button("✅ Giao việc", key="pub_assign_btn"):
-                for i in range(len(st.session_state.task_rows)):
-                    task = st.session_state.get(f"pub_task_{i}")
-                    if not task:
-                        continue
-
-                    s_date = st.session_state.get(f"pub_start_date_{i}")
-                    e_date = st.session_state.get(f"pub_end_date_{i}")
-                    s_time = st.session_state.get(f"pub_start_time_{i}")
-                    e_time = st.session_state.get(f"pub_end_time_{i}")
-                    total_hours = calc_hours(s_date, e_date, s_time, e_time)
-
-                    # CHUẨN HÓA start_date VÀO ĐÚNG ĐỊNH DẠNG YYYY-MM-DD
-                    start_date_str = s_date.strftime("%Y-%m-%d") if s_date else None
+                entries = pd.DataFrame([
+                    {
+                        "task": st.session_state.get(f"pub_task_{i}"),
+                        "start_date": st.session_state.get(f"pub_start_date_{i}"),
+                        "end_date": st.session_state.get(f"pub_end_date_{i}"),
+                        "start_time": st.session_state.get(f"pub_start_time_{i}"),
+                        "end_time": st.session_state.get(f"pub_end_time_{i}"),
+                    }
+                    for i in range(len(st.session_state.task_rows))
+                    if st.session_state.get(f"pub_task_{i}")
+                ], columns=["task", "start_date", "end_date", "start_time", "end_time"])
 
-                    # GHI CHÚ
-                    note_txt = f"⏰ {s_time.strftime('%H:%M')} - {e_time.strftime('%H:%M')} ({s_date} → {e_date})"
-                    if pub_note:
-                        note_txt += f" {pub_note}"
+                # Tính giờ công cho tất cả các dòng 1 lần
+                entries["hours"] = calc_hours_vectorized(entries)
 
-                    # INSERT TASK
-                    supabase.table("tasks").insert({
+                # INSERT TASK: tất cả các dòng trong 1 request
+                # (giờ / ngày kết thúc ghi vào cột riêng, note chỉ còn ghi chú)
+                rows = [
+                    {
                         "project": project,
-                        "task": task,
+                        "task": e.task,
                         "assignee": assignee,
-                        "start_date": start_date_str,   # ⭐ GHI CHÍNH XÁC NGÀY BẮT ĐẦU
-                        "khoi_luong": total_hours,
-                        "note": note_txt,
+                        "start_date": timesheet.fmt_date(e.start_date) or None,   # ⭐ GHI CHÍNH XÁC NGÀY BẮT ĐẦU
+                        "khoi_luong": e.hours,
+                        **timesheet.task_fields(e.start_time, e.end_time, e.start_date, e.end_date, pub_note),
                         "progress": 0,
                         "approved": False
-                    }).execute()
+                    }
+                    for e in entries.itertuples(index=False)
+                ]
+                if rows:
+                    supabase.table("tasks").insert(rows).execute()
 
                 st.success("✅ Đã giao công nhật")
                 st.session_state.task_rows = [0]
-                st.cache_data.clear()      # 👈 THÊM DÒNG NÀY
+                task_store.invalidate_project(project)      # 👈 chỉ tải lại dự án vừa giao việc
+                clear_cong_exports()
+                project_service.invalidate_visible()
                 st.rerun()
 
 
@@ -901,7 +914,7 @@ def admin_app(user):
             if parent_options:
                 parent_choice0 = parent_options[0]
                 if parent_choice0 in jobs["name"].values:
-                    first_unit = jobs.loc[jobs["name"] == parent_choice0, "unit"].iloc[0] or ""
+                    first_unit = catalog.unit_of(parent_choice0)
 
             if first_unit.strip().lower() == "công":
                 col[2].markdown("**Giờ bắt đầu**")
@@ -920,18 +933,16 @@ def admin_app(user):
                     parent_choice = st.selectbox("", parent_options, key=f"parent_{i}",
                                                  label_visibility="collapsed")
 
-                pid = parent_jobs.loc[parent_jobs["name"] == parent_choice, "id"]
-                pid = int(pid.iloc[0]) if not pid.empty else None
-                child_jobs = jobs[jobs["parent_id"] == pid].sort_values("name") if pid else pd.DataFrame()
+                child_names = catalog.child_names(parent_choice, proj_type)
 
                 with c2:
                     child_choice = st.selectbox(
-                        "", child_jobs["name"].tolist() if not child_jobs.empty else [],
+                        "", child_names,
                         key=f"child_{i}", label_visibility="collapsed"
                     )
 
                 task_name = child_choice if child_choice else parent_choice
-                unit = jobs.loc[jobs["name"] == task_name, "unit"].iloc[0] if task_name in jobs["name"].values else ""
+                unit = catalog.unit_of(task_name) if task_name in jobs["name"].values else ""
 
                 if unit.strip().lower() == "công":
                     with c3:
@@ -963,18 +974,16 @@ def admin_app(user):
                     if not task:
                         continue
 
-                    unit = jobs.loc[jobs["name"] == task, "unit"].iloc[0] if task in jobs["name"].values else ""
+                    unit = catalog.unit_of(task) if task in jobs["name"].values else ""
                     if unit.strip().lower() == "công":
                         start_time = st.session_state.get(f"start_{i}")
                         end_time = st.session_state.get(f"end_{i}")
-                        time_txt = f"⏰ {start_time} - {end_time}" if start_time and end_time else ""
-                        merged_note = (group_note + ("\n" if group_note and time_txt else "") + time_txt).strip()
-                        
+
                         supabase.table("tasks").insert({
                             "project": project,
                             "task": task,
                             "assignee": assignee,
-                            "note": merged_note,  # hoặc group_note
+                            **timesheet.task_fields(start_time, end_time, text=group_note),
                             "progress": 0
                         }).execute()
                     else:
@@ -995,38 +1004,22 @@ def admin_app(user):
                 
                 st.success("✅ Đã giao việc")
                 st.session_state.task_rows = [0]
+                task_store.invalidate_project(project)
+                clear_cong_exports()
+                project_service.invalidate_visible()
                 st.rerun()
 
         # ---------------- Danh sách công việc ----------------
         # ---------------- Danh sách công việc ----------------
         st.subheader("📋 Danh sách công việc trong dự án")
-        @st.cache_data(ttl=50)
-        def load_tasks_by_project(project_name):
-            supabase = get_supabase_client()
-            data = supabase.table("tasks").select("*").eq("project", project_name).execute()
-            return pd.DataFrame(data.data)
 
-        df_tasks = load_tasks_by_project(project)
+        # Năm / quý / người thực hiện lấy từ số liệu gom nhóm trên server (task_store.quarter_counts),
+        # grid và file xuất đọc đúng quý đang chọn → không tải toàn bộ tasks của dự án
+        cong_counts = task_store.quarter_counts(project)
 
-        if df_tasks.empty:
-            st.info("Chưa có công việc nào trong dự án này.")
+        if cong_counts.empty:
+            st.info("⛔ Không có công nhật nào trong dự án này.")
         else:
-            # Hàm lấy unit của job
-            @st.cache_data(ttl=30)
-            def load_job_units():
-                supabase = get_supabase_client()
-                data2 = supabase.table("job_catalog").select("name, unit").execute()
-                return pd.DataFrame(data2.data)
-
-            # ✅ Lưu lại start_date gốc để dùng lọc công nhật
-            df_tasks["start_date_raw"] = df_tasks["start_date"]
-
-            jobs_units = load_job_units()
-
-            # Merge 1 lần duy nhất
-            df_tasks = df_tasks.merge(jobs_units, left_on="task", right_on="name", how="left")
-            df_tasks["assignee_display"] = df_tasks["assignee"].map(user_map).fillna(df_tasks["assignee"])
-
             # ============================
             #  PHẦN CÔNG NHẬT – LỌC THEO THỜI GIAN
             # ============================
@@ -1035,438 +1028,417 @@ def admin_app(user):
             # ============================
             st.markdown("### ⏱️ Công nhật – Lọc theo thời gian")
 
-            # Dùng lại toàn bộ tasks của project hiện tại
-            df_cong_all = df_tasks.copy()
+            # ===== 1. Chọn năm / quý =====
+            years_available = sorted(int(y) for y in cong_counts["year"].unique())
+            last_date = max(cong_counts["last_date"])
+
+            colY, colQ = st.columns([1, 1])
+
+            # năm mặc định = năm của ngày cuối cùng
+            year_index = years_available.index(last_date.year)
+            year_filter = colY.selectbox(
+                "Năm",
+                years_available,
+                index=year_index,
+                key=f"cong_year_{project}",          # 👈 key riêng theo project
+            )
+
+            # khoảng thời gian theo quý
+            quarters = {
+                "Q1": (dt.date(year_filter, 1, 1),  dt.date(year_filter, 3, 31)),
+                "Q2": (dt.date(year_filter, 4, 1),  dt.date(year_filter, 6, 30)),
+                "Q3": (dt.date(year_filter, 7, 1),  dt.date(year_filter, 9, 30)),
+                "Q4": (dt.date(year_filter, 10, 1), dt.date(year_filter, 12, 31)),
+            }
 
-            # Ưu tiên dùng start_date_raw nếu có
-            df_cong_all["start_date_final"] = df_cong_all["start_date_raw"].where(
-                df_cong_all["start_date_raw"].notna(),
-                df_cong_all["start_date"]
+            # quý mặc định = quý của ngày cuối cùng
+            month = last_date.month
+            if   1 <= month <= 3:  default_q = "Q1"
+            elif 4 <= month <= 6:  default_q = "Q2"
+            elif 7 <= month <= 9:  default_q = "Q3"
+            else:                  default_q = "Q4"
+
+            # số công nhật của từng quý trong năm đang chọn
+            year_counts = cong_counts[cong_counts["year"] == year_filter]
+            quarter_totals = year_counts.groupby("quarter")["n"].sum()
+
+            q_name = colQ.selectbox(
+                "Quý",
+                ["Q1", "Q2", "Q3", "Q4"],
+                index=["Q1", "Q2", "Q3", "Q4"].index(default_q),
+                format_func=lambda q: f"{q} ({int(quarter_totals.get(int(q[1]), 0))} dòng)",
+                key=f"cong_quarter_{project}",        # 👈 key riêng theo project
             )
 
-            # Chuẩn hóa ngày
-            df_cong_all["Ngày_dt"] = pd.to_datetime(
-                df_cong_all["start_date_final"], errors="coerce"
-            ).dt.date
-            df_cong_all = df_cong_all[df_cong_all["Ngày_dt"].notna()].copy()
+            d_from, d_to = quarters[q_name]
+
+            # Người thực hiện có công nhật trong quý
+            q_counts = year_counts[year_counts["quarter"] == int(q_name[1])]
 
-            if df_cong_all.empty:
-                st.info("⛔ Không có công nhật nào trong dự án này.")
+            if q_counts.empty:
+                st.warning("⛔ Không có công nhật nào trong quý này.")
             else:
-                # ===== 1. Chọn năm / quý =====
-                years_available = sorted({d.year for d in df_cong_all["Ngày_dt"]})
-                last_date = max(df_cong_all["Ngày_dt"])
-
-                colY, colQ = st.columns([1, 1])
-
-                # năm mặc định = năm của ngày cuối cùng
-                year_index = years_available.index(last_date.year)
-                year_filter = colY.selectbox(
-                    "Năm",
-                    years_available,
-                    index=year_index,
-                    key=f"cong_year_{project}",          # 👈 key riêng theo project
+                # ===== 2. Chuẩn bị dữ liệu cho grid =====
+                task_options = sorted(
+                    jobs["name"].dropna().unique().tolist()
                 )
 
-                # khoảng thời gian theo quý
-                quarters = {
-                    "Q1": (dt.date(year_filter, 1, 1),  dt.date(year_filter, 3, 31)),
-                    "Q2": (dt.date(year_filter, 4, 1),  dt.date(year_filter, 6, 30)),
-                    "Q3": (dt.date(year_filter, 7, 1),  dt.date(year_filter, 9, 30)),
-                    "Q4": (dt.date(year_filter, 10, 1), dt.date(year_filter, 12, 31)),
-                }
-
-                # quý mặc định = quý của ngày cuối cùng
-                month = last_date.month
-                if   1 <= month <= 3:  default_q = "Q1"
-                elif 4 <= month <= 6:  default_q = "Q2"
-                elif 7 <= month <= 9:  default_q = "Q3"
-                else:                  default_q = "Q4"
-
-                q_name = colQ.selectbox(
-                    "Quý",
-                    ["Q1", "Q2", "Q3", "Q4"],
-                    index=["Q1", "Q2", "Q3", "Q4"].index(default_q),
-                    key=f"cong_quarter_{project}",        # 👈 key riêng theo project
+                user_list    = sorted(
+                    q_counts["assignee"].map(user_map).fillna(q_counts["assignee"]).unique()
                 )
 
-                d_from, d_to = quarters[q_name]
+                def build_time_options(start="07:00", end="21:00", step=15):
+                    times = []
+                    t = pd.to_datetime(start)
+                    t_end = pd.to_datetime(end)
+                    while t <= t_end:
+                        times.append(t.strftime("%H:%M"))
+                        t += pd.Timedelta(minutes=step)
+                    return times
+
+                time_options = build_time_options("07:00", "21:00", 15)
+
+                # ===== 3. Chỉ dựng grid của user đang chọn (không dựng sẵn grid cho mọi user) =====
+                col_user, col_status = st.columns([4, 1])
+                user_display = col_user.radio(
+                    "👤 Người thực hiện", user_list, horizontal=True, key=f"cong_user_{project}"
+                )
+                status = col_status.selectbox(
+                    "Trạng thái", ["Tất cả", "Chưa duyệt", "Đã duyệt"], key=f"cong_status_{project}"
+                )
 
-                # Lọc theo năm / quý
-                df_cong_all = df_cong_all[
-                    (df_cong_all["Ngày_dt"] >= d_from) &
-                    (df_cong_all["Ngày_dt"] <= d_to)
-                ].copy()
+                # username thật (PHẢI LẤY TRƯỚC)
+                username_real = df_users.loc[
+                    df_users["display_name"] == user_display, "username"
+                ].iloc[0]
+
+                # 1 trang công nhật của user trong quý, lọc ngày / trạng thái ngay trên server
+                page_key = f"cong_page_{project}_{username_real}_{year_filter}_{q_name}_{status}"
+                page = int(st.session_state.get(page_key, 1))
+                approved_filter = {"Tất cả": None, "Chưa duyệt": False, "Đã duyệt": True}[status]
+                df_user, n_total = task_store.fetch_page(
+                    project, assignee=username_real, date_from=d_from, date_to=d_to,
+                    approved=approved_filter, page=page - 1
+                )
+                n_pages = max(1, math.ceil(n_total / task_store.PAGE_SIZE))
+                if page > n_pages:
+                    st.session_state.pop(page_key, None)
+                    page = 1
+                    df_user, n_total = task_store.fetch_page(
+                        project, assignee=username_real, date_from=d_from, date_to=d_to,
+                        approved=approved_filter, page=0
+                    )
 
-                if df_cong_all.empty:
-                    st.warning("⛔ Không có công nhật nào trong quý này.")
+                if df_user.empty:
+                    st.info("User này không có công nhật trong quý này.")
                 else:
-                    # ===== 2. Chuẩn bị dữ liệu cho grid =====
-                    task_options = sorted(
-                        jobs["name"].dropna().unique().tolist()
+                    df_user["Ngày_dt"] = pd.to_datetime(df_user["start_date"], errors="coerce").dt.date
+                    user_times = timesheet.time_fields(df_user)
+                    end_dates = dict(zip(df_user["id"].astype(int), user_times["end_date"]))
+
+                    df_display = pd.DataFrame({
+                        "ID": df_user["id"],
+                        "Ngày": df_user["Ngày_dt"].astype(str),
+                        "Công việc": df_user["task"],
+                        "Giờ bắt đầu": user_times["start_time"],
+                        "Giờ kết thúc": user_times["end_time"],
+                        "Khối lượng (giờ)": pd.to_numeric(df_user["khoi_luong"], errors="coerce").fillna(0).astype(float),
+                        "Ghi chú": user_times["text"],
+                        "approved": df_user["approved"].fillna(False).astype(bool),
+                        # "Chọn?": False,
+                    }).reset_index(drop=True)
+                    # df_display["Chọn?"] = df_display["Chọn?"].astype(bool)
+
+                    # lưu dataframe gốc để so sánh khi Lưu
+                    st.session_state.setdefault("df_cong_origin", {})[(project, username_real)] = df_display.copy()
+
+
+                    grid_key = f"grid_cong_{project}_{username_real}"
+                    gb = GridOptionsBuilder.from_dataframe(df_display)
+
+                    # 🔹 CẤU HÌNH CHUNG
+                    gb.configure_default_column(
+                        editable=True,
+                        resizable=True,
+                        sortable=True,
+                        filter=False
                     )
 
-                    user_list    = sorted(df_cong_all["assignee_display"].unique())
-
-                    def split_times(note_text: str):
-                        if not isinstance(note_text, str):
-                            return "", "", "", ""
-                        time_re = r"⏰\s*(\d{1,2}:\d{2})\s*[-–]\s*(\d{1,2}:\d{2})"
-                        m1 = re.search(time_re, note_text)
-                        stime = m1.group(1) if m1 else ""
-                        etime = m1.group(2) if m1 else ""
-
-                        date_re = r"\((\d{4}-\d{2}-\d{2})\s*[→\-]\s*(\d{4}-\d{2}-\d{2})\)"
-                        m2 = re.search(date_re, note_text)
-                        date_part = m2.group(0) if m2 else ""
-
-                        note_rest = re.sub(time_re, "", note_text)
-                        note_rest = re.sub(date_re, "", note_rest).strip()
-
-                        return stime, etime, date_part, note_rest
-                    def build_time_options(start="07:00", end="21:00", step=15):
-                        times = []
-                        t = pd.to_datetime(start)
-                        t_end = pd.to_datetime(end)
-                        while t <= t_end:
-                            times.append(t.strftime("%H:%M"))
-                            t += pd.Timedelta(minutes=step)
-                        return times
-
-                    time_options = build_time_options("07:00", "21:00", 15)
-
-                    # nhớ tab đang mở (optional)
-                    if "current_tab" not in st.session_state:
-                        st.session_state.current_tab = 0
-
-                    tabs = st.tabs(user_list)
-
-                    # ===== 3. Mỗi tab là 1 user =====
-                    for i, user_display in enumerate(user_list):
-                        with tabs[i]:
-                            st.session_state.current_tab = i
-
-                            df_user = df_cong_all[df_cong_all["assignee_display"] == user_display].copy()
-                            if df_user.empty:
-                                st.info("User này không có công nhật trong quý này.")
-                                continue
-
-                            df_user["Ngày"] = df_user["Ngày_dt"].astype(str)
-
-                            rows = []
-                            for _, r in df_user.iterrows():
-                                stime, etime, date_part, note_rest = split_times(r.get("note"))
-                                formatted_note = note_rest
-                                if stime and etime:
-                                    formatted_note = f"⏰ {stime} - {etime} {date_part} {note_rest}".strip()
-
-                                rows.append({
-                                    "ID": r["id"],
-                                    "Ngày": r["Ngày"],
-                                    "Công việc": r["task"],
-                                    "Giờ bắt đầu": stime,
-                                    "Giờ kết thúc": etime,
-                                    "Khối lượng (giờ)": float(r.get("khoi_luong") or 0),
-                                    "Ghi chú": formatted_note,
-                                    "approved": bool(r.get("approved")),
-                                    # "Chọn?": False,
-                                })
-
-                            df_display = pd.DataFrame(rows)
-                            # df_display["Chọn?"] = df_display["Chọn?"].astype(bool)
-
-                            # username thật (PHẢI LẤY TRƯỚC)
-                            username_real = df_users.loc[
-                                df_users["display_name"] == user_display, "username"
-                            ].iloc[0]
-
-                            # lưu dataframe gốc để so sánh khi Lưu
-                            st.session_state.setdefault("df_cong_origin", {})[(project, username_real)] = df_display.copy()
-
-
-                            grid_key = f"grid_cong_{project}_{username_real}"
-                            gb = GridOptionsBuilder.from_dataframe(df_display)
-
-                            # 🔹 CẤU HÌNH CHUNG
-                            gb.configure_default_column(
-                                editable=True,
-                                resizable=True,
-                                sortable=True,
-                                filter=False
-                            )
+                    # 🔹 CHỈNH ĐỘ RỘNG TỪNG CỘT
+                    gb.configure_column(
+                        "Ngày", 
+                        width=100,                                
+                        checkboxSelection=True,
+                        headerCheckboxSelection=True
+                    )
+                    gb.configure_column("Công việc", flex=4)
+                    gb.configure_column("Giờ bắt đầu", width=110)
+                    gb.configure_column("Giờ kết thúc", width=110)
+                    gb.configure_column("Khối lượng (giờ)", width=120)
+                    gb.configure_column("Ghi chú", flex=5)
+                    # gb.configure_column(
+                        # "Chọn?",
+                        # editable=True,
+                        # cellEditor="agCheckboxCellEditor",
+                        # cellRenderer="agCheckboxCellRenderer",
+                        # width=90,
+                    # )
+
+
+
+                    gb.configure_column(
+                        "Giờ bắt đầu",
+                        editable=True,
+                        cellEditor="agSelectCellEditor",
+                        cellEditorParams={"values": time_options},
+                    )
 
-                            # 🔹 CHỈNH ĐỘ RỘNG TỪNG CỘT
-                            gb.configure_column(
-                                "Ngày", 
-                                width=100,                                
-                                checkboxSelection=True,
-                                headerCheckboxSelection=True
-                            )
-                            gb.configure_column("Công việc", flex=4)
-                            gb.configure_column("Giờ bắt đầu", width=110)
-                            gb.configure_column("Giờ kết thúc", width=110)
-                            gb.configure_column("Khối lượng (giờ)", width=120)
-                            gb.configure_column("Ghi chú", flex=5)
-                            # gb.configure_column(
-                                # "Chọn?",
-                                # editable=True,
-                                # cellEditor="agCheckboxCellEditor",
-                                # cellRenderer="agCheckboxCellRenderer",
-                                # width=90,
-                            # )
-
-
-
-                            gb.configure_column(
-                                "Giờ bắt đầu",
-                                editable=True,
-                                cellEditor="agSelectCellEditor",
-                                cellEditorParams={"values": time_options},
-                            )
+                    gb.configure_column(
+                        "Giờ kết thúc",
+                        editable=True,
+                        cellEditor="agSelectCellEditor",
+                        cellEditorParams={"values": time_options},
+                    )
 
-                            gb.configure_column(
-                                "Giờ kết thúc",
-                                editable=True,
-                                cellEditor="agSelectCellEditor",
-                                cellEditorParams={"values": time_options},
-                            )
+                    gb.configure_column("ID", hide=True)
+                    gb.configure_column("approved", hide=True)
 
-                            gb.configure_column("ID", hide=True)
-                            gb.configure_column("approved", hide=True)
+                    gb.configure_column(
+                        "Công việc",
+                        editable=True,
+                        cellEditor="agSelectCellEditor",
+                        cellEditorParams={"values": task_options},
+                    )
 
-                            gb.configure_column(
-                                "Công việc",
-                                editable=True,
-                                cellEditor="agSelectCellEditor",
-                                cellEditorParams={"values": task_options},
-                            )
+                    row_style = JsCode(
+                        """
+                        function(params){
+                          if (params.data.approved === true) {
+                            return {'backgroundColor':'#FFF4C2'};
+                          }
+                          return {};
+                        }
+                        """
+                    )
 
-                            row_style = JsCode(
-                                """
-                                function(params){
-                                  if (params.data.approved === true) {
-                                    return {'backgroundColor':'#FFF4C2'};
-                                  }
-                                  return {};
-                                }
-                                """
-                            )
+                    grid_options = gb.build()
 
-                            grid_options = gb.build()
+                    grid_options["rowSelection"] = "multiple"
+                    grid_options["suppressRowClickSelection"] = False
+                        
+                    grid_options["getRowStyle"] = row_style
+
+
+                    with perf.span("grid:admin.cong_nhat", rows=len(df_display)):
+                        grid = AgGrid(
+                            df_display,
+                            gridOptions=grid_options,
+                            key=grid_key,
+                            theme="streamlit",
+                            update_mode=GridUpdateMode.MODEL_CHANGED,
+
+                            data_return_mode=DataReturnMode.AS_INPUT,   # ⭐ BẮT BUỘC
+                            reload_data=False,                          # ⭐ BẮT BUỘC
+                            allow_unsafe_jscode=True,
+                            fit_columns_on_grid_load=False,
+                            height=420,
+                            width="100%",
+                        )
 
-                            grid_options["rowSelection"] = "multiple"
-                            grid_options["suppressRowClickSelection"] = False
-                            
-                            grid_options["getRowStyle"] = row_style
+                        
 
+                    if n_pages > 1:
+                        st.number_input(
+                            f"Trang (tổng {n_pages} trang, {n_total} dòng)",
+                            min_value=1, max_value=n_pages, value=page, step=1, key=page_key
+                        )
 
-                            grid = AgGrid(
-                                df_display,
-                                gridOptions=grid_options,
-                                key=grid_key,
-                                theme="streamlit",
-                                update_mode=GridUpdateMode.MODEL_CHANGED,
+                    # LẤY DATA SAU GRID
+                    edited_df   = pd.DataFrame(grid["data"])
+                    selected_rows = grid["selected_rows"]
+                    ids = [int(r["ID"]) for r in selected_rows]
 
-                                data_return_mode=DataReturnMode.AS_INPUT,   # ⭐ BẮT BUỘC
-                                reload_data=False,                          # ⭐ BẮT BUỘC
-                                allow_unsafe_jscode=True,
-                                fit_columns_on_grid_load=False,
-                                height=420,
-                                width="100%",
-                            )
+                    # edited_df = pd.DataFrame(grid["data"])
 
-                            
-
-                            # LẤY DATA SAU GRID
-                            edited_df   = pd.DataFrame(grid["data"])
-                            selected_rows = grid["selected_rows"]
-                            ids = [int(r["ID"]) for r in selected_rows]
-
-                            # edited_df = pd.DataFrame(grid["data"])
-
-                            # ids = (
-                                # edited_df
-                                # .loc[edited_df["Chọn?"] == True, "ID"]
-                                # .astype(int)
-                                # .tolist()
-                            # )
-
-                            # NÚT BẤM BÌNH THƯỜNG (KHÔNG FORM)
-                            c1, c2, c3 = st.columns(3)
-
-                            del_click     = c1.button("🗑 Xóa", key=f"del_{project}_{username_real}")
-                            approve_click = c2.button("✔ Duyệt / ❌ Bỏ duyệt", key=f"appr_{project}_{username_real}")
-                            save_click    = c3.button("💾 Lưu", key=f"save_{project}_{username_real}")
-
-                            # ===== XÓA =====
-                            if del_click:
-                                if not ids:
-                                    st.warning("⚠️ Không có dòng hợp lệ để xóa")
-                                else:
-                                    supabase.table("tasks").delete().in_("id", ids).execute()
-                                    st.success(f"🗑️ Đã xóa {len(ids)} dòng")
-                                    st.cache_data.clear()
-                                    st.rerun()
-
-
-
-
-                            # ===== DUYỆT / BỎ DUYỆT =====
-                            if approve_click:
-                                if not selected_rows:
-                                    st.warning("⚠️ Chưa chọn dòng nào")
-                                else:
-                                    current_vals = [bool(r["approved"]) for r in selected_rows]
-                                    new_val = not all(current_vals)
-
-                                    for r in selected_rows:
-                                        supabase.table("tasks").update(
-                                            {"approved": new_val}
-                                        ).eq("id", int(r["ID"])).execute()
-
-                                    st.success("✅ Đã cập nhật duyệt / bỏ duyệt")
-                                    st.cache_data.clear()
-                                    st.rerun()
-
-
-                            # ===== LƯU =====
-                            if save_click:
-                                for r in selected_rows:
-                                    # ===== 1. LẤY DỮ LIỆU =====
-                                    start_date = pd.to_datetime(r["Ngày"], errors="coerce").date()
-
-                                    start_time_str = r.get("Giờ bắt đầu", "")
-                                    end_time_str   = r.get("Giờ kết thúc", "")
-                                    old_note       = r.get("Ghi chú", "") or ""
-
-                                    # Parse HH:MM -> time
-                                    try:
-                                        start_time = dt.datetime.strptime(start_time_str, "%H:%M").time()
-                                        end_time   = dt.datetime.strptime(end_time_str, "%H:%M").time()
-                                    except:
-                                        start_time = None
-                                        end_time   = None
-
-                                    # ===== 2. TÍNH LẠI GIỜ (GỌI HÀM CHUẨN TRONG AUTH) =====
-                                    # ===== 2. QUYẾT ĐỊNH KHỐI LƯỢNG =====
-                                    df_origin = st.session_state.get("df_cong_origin", {}).get((project, username_real))
-
-                                    old_hours = 0
-                                    if df_origin is not None:
-                                        old_row = df_origin[df_origin["ID"] == r["ID"]]
-                                        if not old_row.empty:
-                                            old_hours = float(old_row.iloc[0]["Khối lượng (giờ)"] or 0)
-
-                                    new_hours_input = float(r.get("Khối lượng (giờ)", 0) or 0)
-
-                                    if abs(new_hours_input - old_hours) > 0.001:
-                                        # ✅ user đã sửa ô khối lượng
-                                        new_hours = round(new_hours_input, 2)
-                                    else:
-                                        # ❌ user không sửa → tự tính
-                                        new_hours = calc_hours(
-                                            start_date, start_date,
-                                            start_time, end_time
-                                        )
-
-
-                                    # ===== 3. XÓA GIỜ CŨ TRONG NOTE =====
-                                    note_clean = re.sub(
-                                        r"⏰\s*\d{1,2}:\d{2}(:\d{2})?\s*[-–]\s*\d{1,2}:\d{2}(:\d{2})?",
-                                        "",
-                                        old_note
-                                    ).strip()
-
-                                    # ===== 4. GHÉP GIỜ MỚI =====
-                                    if start_time and end_time:
-                                        new_note = f"⏰ {start_time_str} - {end_time_str} {note_clean}".strip()
-                                    else:
-                                        new_note = note_clean
-
-                                    # ===== 5. UPDATE DB =====
-                                    supabase.table("tasks").update({
-                                        "start_date": start_date.strftime("%Y-%m-%d"),
-                                        "task": r["Công việc"],
-                                        "khoi_luong": new_hours,   # ⭐ GIỜ ĐƯỢC TÍNH LẠI
-                                        "note": new_note           # ⭐ NOTE ĐƯỢC CHUẨN HÓA
-                                    }).eq("id", r["ID"]).execute()
-
-                                st.success(f"✅ Đã cập nhật công nhật của **{user_display}**")
-                                st.cache_data.clear()
-                                st.rerun()
-
-                    # ======================================================
-                    # 📤 XUẤT DANH SÁCH CÔNG NHẬT (TOÀN BỘ USER – 1 SHEET)
-                    # ======================================================
-                    st.divider()
-                    st.markdown("### 📤 Xuất công nhật theo quý")
-
-                    def build_export_df(df):
-                        rows = []
-
-                        for _, r in df.iterrows():
-                            stime, etime, date_part, note_rest = split_times(r.get("note"))
-
-                            # ===== NGÀY BẮT ĐẦU / KẾT THÚC =====
-                            start_date = r["Ngày_dt"]
-                            end_date   = r["Ngày_dt"]
-
-                            if isinstance(date_part, str) and "→" in date_part:
-                                try:
-                                    d1, d2 = re.findall(r"\d{4}-\d{2}-\d{2}", date_part)
-                                    start_date = d1
-                                    end_date   = d2
-                                except:
-                                    start_date = r["Ngày_dt"]
-                                    end_date   = r["Ngày_dt"]
-
-                            rows.append({
-                                "User": r["assignee_display"],
-                                "Ngày bắt đầu": str(start_date),
-                                "Ngày kết thúc": str(end_date),
-                                "Công việc": r["task"],
-                                "Giờ bắt đầu": stime,
-                                "Giờ kết thúc": etime,
-                                "Khối lượng (giờ)": float(r.get("khoi_luong") or 0),
-                                "Ghi chú": note_rest,
-                            })
-
-                        df_out = pd.DataFrame(rows)
-
-                        # ===== SẮP XẾP =====
-                        df_out = df_out.sort_values(
-                            by=["User", "Ngày bắt đầu", "Giờ bắt đầu"],
-                            ascending=[True, True, True]
-                        ).reset_index(drop=True)
-
-                        return df_out
-
-
-
-                    export_df = build_export_df(df_cong_all)
-
-                    if export_df.empty:
-                        st.info("Không có dữ liệu để xuất.")
-                    else:
-                        output = io.BytesIO()
-                        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-                            export_df.to_excel(
-                                writer,
-                                sheet_name="Cong_nhat_quy",
-                                index=False
-                            )
+                    # ids = (
+                        # edited_df
+                        # .loc[edited_df["Chọn?"] == True, "ID"]
+                        # .astype(int)
+                        # .tolist()
+                    # )
+
+                    # NÚT BẤM BÌNH THƯỜNG (KHÔNG FORM)
+                    c1, c2, c3 = st.columns(3)
 
-                            ws = writer.sheets["Cong_nhat_quy"]
-                            for i, col in enumerate(export_df.columns):
-                                ws.set_column(i, i, 18)
+                    del_click     = c1.button("🗑 Xóa", key=f"del_{project}_{username_real}")
+                    approve_click = c2.button("✔ Duyệt / ❌ Bỏ duyệt", key=f"appr_{project}_{username_real}")
+                    save_click    = c3.button("💾 Lưu", key=f"save_{project}_{username_real}")
 
+                    # ===== XÓA =====
+                    if del_click:
+                        if not ids:
+                            st.warning("⚠️ Không có dòng hợp lệ để xóa")
+                        else:
+                            supabase.table("tasks").delete().in_("id", ids).execute()
+                            st.success(f"🗑️ Đã xóa {len(ids)} dòng")
+                            task_store.invalidate_project(project)
+                            clear_cong_exports()
+                            st.rerun()
+
+
+
+
+                    # ===== DUYỆT / BỎ DUYỆT =====
+                    if approve_click:
+                        if not selected_rows:
+                            st.warning("⚠️ Chưa chọn dòng nào")
+                        else:
+                            current_vals = [bool(r["approved"]) for r in selected_rows]
+                            new_val = not all(current_vals)
+
+                            # 1 request cho tất cả dòng đã chọn
+                            supabase.table("tasks").update(
+                                {"approved": new_val}
+                            ).in_("id", [int(r["ID"]) for r in selected_rows]).execute()
+
+                            st.success("✅ Đã cập nhật duyệt / bỏ duyệt")
+                            task_store.invalidate_project(project)
+                            clear_cong_exports()
+                            st.rerun()
+
+
+                    # ===== LƯU =====
+                    if save_click:
+                        df_origin = st.session_state.get("df_cong_origin", {}).get((project, username_real))
+                        origin_hours = {}
+                        if df_origin is not None:
+                            origin_hours = dict(zip(
+                                df_origin["ID"].astype(int),
+                                df_origin["Khối lượng (giờ)"].fillna(0).astype(float)
+                            ))
+
+                        # Giờ tự tính cho mọi dòng (bản gốc + bản đã sửa) trong 1 lần,
+                        # tra theo (ngày, giờ bắt đầu, giờ kết thúc)
+                        hour_keys = ["Ngày", "Giờ bắt đầu", "Giờ kết thúc"]
+                        hour_rows = pd.concat(
+                            [f[hour_keys] for f in (df_origin, pd.DataFrame(selected_rows)) if f is not None and not f.empty],
+                            ignore_index=True
+                        ).drop_duplicates() if selected_rows else pd.DataFrame(columns=hour_keys)
+                        auto_hours = dict(zip(
+                            hour_rows.itertuples(index=False, name=None),
+                            calc_hours_vectorized(
+                                hour_rows, start_date="Ngày", end_date="Ngày",
+                                start_time="Giờ bắt đầu", end_time="Giờ kết thúc"
+                            )
+                        ))
+
+                        def _cong_fields(r):
+                            # ===== 1. LẤY DỮ LIỆU =====
+                            start_date = pd.to_datetime(r["Ngày"], errors="coerce").date()
+
+                            start_time_str = r.get("Giờ bắt đầu", "")
+                            end_time_str   = r.get("Giờ kết thúc", "")
+                            note_text      = r.get("Ghi chú", "") or ""
+
+                            # ===== 2. QUYẾT ĐỊNH KHỐI LƯỢNG =====
+                            old_hours = origin_hours.get(int(r["ID"]), 0)
+                            new_hours_input = float(r.get("Khối lượng (giờ)", 0) or 0)
+
+                            if abs(new_hours_input - old_hours) > 0.001:
+                                # ✅ user đã sửa ô khối lượng
+                                new_hours = round(new_hours_input, 2)
+                            else:
+                                # ❌ user không sửa → tự tính (đã tính sẵn bằng calc_hours_vectorized)
+                                new_hours = float(auto_hours.get(
+                                    (r["Ngày"], start_time_str, end_time_str), 0.0
+                                ))
+
+
+                            # ===== 3. GIỜ / NGÀY KẾT THÚC (giữ khoảng ngày cũ nếu có) =====
+                            start_date_str = start_date.strftime("%Y-%m-%d")
+                            end_date_str = max(end_dates.get(int(r["ID"])) or start_date_str, start_date_str)
+
+                            return {
+                                "start_date": start_date_str,
+                                "task": r["Công việc"],
+                                "khoi_luong": new_hours,   # ⭐ GIỜ ĐƯỢC TÍNH LẠI
+                                **timesheet.task_fields(start_time_str, end_time_str, start_date_str, end_date_str, note_text),
+                            }
+
+                        # ===== 5. UPDATE DB: chỉ các dòng có thay đổi, gộp theo lô =====
+                        changes = repository.diff_task_rows(df_origin, pd.DataFrame(selected_rows), _cong_fields)
+                        results = repository.bulk_update_tasks(changes)
+                        failed = [f"{tid}: {err}" for tid, err in results.items() if err]
+
+                        if failed:
+                            st.error(f"⚠️ Lỗi khi cập nhật {len(failed)} dòng: {', '.join(failed)}")
+                        else:
+                            st.success(f"✅ Đã cập nhật công nhật của **{user_display}**")
+                            task_store.invalidate_project(project)
+                            clear_cong_exports()
+                            st.rerun()
+
+                # ======================================================
+                # 📤 XUẤT DANH SÁCH CÔNG NHẬT (TOÀN BỘ USER – 1 SHEET)
+                # ======================================================
+                st.divider()
+                st.markdown("### 📤 Xuất công nhật theo quý")
+
+                # Chỉ dựng file khi bấm nút (đọc đúng quý từ DB theo trang); file đã dựng được giữ
+                # trong session cho nút tải và bị bỏ khi công nhật thay đổi (clear_cong_exports)
+                export_key = f"cong_export_{project}_{year_filter}_{q_name}"
+                if st.button("📦 Tạo file Excel công nhật quý", key=f"btn_{export_key}"):
+                    pages = list(cong_export.iter_task_pages([project], d_from, d_to))
+                    df_quarter = pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
+                    export_df = cong_export.export_frame(df_quarter, user_map)
+                    st.session_state[export_key] = cong_export.write_xlsx([export_df], "Cong_nhat_quy")
+
+                if export_key in st.session_state:
+                    data, n_rows = st.session_state[export_key]
+                    if n_rows == 0:
+                        st.info("Không có dữ liệu để xuất.")
+                    else:
                         st.download_button(
-                            "⬇️ Xuất danh sách công nhật (Excel)",
-                            data=output.getvalue(),
+                            f"⬇️ Xuất danh sách công nhật (Excel, {n_rows} dòng)",
+                            data=data,
                             file_name=f"cong_nhat_{project}_{year_filter}_{q_name}.xlsx",
                             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                         )
 
+                # ===== Xuất cả năm / nhiều dự án (đọc DB theo trang, ghi dần vào file) =====
+                with st.expander("📅 Xuất cả năm cho nhiều dự án"):
+                    public_projects = df_projects.loc[df_projects["project_type"] == "public", "name"].tolist()
+                    year_projects = st.multiselect(
+                        "Dự án", df_projects["name"].dropna().tolist(),
+                        default=public_projects, key="cong_year_export_projects"
+                    )
+                    year_export = st.number_input(
+                        "Năm", min_value=2000, max_value=2100, value=int(year_filter), step=1,
+                        key="cong_year_export_year"
+                    )
+                    year_key = f"cong_export_year_{year_export}_{'|'.join(sorted(year_projects))}"
+                    if st.button("📦 Tạo file Excel cả năm", key="btn_cong_year_export"):
+                        if not year_projects:
+                            st.warning("⚠️ Chưa chọn dự án nào.")
+                        else:
+                            with st.spinner("Đang xuất công nhật..."):
+                                st.session_state[year_key] = cong_export.export_period(
+                                    year_projects, dt.date(year_export, 1, 1), dt.date(year_export, 12, 31), user_map
+                                )
+
+                    if year_key in st.session_state:
+                        data, n_rows = st.session_state[year_key]
+                        if n_rows == 0:
+                            st.info("Không có dữ liệu để xuất.")
+                        else:
+                            st.download_button(
+                                f"⬇️ Tải công nhật năm {year_export} (Excel, {n_rows} dòng)",
+                                data=data,
+                                file_name=f"cong_nhat_{year_export}.xlsx",
+                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                                key="dl_cong_year_export"
+                            )
+
 
 
 
@@ -1507,39 +1479,12 @@ def admin_app(user):
             "K/ĐT", "ĐT/K", "K/L", "L/K"
         ]
 
-        # ==== ĐỌC DỮ LIỆU ====
-        res = supabase.table("attendance_new").select("*").execute()
-        df_att = pd.DataFrame(res.data) if res.data else pd.DataFrame(columns=["username", "data", "months"])
+        # ==== ĐỌC DỮ LIỆU (chỉ tháng đang chọn) ====
+        month_map = load_attendance_month(month_str)
 
         # ==== KHỞI TẠO BUFFER ====
         if "attendance_buffer" not in st.session_state:
-            rows = []
-            for _, u in df_users.iterrows():
-                uname = u["username"]
-                display_name = u["display_name"]
-                record = df_att[df_att["username"] == uname]
-                user_data = {}
-                if len(record) > 0:
-                    rec = record.iloc[0]
-                    user_data = rec.get("data", {}) or {}
-                    if isinstance(user_data, str):
-                        try:
-                            user_data = json.loads(user_data)
-                        except:
-                            user_data = {}
-                month_data = user_data.get(month_str, {})
-                row = {"username": uname, "User": display_name}
-                for d in days:
-                    weekday = d.weekday()
-                    key = d.strftime("%d")
-                    col = f"{key}/{d.strftime('%m')} ({['T2','T3','T4','T5','T6','T7','CN'][weekday]})"
-                    if d.date() <= today_date:
-                        val = month_data.get(key, "K" if weekday < 5 else "")
-                    else:
-                        val = month_data.get(key, "")
-                    row[col] = val
-                rows.append(row)
-            st.session_state["attendance_buffer"] = pd.DataFrame(rows)
+            st.session_state["attendance_buffer"] = build_month_grid(df_users, month_map, days, today_date)
 
         df_display = st.session_state["attendance_buffer"].copy()
         day_cols = [c for c in df_display.columns if "/" in c]
@@ -1683,18 +1628,19 @@ def admin_app(user):
         #   HIỂN THỊ AG-GRID
         # =============================
         with st.form("attendance_form", clear_on_submit=False):
-            grid_response = AgGrid(
-                df_display_clean,
-                gridOptions=gridOptions,
-                height=650,
-                theme="streamlit",                        # ép theme để CSS ăn
-                allow_unsafe_jscode=True,
-                update_mode=GridUpdateMode.MANUAL,
-                data_return_mode=DataReturnMode.AS_INPUT,
-                reload_data=False,
-                fit_columns_on_grid_load=False,
-                key=f"grid_{month_str}"
-            )
+            with perf.span("grid:admin.attendance", rows=len(df_display_clean)):
+                grid_response = AgGrid(
+                    df_display_clean,
+                    gridOptions=gridOptions,
+                    height=650,
+                    theme="streamlit",                        # ép theme để CSS ăn
+                    allow_unsafe_jscode=True,
+                    update_mode=GridUpdateMode.MANUAL,
+                    data_return_mode=DataReturnMode.AS_INPUT,
+                    reload_data=False,
+                    fit_columns_on_grid_load=False,
+                    key=f"grid_{month_str}"
+                )
 
             # Đưa scroll về đầu
             st.markdown("<script>window.scrollTo({top:0,left:0,behavior:'auto'});</script>", unsafe_allow_html=True)
@@ -1710,16 +1656,7 @@ def admin_app(user):
 
             # ==== GHI CHÚ THÁNG ====
             st.markdown("### 📝 Ghi chú tháng")
-            note_rec = df_att[df_att["username"] == "NoteData"]
-            existing_note = ""
-            if not note_rec.empty:
-                note_data = note_rec.iloc[0].get("data", {}) or {}
-                if isinstance(note_data, str):
-                    try:
-                        note_data = json.loads(note_data)
-                    except:
-                        note_data = {}
-                existing_note = note_data.get(month_str, "")
+            existing_note = month_map.get(NOTE_USER, "") or ""
             monthly_note = st.text_area(
                 f"Ghi chú cho tháng {month_str}:",
                 value=existing_note,
@@ -1733,90 +1670,38 @@ def admin_app(user):
             today_date = dt.date.today()
             edited_df = st.session_state["attendance_buffer"].copy()
             updated_users, inserted_users, skipped_users, errors = [], [], [], []
+            known_users = set(month_map)
+
+            # Gom tất cả user có thay đổi của tháng này vào 1 payload
+            entries = {}
+            codes_by_user = month_codes_by_user(edited_df, day_cols, selected_month, today_date)
+            for uname, codes in codes_by_user.items():
+                old_month_data = month_map.get(str(uname).strip(), {})
+                if str(uname).strip() in known_users and old_month_data == codes:
+                    skipped_users.append(uname)
+                    continue
+
+                entries[uname] = codes
+                if str(uname).strip() in known_users:
+                    updated_users.append(uname)
+                else:
+                    inserted_users.append(uname)
 
-            with st.spinner("💾 Đang lưu dữ liệu lên Supabase..."):
-                for _, row in edited_df.iterrows():
-                    uname = row["username"]
-
-                    def remove_emoji(txt):
-                        if not txt:
-                            return ""
-                        txt = re.sub(r"[\U0001F300-\U0001FAFF]", "", str(txt))
-                        for sym in ["🟩","🟥","🟦","🟧","🟨","🟫","🟪","⬛"]:
-                            txt = txt.replace(sym,"")
-                        return txt.strip()
-
-                    codes = {}
-                    for col in day_cols:
-                        try:
-                            day = int(col.split("/")[0])
-                            date_in_month = selected_month.replace(day=day)
-                            if date_in_month <= today_date:
-                                val = remove_emoji(row.get(col))
-                                codes[f"{day:02d}"] = val
-                        except:
-                            pass
-
-                    record = df_att[df_att["username"].astype(str).str.strip() == str(uname).strip()]
-                    try:
-                        if len(record) == 0:
-                            payload = {"username": uname, "months": [month_str], "data": {month_str: codes}}
-                            supabase.table("attendance_new").insert(payload).execute()
-                            inserted_users.append(uname)
-                            continue
-
-                        rec = record.iloc[0]
-                        months = rec.get("months", []) or []
-                        data_all = rec.get("data", {}) or {}
-                        if isinstance(data_all, str):
-                            try:
-                                data_all = json.loads(data_all)
-                            except:
-                                data_all = {}
+            # ==== GHI CHÚ ====
+            if month_map.get(NOTE_USER, "") != monthly_note or NOTE_USER not in known_users:
+                entries[NOTE_USER] = monthly_note
 
-                        old_month_data = data_all.get(month_str, {})
-                        if isinstance(old_month_data, str):
-                            try:
-                                old_month_data = json.loads(old_month_data)
-                            except:
-                                old_month_data = {}
-
-                        if old_month_data != codes:
-                            data_all[month_str] = codes
-                            if month_str not in months:
-                                months.append(month_str)
-                            supabase.table("attendance_new").update({
-                                "data": data_all,
-                                "months": months
-                            }).eq("username", uname).execute()
-                            updated_users.append(uname)
-                        else:
-                            skipped_users.append(uname)
-                    except Exception as e:
-                        errors.append(f"{uname}: {e}")
-
-                # ==== GHI CHÚ ====
-                note_rec = df_att[df_att["username"] == "NoteData"]
-                if not note_rec.empty:
-                    rec = note_rec.iloc[0]
-                    data_all = rec.get("data", {}) or {}
-                    if isinstance(data_all, str):
-                        data_all = json.loads(data_all)
-                    data_all[month_str] = monthly_note
-                    supabase.table("attendance_new").update(
-                        {"data": data_all, "months": [month_str]}
-                    ).eq("username","NoteData").execute()
-                else:
-                    supabase.table("attendance_new").insert({
-                        "username": "NoteData",
-                        "data": {month_str: monthly_note},
-                        "months": [month_str]
-                    }).execute()
+            with st.spinner("💾 Đang lưu dữ liệu lên Supabase..."):
+                try:
+                    save_attendance_month(month_str, entries)
+                except Exception as e:
+                    errors.append(str(e))
 
-            msg = f"✅ Lưu thành công!\n- Cập nhật: {len(updated_users)} user\n- Thêm mới: {len(inserted_users)} user\n- Bỏ qua: {len(skipped_users)} user"
             if errors:
-                msg += f"\n⚠️ Lỗi {len(errors)} user: {', '.join(errors)}"
-            st.success(msg)
+                st.error(f"⚠️ Lỗi khi lưu bảng chấm công tháng {month_str}: {', '.join(errors)}")
+            else:
+                msg = f"✅ Lưu thành công!\n- Cập nhật: {len(updated_users)} user\n- Thêm mới: {len(inserted_users)} user\n- Bỏ qua: {len(skipped_users)} user"
+                st.success(msg)
 
         # ==============================
         # 📊 THỐNG KÊ CÔNG THEO THÁNG
@@ -1824,20 +1709,11 @@ def admin_app(user):
         st.divider()
         st.markdown("## 📊 Thống kê tổng hợp theo tháng")
 
-        df_stat = st.session_state["attendance_buffer"].copy()
-        day_cols = [c for c in df_stat.columns if "/" in c]
-
-        def count_type(row, code):
-            return sum(1 for c in day_cols if str(row[c]).strip().upper() == code)
-
-        df_stat["Tổng K"] = df_stat.apply(lambda r: count_type(r, "K"), axis=1)
-        df_stat["Tổng P"] = df_stat.apply(lambda r: count_type(r, "P"), axis=1)
-        df_stat["Tổng L"] = df_stat.apply(lambda r: count_type(r, "L"), axis=1)
-        df_stat["Tổng H"] = df_stat.apply(lambda r: count_type(r, "H"), axis=1)
-        df_stat["Tổng Công"] = df_stat["Tổng K"] + df_stat["Tổng H"] + df_stat["Tổng P"]
+        # Mã ghép (K/P, P/K, ...) được tính nửa ngày cho mỗi mã
+        df_stat = month_summary(st.session_state["attendance_buffer"])
 
         st.dataframe(
-            df_stat[["User", "Tổng K", "Tổng P", "Tổng L", "Tổng H", "Tổng Công"]],
+            df_stat[["User", "Tổng K", "Tổng P", "Tổng L", "Tổng H", "Tổng K:2", "Tổng Công"]],
             hide_index=True,
             use_container_width=True
         )
@@ -1859,38 +1735,34 @@ def admin_app(user):
         elif filter_mode == "Tất cả":
             selected_projects = projects
         elif filter_mode == "Chỉ dự án chưa hoàn thành":
-            data = supabase.table("tasks").select("project").lt("progress", 100).execute()
-            unfinished = list({r["project"] for r in data.data})
-            selected_projects = unfinished
+            selected_projects = task_stats.unfinished_projects()
 
-        # Lấy dữ liệu công việc
-        if selected_projects:
-            placeholders = ",".join(["%s"] * len(selected_projects))
-            data = supabase.table("tasks").select("*").in_("project", selected_projects).execute()
-            df = pd.DataFrame(data.data)
-
-        else:
-            df = pd.DataFrame()
+        # Số liệu đã gom nhóm sẵn (project × người dùng × đầu mục) – không tải từng task
+        stats = task_stats.load_task_stats(selected_projects)
 
-        if df.empty:
+        if stats.empty:
             st.info("⚠️ Không có dữ liệu công việc cho lựa chọn này.")
         else:
             # Chọn kiểu thống kê
-            df["assignee"] = df["assignee"].map(user_map).fillna(df["assignee"])
-
             stat_mode = st.radio("Xem thống kê theo", ["Dự án", "Người dùng"])
 
+            # Bỏ các dự án Public hoặc "Công việc gián tiếp" khỏi biểu đồ
+            def _without_public(frame):
+                names = frame["project"].astype(str)
+                mask = names.str.contains("public", case=False, na=False) | \
+                    names.str.contains("gián tiếp", case=False, na=False)
+                return frame[~mask]
+
             # ==================== THEO DỰ ÁN ====================
             if stat_mode == "Dự án":
                 # Tổng quan theo dự án
-                proj_summary = df.groupby("project").agg(
-                    **{
-                        "Tổng công việc": ("id", "count"),
-                        "Hoàn thành": ("progress", lambda x: (x == 100).sum()),
-                        "Chưa hoàn thành": ("progress", lambda x: (x < 100).sum()),
-                        "Tiến độ trung bình (%)": ("progress", "mean")
-                    }
-                ).reset_index().rename(columns={"project": "Dự án"})
+                proj_summary = task_stats.rollup(stats, ["project"]).rename(columns={
+                    "project": "Dự án",
+                    "total": "Tổng công việc",
+                    "done": "Hoàn thành",
+                    "not_done": "Chưa hoàn thành",
+                    "avg_progress": "Tiến độ trung bình (%)",
+                })
 
                 styled_proj = proj_summary.style.format(
                     {"Tiến độ trung bình (%)": "{:.0f} %"}
@@ -1899,225 +1771,120 @@ def admin_app(user):
                 st.markdown("### 📂 Tiến độ theo dự án")
                 st.dataframe(styled_proj, width="stretch")
 
-
-                # Chi tiết theo đầu mục công việc (cha)
-                # Map task -> cha
-                job_map = df_jobs[["id", "name", "parent_id"]].copy()
-
-                parent_lookup = {}
-                for _, row in job_map.iterrows():
-                    if pd.isna(row["parent_id"]):
-                        parent_lookup[row["name"]] = row["name"]
-                    else:
-                        pid = int(row["parent_id"])
-                        parent_name = job_map.loc[job_map["id"] == pid, "name"].values[0]
-                        parent_lookup[row["name"]] = parent_name
-
-                df["Đầu mục công việc"] = df["task"].map(parent_lookup).fillna(df["task"])
-
-                job_summary = df.groupby(["project", "Đầu mục công việc"]).agg(
-                    **{
-                        "Tổng công việc": ("id", "count"),
-                        "Hoàn thành": ("progress", lambda x: (x == 100).sum()),
-                        "Chưa hoàn thành": ("progress", lambda x: (x < 100).sum()),
-                        "Tiến độ trung bình (%)": ("progress", "mean")
-                    }
-                ).reset_index().rename(columns={"project": "Dự án"})
-
-                styled_job = job_summary.style.format(
-                    {"Tiến độ trung bình (%)": "{:.0f} %"}
-                ).bar(subset=["Tiến độ trung bình (%)"], color="#2196F3")
-                
-                # ---- Thống kê theo đầu mục công việc (dạng cây, bỏ dự án public) ----
+                # ---- Thống kê theo đầu mục công việc (dạng cây) ----
                 st.markdown("### 🌳 Thống kê Đầu mục công việc Của dự án")
 
-                # Bỏ các dự án Public nếu có cột project_type
-                if "project_type" in df.columns:
-                    df_non_public = df[df["project_type"] != "public"].copy()
-                else:
-                    df_non_public = df.copy()
-
-                if df_non_public.empty:
-                    st.info("⚠️ Không có dữ liệu công việc cho các dự án không Public.")
-                else:
-                    # Map task -> đầu mục cha
-                    job_map = df_jobs[["id", "name", "parent_id"]].copy()
-
-                    parent_lookup = {}
-                    for _, row in job_map.iterrows():
-                        if pd.isna(row["parent_id"]):
-                            parent_lookup[row["name"]] = row["name"]
-                        else:
-                            pid = int(row["parent_id"])
-                            parent_name = job_map.loc[job_map["id"] == pid, "name"].values[0]
-                            parent_lookup[row["name"]] = parent_name
-
-                    df_non_public["Đầu mục"] = df_non_public["task"].map(parent_lookup).fillna(df_non_public["task"])
-
-                    # Gom nhóm theo Dự án + Đầu mục
-                    grouped = df_non_public.groupby(["project", "Đầu mục"]).agg(
-                        Tổng_công_việc=("id", "count"),
-                        Hoàn_thành=("progress", lambda x: (x == 100).sum()),
-                        Chưa_hoàn_thành=("progress", lambda x: (x < 100).sum()),
-                        Tiến_độ_TB=("progress", "mean")
-                    ).reset_index()
-
-                    # Tạo bảng hiển thị: dự án chỉ ghi ở dòng đầu tiên
-                    rows = []
-                    for proj in grouped["project"].unique():
-                        df_proj = grouped[grouped["project"] == proj]
-                        first = True
-                        for _, r in df_proj.iterrows():
-                            rows.append({
-                                "Dự án": proj if first else "",
-                                "Đầu mục": r["Đầu mục"],
-                                "Tổng công việc": int(r["Tổng_công_việc"]),
-                                "Hoàn thành": int(r["Hoàn_thành"]),
-                                "Chưa hoàn thành": int(r["Chưa_hoàn_thành"]),
-                                "Tiến độ TB (%)": round(r["Tiến_độ_TB"], 1)
-                            })
-                            first = False
-                    display_df = pd.DataFrame(rows)
-
-                    st.dataframe(
-                        display_df.style.format({"Tiến độ TB (%)": "{:.0f} %"}),
-                        width="stretch"
-                    )
-
-                    # ---- Biểu đồ tiến độ dự án (trừ public) ----
-
-
-                    # ---- BIỂU ĐỒ 1: TIẾN ĐỘ THEO ĐẦU MỤC CỦA TỪNG DỰ ÁN (KHÔNG PUBLIC) ----
-                    st.markdown("### 📈 Tiến độ các Đầu mục trong từng Dự án")
-
-                    proj_detail = df.copy()
+                grouped = task_stats.rollup(stats, ["project", "parent_job"])
 
-                    # Loại bỏ các dự án public hoặc "Công việc gián tiếp"
-                    if "project" in proj_detail.columns:
-                        proj_detail = proj_detail[~proj_detail["project"].str.contains("public", case=False, na=False)]
-                        proj_detail = proj_detail[~proj_detail["project"].str.contains("gián tiếp", case=False, na=False)]
-
-                    # Xác định tên cột đầu mục
-                    col_daumuc = "Đầu mục công việc" if "Đầu mục công việc" in proj_detail.columns else (
-                        "Đầu mục" if "Đầu mục" in proj_detail.columns else "task_category"
-                    )
-
-                    proj_detail = proj_detail.groupby(["project", col_daumuc]).agg(
-                        Số_CV=("id", "count"),
-                        Tiến_độ_TB=("progress", "mean")
-                    ).reset_index()
-
-                    proj_detail.rename(columns={col_daumuc: "Đầu mục"}, inplace=True)
-                    proj_detail["Hiển thị"] = proj_detail.apply(
-                        lambda x: f"<b>{x['project']}</b><br>{x['Đầu mục']}", axis=1
-                    )
+                # Tạo bảng hiển thị: dự án chỉ ghi ở dòng đầu tiên
+                display_df = pd.DataFrame({
+                    "Dự án": grouped["project"].where(~grouped["project"].duplicated(), ""),
+                    "Đầu mục": grouped["parent_job"],
+                    "Tổng công việc": grouped["total"].astype(int),
+                    "Hoàn thành": grouped["done"].astype(int),
+                    "Chưa hoàn thành": grouped["not_done"].astype(int),
+                    "Tiến độ TB (%)": grouped["avg_progress"].round(1),
+                })
 
-                    import plotly.express as px
-                    fig = px.bar(
-                        proj_detail,
-                        x="Tiến_độ_TB",
-                        y="Hiển thị",
-                        orientation="h",
-                        text="Số_CV",
-                        labels={
-                            "Tiến_độ_TB": "Tiến độ TB (%)",
-                            "Hiển thị": "Dự án / Đầu mục",
-                            "Số_CV": "Số CV"
-                        },
-                        title="Tiến độ các đầu mục công việc trong từng dự án (không Public)"
-                    )
-                    fig.update_traces(texttemplate='Tiến độ %{x:.0f}% | %{text} CV', textposition='outside')
-                    fig.update_layout(yaxis=dict(autorange="reversed"), showlegend=False)
-                    st.plotly_chart(fig, width="stretch")
-                    st.markdown(
-                        """
-                        <style>
-                        .page-break { 
-                            page-break-before: always; 
-                        }
-                        </style>
-                        """,
-                        unsafe_allow_html=True
-                    )
-                    st.markdown('<div class="page-break"></div>', unsafe_allow_html=True)
-
-                    # ---- BIỂU ĐỒ 2: TIẾN ĐỘ TỔNG THỂ CỦA MỖI DỰ ÁN ----
-                    st.markdown("### 📊 Biểu đồ hoàn thành dự án")
-
-                    proj_progress = df.copy()
-
-                    # Loại bỏ các dự án Public hoặc "Công việc gián tiếp"
-                    if "project" in proj_progress.columns:
-                        proj_progress = proj_progress[~proj_progress["project"].str.contains("public", case=False, na=False)]
-                        proj_progress = proj_progress[~proj_progress["project"].str.contains("gián tiếp", case=False, na=False)]
-
-                    # Ép tên dự án thành chuỗi để Plotly không coi là số
-                    proj_progress["project"] = proj_progress["project"].astype(str)
-
-                    # Gom tiến độ trung bình cho mỗi dự án
-                    proj_progress = proj_progress.groupby("project", dropna=False).agg(
-                        Tổng_CV=("id", "count"),
-                        Tiến_độ_TB=("progress", "mean")
-                    ).reset_index()
-
-                    import plotly.express as px
-
-                    fig_proj = px.bar(
-                        proj_progress,
-                        x="project",          # Trục X = tên dự án
-                        y="Tiến_độ_TB",       # Trục Y = % tiến độ TB
-                        text=proj_progress.apply(lambda x: f"{x['Tiến_độ_TB']:.0f}% | {x['Tổng_CV']} CV", axis=1),
-                        labels={
-                            "project": "Dự án",
-                            "Tiến_độ_TB": "Tiến độ TB (%)",
-                            "Tổng_CV": "Tổng công việc"
-                        },
-                        title="📊 Biểu đồ hoàn thành dự án (không Public)"
-                    )
+                st.dataframe(
+                    display_df.style.format({"Tiến độ TB (%)": "{:.0f} %"}),
+                    width="stretch"
+                )
 
-                    fig_proj.update_traces(textposition='outside')
-                    fig_proj.update_layout(
-                        xaxis=dict(type='category'),  # Giữ nguyên tên dự án dạng text
-                        yaxis=dict(range=[0, 100]),   # Giới hạn 0–100%
-                        showlegend=False,
-                        xaxis_title="Dự án",
-                        yaxis_title="Tiến độ TB (%)"
-                    )
+                # ---- BIỂU ĐỒ 1: TIẾN ĐỘ THEO ĐẦU MỤC CỦA TỪNG DỰ ÁN (KHÔNG PUBLIC) ----
+                st.markdown("### 📈 Tiến độ các Đầu mục trong từng Dự án")
 
-                    st.plotly_chart(fig_proj, width="stretch")
+                proj_detail = _without_public(grouped).rename(columns={
+                    "parent_job": "Đầu mục",
+                    "total": "Số_CV",
+                    "avg_progress": "Tiến_độ_TB",
+                })
+                proj_detail["Hiển thị"] = "<b>" + proj_detail["project"].astype(str) + "</b><br>" + \
+                    proj_detail["Đầu mục"].astype(str)
+
+                import plotly.express as px
+                fig = px.bar(
+                    proj_detail,
+                    x="Tiến_độ_TB",
+                    y="Hiển thị",
+                    orientation="h",
+                    text="Số_CV",
+                    labels={
+                        "Tiến_độ_TB": "Tiến độ TB (%)",
+                        "Hiển thị": "Dự án / Đầu mục",
+                        "Số_CV": "Số CV"
+                    },
+                    title="Tiến độ các đầu mục công việc trong từng dự án (không Public)"
+                )
+                fig.update_traces(texttemplate='Tiến độ %{x:.0f}% | %{text} CV', textposition='outside')
+                fig.update_layout(yaxis=dict(autorange="reversed"), showlegend=False)
+                st.plotly_chart(fig, width="stretch")
+                st.markdown(
+                    """
+                    <style>
+                    .page-break { 
+                        page-break-before: always; 
+                    }
+                    </style>
+                    """,
+                    unsafe_allow_html=True
+                )
+                st.markdown('<div class="page-break"></div>', unsafe_allow_html=True)
 
+                # ---- BIỂU ĐỒ 2: TIẾN ĐỘ TỔNG THỂ CỦA MỖI DỰ ÁN ----
+                st.markdown("### 📊 Biểu đồ hoàn thành dự án")
 
+                proj_progress = task_stats.rollup(_without_public(stats), ["project"]).rename(columns={
+                    "total": "Tổng_CV",
+                    "avg_progress": "Tiến_độ_TB",
+                })
 
+                # Ép tên dự án thành chuỗi để Plotly không coi là số
+                proj_progress["project"] = proj_progress["project"].astype(str)
+                bar_text = proj_progress["Tiến_độ_TB"].map("{:.0f}%".format) + " | " + \
+                    proj_progress["Tổng_CV"].astype(str) + " CV"
+
+                fig_proj = px.bar(
+                    proj_progress,
+                    x="project",          # Trục X = tên dự án
+                    y="Tiến_độ_TB",       # Trục Y = % tiến độ TB
+                    text=bar_text,
+                    labels={
+                        "project": "Dự án",
+                        "Tiến_độ_TB": "Tiến độ TB (%)",
+                        "Tổng_CV": "Tổng công việc"
+                    },
+                    title="📊 Biểu đồ hoàn thành dự án (không Public)"
+                )
 
+                fig_proj.update_traces(textposition='outside')
+                fig_proj.update_layout(
+                    xaxis=dict(type='category'),  # Giữ nguyên tên dự án dạng text
+                    yaxis=dict(range=[0, 100]),   # Giới hạn 0–100%
+                    showlegend=False,
+                    xaxis_title="Dự án",
+                    yaxis_title="Tiến độ TB (%)"
+                )
 
+                st.plotly_chart(fig_proj, width="stretch")
 
             # ==================== THEO NGƯỜI DÙNG ====================
             else:
                 # Lấy toàn bộ user
                 all_users = df_users["display_name"].tolist()
 
-
-                # Map task -> cha
-                job_map = df_jobs[["id", "name", "parent_id"]].copy()
-
-                parent_lookup = {}
-                for _, row in job_map.iterrows():
-                    if pd.isna(row["parent_id"]):
-                        parent_lookup[row["name"]] = row["name"]
-                    else:
-                        pid = int(row["parent_id"])
-                        parent_name = job_map.loc[job_map["id"] == pid, "name"].values[0]
-                        parent_lookup[row["name"]] = parent_name
-
-                df["Đầu mục công việc"] = df["task"].map(parent_lookup).fillna(df["task"])
-
-                # Gom nhóm user + dự án + đầu mục
-                grouped = df.groupby(["assignee", "project", "Đầu mục công việc"]).agg(
-                    Tổng_công_việc=("id", "count"),
-                    Hoàn_thành=("progress", lambda x: (x == 100).sum()),
-                    Chưa_hoàn_thành=("progress", lambda x: (x < 100).sum()),
-                    Tiến_độ_TB=("progress", "mean")
-                ).reset_index().rename(columns={"assignee": "Người dùng", "project": "Dự án"})
+                # Gom nhóm user + dự án + đầu mục (username → tên hiển thị trước khi gộp)
+                grouped = task_stats.rollup(
+                    stats, ["assignee", "project", "parent_job"], user_map=user_map
+                ).rename(columns={
+                    "assignee": "Người dùng",
+                    "project": "Dự án",
+                    "parent_job": "Đầu mục công việc",
+                    "total": "Tổng_công_việc",
+                    "done": "Hoàn_thành",
+                    "not_done": "Chưa_hoàn_thành",
+                    "avg_progress": "Tiến_độ_TB",
+                })
 
                 # Outer join để tất cả user đều có mặt
                 users_df = pd.DataFrame({"Người dùng": all_users})
@@ -2135,6 +1902,88 @@ def admin_app(user):
                 st.markdown("### 👤 Thống kê chi tiết theo người dùng")
                 st.dataframe(styled_user, width="stretch")
         
+    elif choice == "Chẩn đoán kết nối":
+        st.subheader("🩺 Chẩn đoán kết nối")
+        st.caption(f"Backend: {storage.describe()}. Số liệu tính từ lúc tiến trình khởi động "
+                   "(chung cho mọi phiên), thời gian tính cả các lần thử lại.")
+
+        state = db_client.breaker.state()
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Circuit breaker", {"closed": "🟢 Bình thường", "open": "🔴 Đang ngắt",
+                                      "half-open": "🟡 Đang thử lại"}[state["state"]])
+        c2.metric("Lỗi liên tiếp", state["consecutive_failures"])
+        if storage.BACKEND == "supabase":
+            c3.metric("Pool HTTP", f"{db_client.POOL_SIZE} kết nối")
+        else:
+            c3.metric("Pool DB", f"{storage.DB_POOL_SIZE} kết nối" if storage.BACKEND == "postgres" else "1 / luồng")
+        c4.metric("Số lần thử lại tối đa", db_client.MAX_RETRIES)
+
+        df_metrics = db_client.metrics_frame()
+        if df_metrics.empty:
+            st.info("Chưa có truy vấn nào được ghi nhận.")
+        else:
+            st.dataframe(
+                df_metrics.rename(columns={
+                    "table": "Bảng / RPC", "operation": "Thao tác", "calls": "Số lần gọi",
+                    "errors": "Lỗi", "retries": "Thử lại", "avg_ms": "TB (ms)", "p50_ms": "p50 (ms)",
+                    "p95_ms": "p95 (ms)", "max_ms": "Max (ms)", "total_s": "Tổng (s)",
+                    "last_error": "Lỗi gần nhất",
+                }),
+                width="stretch", hide_index=True
+            )
+
+        if st.button("🔄 Xoá số liệu"):
+            db_client.reset_metrics()
+            st.rerun()
+
+    elif choice == "Hiệu năng":
+        st.subheader("⏱️ Hiệu năng ứng dụng")
+        st.caption(
+            f"{perf.RERUN_BUFFER} lần rerun và {perf.SPAN_BUFFER} span gần nhất của mọi phiên. "
+            "DB = chờ Supabase (truy vấn chạy song song được cộng dồn), Grid = dựng + gửi AG-Grid / data_editor, "
+            "Khác = pandas và phần còn lại của Streamlit."
+        )
+
+        st.markdown("### 📄 Thời gian rerun theo trang / mục")
+        df_reruns = perf.rerun_stats()
+        if df_reruns.empty:
+            st.info("Chưa có lần rerun nào được ghi nhận.")
+        else:
+            st.dataframe(
+                df_reruns.rename(columns={
+                    "section": "Trang / mục", "count": "Số lần", "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)",
+                    "max_ms": "Max (ms)", "total_s": "Tổng (s)", "avg_db_ms": "DB TB (ms)", "avg_grid_ms": "Grid TB (ms)",
+                }),
+                width="stretch", hide_index=True
+            )
+
+        st.markdown("### 🔬 Theo đoạn xử lý (span)")
+        df_spans = perf.span_stats()
+        if not df_spans.empty:
+            st.dataframe(
+                df_spans.rename(columns={
+                    "name": "Span", "count": "Số lần", "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)",
+                    "max_ms": "Max (ms)", "total_s": "Tổng (s)", "avg_rows": "Số dòng TB", "avg_bytes": "Byte TB",
+                }),
+                width="stretch", hide_index=True
+            )
+
+        st.markdown("### 🐢 Các lần rerun chậm nhất")
+        df_slow = perf.slowest_reruns(20)
+        if not df_slow.empty:
+            st.dataframe(
+                df_slow.rename(columns={
+                    "time": "Thời điểm", "section": "Trang / mục", "user": "User", "total_ms": "Tổng (ms)",
+                    "db_ms": "DB (ms)", "db_calls": "Số truy vấn", "grid_ms": "Grid (ms)", "other_ms": "Khác (ms)",
+                    "top_spans": "Đoạn tốn nhất",
+                }),
+                width="stretch", hide_index=True
+            )
+
+        if st.button("🔄 Xoá số liệu hiệu năng"):
+            perf.reset()
+            st.rerun()
+
 
     # 🔁 Nếu vừa lưu xong, đợi 0.5s rồi reload lại một lần
     if st.session_state.get("just_saved"):
@@ -5,29 +5,40 @@ import datetime
 from admin_app import admin_app
 from project_manager_app import project_manager_app
 from user_app import user_app   # nếu vẫn muốn dùng giao diện user thường
-from auth import init_db, get_connection, commit_and_sync, hash_password
+from auth import (
+    init_db, get_connection, hash_password, find_user_by_username, register_user, UsernameTakenError,
+)
+import repository
+import sessions
+
+# Entry point cũ: cùng client với main.py (auth.get_connection, chọn backend bằng STORAGE_BACKEND
+# – xem storage.py) thay vì SQL DB-API, nên chạy được trên Supabase, SQLite và Postgres.
 
 # ==================== HỖ TRỢ ====================
 
 
 
+@st.cache_resource
+def _init_db_once():
+    """Tạo bảng còn thiếu 1 lần cho cả tiến trình, không chạy lại ở mỗi lần Streamlit rerun."""
+    init_db()
+    return True
+
+
+def _user_tuple(row):
+    return (row["id"], row["username"], row["display_name"], row["dob"], row["password"], row["role"])
+
+
 def check_login(username, password):
-    u = (username or "").strip().lower()
+    u = (username or "").strip()
     p = password or ""
 
-    if u == "tdpro" and p == "Giadinh12":
+    if u.casefold() == "tdpro" and p == "Giadinh12":
         return (0, "tdpro", "TDPRO", None, "Giadinh12", "admin")
 
-    conn, c = get_connection()
-    c.execute(
-        "SELECT id, username, display_name, dob, password, role FROM users WHERE lower(username)=%s",
-        (u,)
-    )
-    row = c.fetchone()
-    conn.close()
-
-    if row and row[4] == hash_password(p):
-        return row
+    row = find_user_by_username(u)
+    if row and row["password"] == hash_password(p):
+        return _user_tuple(row)
     return None
 
 
@@ -45,7 +56,7 @@ def role_display(role: str) -> str:
 
 def profile_page(user):
     st.title("👤 Hồ sơ cá nhân")
-    conn, c = get_connection()
+    supabase = get_connection()
 
     st.subheader("Thông tin cơ bản")
     new_display = st.text_input("Tên hiển thị", value=user[2] or "", key="pf_display")
@@ -60,11 +71,11 @@ def profile_page(user):
     )
 
     if st.button("💾 Lưu thông tin", key="pf_save"):
-        c.execute(
-            "UPDATE users SET display_name=%s, dob=%s WHERE lower(username)=lower(%s)",
-            (new_display, new_dob.strftime("%Y-%m-%d") if new_dob else None, user[1])
-        )
-        commit_and_sync(conn)
+        supabase.table("users").update({
+            "display_name": new_display,
+            "dob": new_dob.strftime("%Y-%m-%d") if new_dob else None
+        }).eq("username", user[1]).execute()
+        repository.invalidate("users")
         st.success("✅ Đã cập nhật hồ sơ.")
         user = list(user)
         user[2] = new_display
@@ -78,28 +89,19 @@ def profile_page(user):
     confirm_pw = st.text_input("Xác nhận mật khẩu mới", type="password", key="pf_cf_pw")
 
     if st.button("✅ Đổi mật khẩu", key="pf_change_pw"):
-        db_pw = c.execute(
-            "SELECT password FROM users WHERE lower(username)=lower(%s)",
-            (user[1],)
-        ).fetchone()
-        if not db_pw or db_pw[0] != hash_password(old_pw):
+        row = find_user_by_username(user[1], columns="password")
+        if not row or row["password"] != hash_password(old_pw):
 
             st.error("⚠️ Mật khẩu hiện tại không đúng.")
         elif new_pw != confirm_pw:
             st.error("⚠️ Mật khẩu mới và xác nhận không khớp.")
         else:
-            c.execute(
-                "UPDATE users SET password=%s WHERE lower(username)=lower(%s)",
-                (hash_password(new_pw), user[1])
-            )
-
-            commit_and_sync(conn)
+            supabase.table("users").update({"password": hash_password(new_pw)}).eq("username", user[1]).execute()
+            sessions.revoke_user(user[1])
             st.success("✅ Đã đổi mật khẩu. Vui lòng đăng nhập lại.")
             logout_user()
             st.rerun()
 
-    conn.close()
-
 
 # ==================== MAIN ====================
 
@@ -137,8 +139,7 @@ def main():
         """, unsafe_allow_html=True
     )
 
-    init_db()
-    init_default_admin()
+    _init_db_once()
 
     if "user" not in st.session_state:
         tab_login, tab_register = st.tabs(["Đăng nhập", "Đăng ký"])
@@ -168,29 +169,12 @@ def main():
                 elif new_pass != confirm_pass:
                     st.error("⚠️ Mật khẩu nhập lại không khớp")
                 else:
-                    conn, c = get_connection()
                     try:
-                        existed = c.execute(
-                            "SELECT 1 FROM users WHERE lower(username)=lower(%s)",
-                            (new_user.strip(),)
-                        ).fetchone()
-                        if existed:
-                            st.error("⚠️ Tên đăng nhập đã tồn tại.")
-                        else:
-                            c.execute(
-                                "INSERT INTO users (username, display_name, dob, password, role) VALUES (%s, %s, %s, %s, %s)",
-                                (
-                                    new_user.strip(),
-                                    new_display or new_user.strip(),
-                                    new_dob.strftime("%Y-%m-%d"),
-                                    hash_password(new_pass),  # ✅ dùng hàm hash_password
-                                    "user",
-                                )
-                            )
-                            commit_and_sync(conn)
-                            st.success("✅ Đăng ký thành công! Hãy đăng nhập.")
-                    finally:
-                        conn.close()
+                        register_user(new_user, new_display, new_dob, new_pass, role="user")
+                        repository.invalidate("users")
+                        st.success("✅ Đăng ký thành công! Hãy đăng nhập.")
+                    except UsernameTakenError:
+                        st.error("⚠️ Tên đăng nhập đã tồn tại.")
     else:
         user = st.session_state["user"]
         role = user[5]
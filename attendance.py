@@ -0,0 +1,261 @@
+# attendance.py
+import json
+import time
+
+import pandas as pd
+
+from auth import get_connection
+import db_client
+
+
+# ==================== LƯU TRỮ ====================
+# - attendance_monthly: 1 dòng cho mỗi (username, month), cột data chỉ chứa dữ liệu của tháng đó
+#   (dict mã ngày {"01": "K", ...}, riêng user "NoteData" là chuỗi ghi chú tháng).
+# - attendance_new (cũ): 1 dòng / user, mọi tháng nằm trong blob JSON data.
+#   Chỉ còn dùng để đọc dự phòng khi attendance_monthly chưa được tạo / chưa backfill xong.
+# - attendance_cutover: có dòng = đã backfill xong → thôi đọc / ghi blob cũ.
+# Chuyển dữ liệu: migrations/attendance_monthly.sql rồi python -m migrations.attendance_monthly
+
+MONTHLY_TABLE = "attendance_monthly"
+LEGACY_TABLE = "attendance_new"
+CUTOVER_TABLE = "attendance_cutover"
+NOTE_USER = "NoteData"
+
+# True = đã backfill xong (ghi nhớ mãi); chưa xong thì kiểm tra lại sau CUTOVER_RECHECK giây
+_cutover_done = False
+_cutover_checked_at = None
+CUTOVER_RECHECK = 300
+
+
+# ==================== ĐỌC BLOB JSON CỦA attendance_new ====================
+
+def parse_json_blob(value) -> dict:
+    """Cột data có thể là dict hoặc chuỗi JSON (dữ liệu cũ) → luôn trả về dict."""
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+            return parsed if isinstance(parsed, dict) else {}
+        except Exception:
+            return {}
+    return {}
+
+
+def month_value(value):
+    """Giá trị của 1 tháng: dict mã ngày (có thể bị lưu thành chuỗi JSON) hoặc chuỗi ghi chú."""
+    if isinstance(value, str) and value.startswith("{"):
+        return parse_json_blob(value)
+    return value
+
+
+def _load_month_from_legacy(supabase, month_str: str, skip_users=()) -> dict:
+    """Tháng month_str trong blob cũ; bỏ qua skip_users (đã có dòng ở attendance_monthly)."""
+    query = supabase.table(LEGACY_TABLE).select("username, data")
+    if skip_users:
+        query = query.not_.in_("username", list(skip_users))
+    res = query.execute()
+    month_map = {}
+    for rec in res.data or []:
+        value = parse_json_blob(rec.get("data")).get(month_str)
+        if value is not None:
+            month_map[str(rec["username"]).strip()] = month_value(value)
+    return month_map
+
+
+# ==================== ĐỌC THEO THÁNG ====================
+
+def legacy_retired(supabase) -> bool:
+    """Đã backfill xong sang attendance_monthly chưa (bảng attendance_cutover có dòng)."""
+    global _cutover_done, _cutover_checked_at
+    if _cutover_done:
+        return True
+    now = time.monotonic()
+    if _cutover_checked_at is not None and now - _cutover_checked_at < CUTOVER_RECHECK:
+        return False
+    try:
+        res = supabase.table(CUTOVER_TABLE).select("id").limit(1).execute()
+        _cutover_done = bool(res.data)
+    except Exception as e:
+        if not db_client.is_missing_table(e):
+            raise
+    _cutover_checked_at = now
+    return _cutover_done
+
+
+def load_attendance_month(month_str: str) -> dict:
+    """
+    Dữ liệu chấm công của đúng 1 tháng: {username: giá trị của tháng}.
+    Gộp theo từng user: blob cũ làm nền, dòng của attendance_monthly ghi đè.
+    Khi chưa backfill hết, các user chưa từng được lưu vào bảng mới vẫn giữ dữ liệu cũ
+    (nếu chỉ đọc bảng mới, họ sẽ hiện mã mặc định "K" và lần lưu sau ghi đè dữ liệu thật).
+    Backfill xong thì chỉ đọc bảng mới.
+    """
+    supabase = get_connection()
+    try:
+        res = supabase.table(MONTHLY_TABLE).select("username, data").eq("month", month_str).execute()
+        monthly = {str(r["username"]).strip(): month_value(r.get("data")) for r in res.data or []}
+    except Exception as e:
+        if not db_client.is_missing_table(e):
+            raise
+        return _load_month_from_legacy(supabase, month_str)
+
+    if legacy_retired(supabase):
+        return monthly
+
+    # Chỉ tải blob của các user chưa có dòng tháng này ở bảng mới
+    month_map = _load_month_from_legacy(supabase, month_str, skip_users=monthly)
+    month_map.update(monthly)
+    return month_map
+
+
+# ==================== BẢNG THÁNG & THỐNG KÊ ====================
+
+WEEKDAY_LABELS = ["T2", "T3", "T4", "T5", "T6", "T7", "CN"]
+
+# Các mã được thống kê riêng trên trang chấm công
+SUMMARY_CODES = ["K", "P", "L", "H", "K:2"]
+
+
+def day_column(d) -> str:
+    """Tên cột ngày trên grid, vd "01/11 (T7)"."""
+    return f"{d.strftime('%d')}/{d.strftime('%m')} ({WEEKDAY_LABELS[d.weekday()]})"
+
+
+def build_month_grid(df_users: pd.DataFrame, month_map: dict, days: pd.DatetimeIndex, today_date) -> pd.DataFrame:
+    """
+    Bảng users × ngày của 1 tháng (cột username, User, rồi các cột ngày).
+    - Ô đã lưu → giữ nguyên mã
+    - Ô chưa lưu: ngày thường đã qua → "K", còn lại → ""
+    Pivot toàn bộ dữ liệu đã lưu trong 1 lần thay vì lọc theo từng user.
+    """
+    day_keys = days.strftime("%d")
+
+    saved = pd.DataFrame(
+        [(u, k, v) for u, m in month_map.items() if isinstance(m, dict) for k, v in m.items()],
+        columns=["username", "day", "code"]
+    )
+    usernames = df_users["username"].astype(str).str.strip()
+    grid = (
+        saved.pivot(index="username", columns="day", values="code")
+        .reindex(index=usernames, columns=day_keys)
+    )
+
+    defaults = pd.Series(
+        ["K" if (d.date() <= today_date and d.weekday() < 5) else "" for d in days],
+        index=day_keys
+    )
+    grid = grid.fillna(defaults)
+    grid.columns = [day_column(d) for d in days]
+
+    grid.insert(0, "User", df_users["display_name"].values)
+    grid.insert(0, "username", df_users["username"].values)
+    return grid.reset_index(drop=True)
+
+
+def count_codes(grid: pd.DataFrame, day_cols: list[str]) -> pd.DataFrame:
+    """
+    Đếm số ngày theo từng mã cho mỗi dòng (index giống grid).
+    Mã ghép như "K/P" được tính nửa ngày cho mỗi mã.
+    """
+    long = grid[day_cols].rename_axis("row").reset_index().melt(id_vars="row", value_name="code")
+    codes = long["code"].fillna("").astype(str).str.strip().str.upper()
+    long = long.assign(code=codes)[codes != ""]
+    if long.empty:
+        return pd.DataFrame(index=grid.index)
+
+    parts = long["code"].str.split("/")
+    long = long.assign(code=parts, weight=1.0 / parts.str.len()).explode("code", ignore_index=True)
+
+    counts = pd.crosstab(long["row"], long["code"], values=long["weight"], aggfunc="sum")
+    return counts.reindex(index=grid.index).fillna(0)
+
+
+def month_summary(grid: pd.DataFrame) -> pd.DataFrame:
+    """Thống kê tổng hợp của tháng: Tổng K, P, L, H, K:2 và Tổng Công (= K + H + P)."""
+    day_cols = [c for c in grid.columns if "/" in c]
+    counts = count_codes(grid, day_cols).reindex(columns=SUMMARY_CODES, fill_value=0)
+
+    summary = pd.DataFrame({"User": grid["User"]})
+    for code in SUMMARY_CODES:
+        summary[f"Tổng {code}"] = counts[code].values
+    summary["Tổng Công"] = summary["Tổng K"] + summary["Tổng H"] + summary["Tổng P"]
+    return summary
+
+
+# ==================== LƯU THEO THÁNG (1 REQUEST) ====================
+
+# Emoji / ô màu bị dán lẫn vào mã chấm công (🟩, 🟥, ⬛, ...)
+_EMOJI_RE = r"[\U0001F300-\U0001FAFF⬛]"
+
+
+def month_codes_by_user(grid: pd.DataFrame, day_cols: list[str], selected_month, today_date) -> dict:
+    """
+    Mã chấm công của cả bảng: {username: {"01": "K", ...}}, chỉ lấy các ngày <= hôm nay.
+    Làm sạch emoji cho toàn bộ bảng 1 lần thay vì từng ô.
+    """
+    day_of = {col: int(col.split("/")[0]) for col in day_cols}
+    past_cols = [c for c in day_cols if selected_month.replace(day=day_of[c]) <= today_date]
+
+    values = (
+        grid[past_cols]
+        .fillna("")
+        .astype(str)
+        .replace(_EMOJI_RE, "", regex=True)
+        .apply(lambda col: col.str.strip())
+    )
+    values.columns = [f"{day_of[c]:02d}" for c in past_cols]
+    return dict(zip(grid["username"], values.to_dict("records")))
+
+
+def _save_month_to_legacy(supabase, month_str: str, entries: dict):
+    """Gộp blob ở client (chỉ tải blob của các user cần ghi) rồi upsert 1 lần."""
+    res = supabase.table(LEGACY_TABLE).select("username, data, months") \
+        .in_("username", list(entries)).execute()
+    existing = {str(r["username"]).strip(): r for r in res.data or []}
+
+    rows = []
+    for uname, value in entries.items():
+        rec = existing.get(str(uname).strip(), {})
+        data_all = dict(parse_json_blob(rec.get("data")))
+        months = list(rec.get("months", []) or [])
+        data_all[month_str] = value
+        if month_str not in months:
+            months.append(month_str)
+        rows.append({"username": uname, "data": data_all, "months": months})
+
+    supabase.table(LEGACY_TABLE).upsert(rows, on_conflict="username").execute()
+
+
+def save_attendance_month(month_str: str, entries: dict):
+    """
+    Ghi dữ liệu tháng month_str cho nhiều user trong 1 request.
+    - entries: {username: giá trị của tháng} — chỉ truyền các user có thay đổi
+    - Ưu tiên RPC save_attendance_month (ghi attendance_monthly và đúng key
+      data[month_str] của blob cũ trong cùng 1 giao dịch, blob cũ thôi được ghi khi đã backfill xong);
+      nếu DB chưa có hàm thì upsert thẳng vào attendance_monthly,
+      và nếu bảng này cũng chưa có thì gộp vào blob cũ.
+    """
+    if not entries:
+        return
+
+    supabase = get_connection()
+    payload = [{"username": u, "value": v} for u, v in entries.items()]
+    try:
+        supabase.rpc("save_attendance_month", {"month_str": month_str, "entries": payload}).execute()
+        return
+    except Exception as e:
+        if not db_client.is_missing_function(e):
+            raise
+
+    try:
+        supabase.table(MONTHLY_TABLE).upsert(
+            [{"username": u, "month": month_str, "data": v} for u, v in entries.items()],
+            on_conflict="username,month"
+        ).execute()
+        return
+    except Exception as e:
+        if not db_client.is_missing_table(e):
+            raise
+
+    _save_month_to_legacy(supabase, month_str, entries)
@@ -0,0 +1,224 @@
+"""
+Sinh dữ liệu giả lập có seed (cùng seed + scale → cùng dữ liệu) cho các benchmark:
+users, projects, project_members, job_catalog (cây đầu mục / công việc), tasks
+(công nhật có cột giờ riêng lẫn dòng cũ ghi giờ trong note "⏰ ...") và blob
+chấm công attendance_new theo tháng.
+
+    python -m benchmarks.datagen --scale 10
+"""
+import argparse
+import json
+import random
+import unicodedata
+from datetime import date, datetime, time, timedelta
+
+import auth
+
+# Kích thước ở scale 1 (scale N → nhân N, riêng job_catalog giữ nguyên)
+BASE = {
+    "users": 20,
+    "projects": 8,
+    "tasks": 1000,
+}
+
+YEAR = 2025
+MONTHS = [f"{YEAR}-{m:02d}" for m in range(1, 13)]
+
+_HO = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ"]
+_DEM = ["Văn", "Thị", "Hữu", "Minh", "Quang", "Thanh", "Ngọc", "Đức"]
+_TEN = ["An", "Bình", "Cường", "Dũng", "Hà", "Hải", "Hùng", "Lan", "Linh", "Long", "Mai", "Nam",
+        "Phong", "Quân", "Sơn", "Tâm", "Thảo", "Trang", "Tuấn", "Yến"]
+
+_PROJECT_KINDS = ["Đường", "Cầu", "Khu dân cư", "Trạm bơm", "Kênh", "Nhà máy", "Trường học"]
+_PLACES = ["Bình Dương", "Long An", "Đồng Nai", "Cần Thơ", "Huế", "Đà Nẵng", "Quảng Ngãi", "Hà Nam"]
+
+# Đầu mục → công việc con, đơn vị
+_GROUP_JOBS = {
+    "Khảo sát": (["Khảo sát địa hình", "Khảo sát địa chất", "Khảo sát thủy văn"], "Km"),
+    "Thiết kế cơ sở": (["Bình đồ", "Trắc dọc", "Trắc ngang", "Thuyết minh"], "m"),
+    "Thiết kế BVTC": (["Bản vẽ kết cấu", "Bản vẽ kiến trúc", "Dự toán"], "cái"),
+    "Hồ sơ thầu": (["Hồ sơ mời thầu", "Đánh giá thầu"], "cái"),
+}
+_PUBLIC_JOBS = {
+    "Hành chính": (["Họp", "Văn thư", "Đào tạo"], "Công"),
+    "Hỗ trợ dự án": (["Kiểm tra hồ sơ", "Đi công trường", "In ấn"], "Công"),
+}
+
+_NOTES = ["", "", "", "làm thêm", "đi hiện trường", "họp với chủ đầu tư", "sửa hồ sơ", "chờ số liệu"]
+_ATTENDANCE_CODES = ["K"] * 16 + ["P", "L", "H", "K:2", "K/P", "🟩K", ""]
+
+
+def _username(i: int, rnd: random.Random) -> tuple[str, str]:
+    ho, dem, ten = rnd.choice(_HO), rnd.choice(_DEM), rnd.choice(_TEN)
+    display = f"{ho} {dem} {ten}"
+    # Bỏ dấu: "Đặng" → "dang"
+    plain = unicodedata.normalize("NFD", f"{ten}.{ho}".replace("Đ", "D").replace("đ", "d"))
+    plain = "".join(c for c in plain if not unicodedata.combining(c)).lower()
+    return f"{plain}{i:04d}", display
+
+
+def _job_catalog() -> list[dict]:
+    rows = []
+    for project_type, tree in [("group", _GROUP_JOBS), ("public", _PUBLIC_JOBS)]:
+        for parent, (children, unit) in tree.items():
+            parent_id = len(rows) + 1
+            rows.append({"id": parent_id, "name": parent, "unit": unit, "parent_id": None,
+                         "project_type": project_type})
+            for child in children:
+                rows.append({"id": len(rows) + 1, "name": child, "unit": unit, "parent_id": parent_id,
+                             "project_type": project_type})
+    # Dữ liệu cũ: vài đầu mục chưa có project_type
+    rows[0]["project_type"] = None
+    return rows
+
+
+def _work_day(rnd: random.Random) -> date:
+    d = date(YEAR, 1, 1) + timedelta(days=rnd.randrange(365))
+    while d.weekday() >= 5:
+        d -= timedelta(days=1)
+    return d
+
+
+def _time_slot(rnd: random.Random) -> tuple[time, time, int]:
+    start = time(rnd.choice([7, 8, 8, 8, 9, 13, 17]), rnd.choice([0, 0, 15, 30, 45]))
+    end = time(rnd.choice([11, 12, 16, 17, 17, 18, 21]), rnd.choice([0, 0, 15, 30]))
+    # 1 số công nhật kéo dài nhiều ngày
+    extra_days = rnd.choice([0] * 12 + [1, 2, 5])
+    return start, end, extra_days
+
+
+def generate(scale: int = 1, seed: int = 42) -> dict:
+    """Dữ liệu giả lập: {tên bảng: [dòng dict]}."""
+    rnd = random.Random(seed * 1000 + scale)
+    n_users = BASE["users"] * scale
+    n_projects = BASE["projects"] * scale
+    n_tasks = BASE["tasks"] * scale
+
+    # ---- users ----
+    users = []
+    password = auth.hash_password("123456")
+    for i in range(n_users):
+        username, display = _username(i, rnd)
+        role = "admin" if i == 0 else ("Chủ nhiệm dự án" if i % 7 == 1 else "user")
+        users.append({
+            "id": i + 1, "stt": i + 1, "username": username, "username_key": username,
+            "display_name": display,
+            "dob": (date(1970, 1, 1) + timedelta(days=rnd.randrange(12000))).isoformat(),
+            "password": password, "role": role,
+            "project_manager_of": None, "project_leader_of": None,
+        })
+
+    # ---- projects (~1/4 là public: công nhật) ----
+    projects = []
+    for i in range(n_projects):
+        project_type = "public" if i % 4 == 0 else "group"
+        projects.append({
+            "id": i + 1,
+            "name": f"DA{i + 1:04d} {rnd.choice(_PROJECT_KINDS)} {rnd.choice(_PLACES)}",
+            "deadline": (date(YEAR, 6, 30) + timedelta(days=rnd.randrange(365))).isoformat(),
+            "project_type": project_type if i % 9 else None,     # dữ liệu cũ: NULL = group
+            "design_step": rnd.choice(["TKCS", "TKKT", "BVTC", None]),
+        })
+
+    # ---- thành viên quản lý (bảng mới + CSV cũ trong users) ----
+    members = []
+    managers = [u for u in users if u["role"] == "Chủ nhiệm dự án"] or users[:1]
+    for p in projects:
+        for role, u in [("manager", rnd.choice(managers)), ("leader", rnd.choice(users))]:
+            members.append({"username": u["username"], "project_id": p["id"], "role": role})
+            col = "project_manager_of" if role == "manager" else "project_leader_of"
+            u[col] = "|".join(filter(None, [u[col], p["name"]]))
+
+    # ---- job_catalog ----
+    jobs = _job_catalog()
+    jobs_by_type = {
+        t: [j for j in jobs if (j["project_type"] or "group") == t and j["parent_id"] is not None]
+        for t in ("group", "public")
+    }
+
+    # ---- tasks ----
+    tasks = []
+    created = datetime(YEAR, 1, 1)
+    for i in range(n_tasks):
+        p = projects[rnd.randrange(n_projects)]
+        is_public = p["project_type"] == "public"
+        job = rnd.choice(jobs_by_type["public" if is_public else "group"])
+        assignee = users[min(int(rnd.paretovariate(1.2)) - 1, n_users - 1)]["username"] \
+            if rnd.random() < 0.5 else rnd.choice(users)["username"]
+        start_date = _work_day(rnd)
+        row = {
+            "id": i + 1, "project": p["name"], "project_id": p["id"],
+            "task": job["name"], "job_id": job["id"], "assignee": assignee,
+            "khoi_luong": 0.0, "progress": rnd.choice([0, 0, 25, 50, 75, 100, 100, None]),
+            "deadline": p["deadline"], "note": rnd.choice(_NOTES),
+            "approved": rnd.choice([True, False, None]),
+            "start_date": start_date.isoformat(),
+            "start_time": None, "end_time": None, "end_date": None,
+            "created_at": (created + timedelta(minutes=i)).isoformat(),
+            "updated_at": (created + timedelta(minutes=i)).isoformat(),
+        }
+        if is_public:
+            start, end, extra = _time_slot(rnd)
+            end_date = start_date + timedelta(days=extra)
+            row["khoi_luong"] = auth.calc_hours(start_date, end_date, start, end)
+            if rnd.random() < 0.5:
+                # Dòng cũ: giờ / ngày kết thúc nằm trong note
+                sep = rnd.choice(["→", "-"])
+                row["note"] = (f"⏰ {start.strftime('%H:%M')} - {end.strftime('%H:%M')} "
+                               f"({start_date.isoformat()} {sep} {end_date.isoformat()}) {row['note']}").strip()
+            else:
+                row.update(start_time=start.strftime("%H:%M:%S"), end_time=end.strftime("%H:%M:%S"),
+                           end_date=end_date.isoformat())
+        else:
+            row["khoi_luong"] = round(rnd.uniform(0.5, 50), 2)
+        tasks.append(row)
+
+    # ---- attendance_new: 1 blob JSON / user, mỗi tháng 1 dict mã ngày ----
+    attendance = []
+    for u in users:
+        data = {}
+        for month in MONTHS:
+            if rnd.random() < 0.15:
+                continue
+            first = date.fromisoformat(f"{month}-01")
+            days = {}
+            d = first
+            while d.month == first.month:
+                if d.weekday() < 5 or rnd.random() < 0.05:
+                    days[f"{d.day:02d}"] = rnd.choice(_ATTENDANCE_CODES)
+                d += timedelta(days=1)
+            data[month] = days
+        # Dữ liệu cũ: nửa số blob lưu thành chuỗi JSON
+        attendance.append({
+            "username": u["username"],
+            "data": json.dumps(data, ensure_ascii=False) if rnd.random() < 0.5 else data,
+            "months": sorted(data),
+        })
+    attendance.append({
+        "username": "NoteData",
+        "data": {m: f"Ghi chú tháng {m}" for m in MONTHS},
+        "months": list(MONTHS),
+    })
+
+    return {
+        "users": users,
+        "projects": projects,
+        "project_members": members,
+        "job_catalog": jobs,
+        "tasks": tasks,
+        "attendance_new": attendance,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu giả lập")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for name, rows in generate(args.scale, args.seed).items():
+        print(f"{name:16s} {len(rows):>8d} dòng")
+
+
+if __name__ == "__main__":
+    main()
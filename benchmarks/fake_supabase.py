@@ -0,0 +1,362 @@
+"""
+Backend Supabase giả lập trong bộ nhớ: cùng cách gọi với query builder của
+supabase-py (phần app đang dùng), đủ để chạy các đường dữ liệu của app mà
+không cần mạng.
+
+    fake = FakeSupabase(datagen.generate(10), latency=0.02)
+    fake.table("tasks").select("*", count="exact").eq("project", p).range(0, 199).execute()
+
+- Bộ lọc: eq, neq, in_, ilike, like, lt, lte, gt, gte, is_, or_ ("col.op.val,..."), not_
+- Sắp xếp / giới hạn: order(col, desc=), limit, range; select("*, projects(name)") nhúng bảng cha qua <bảng>_id
+- Ghi: insert, update, upsert(on_conflict=), delete
+- Bảng không có → lỗi PGRST205; RPC chưa đăng ký → lỗi PGRST202 (app tự chuyển sang đường dự phòng)
+- latency: độ trễ giả lập mỗi request (giây); requests: số request theo (bảng, thao tác)
+"""
+import copy
+import operator
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code: str, message: str):
+        self.code = code
+        self.message = message
+        super().__init__(f"{code}: {message}")
+
+
+def _coerce(value: str):
+    """Giá trị trong chuỗi or_() → kiểu Python."""
+    low = value.lower()
+    if low in ("null", "none"):
+        return None
+    if low in ("true", "false"):
+        return low == "true"
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+def _like(pattern: str, flags=0):
+    parts = re.split(r"(\\.|%|_)", pattern)
+    regex = "".join(
+        ".*" if p == "%" else "." if p == "_" else re.escape(p[1:]) if p.startswith("\\") else re.escape(p)
+        for p in parts
+    )
+    return re.compile(f"^{regex}$", flags | re.DOTALL)
+
+
+_ORDERING = {"lt": operator.lt, "lte": operator.le, "gt": operator.gt, "gte": operator.ge}
+
+
+def _compare(op: str, a, b) -> bool:
+    if op == "is":
+        return a is b if b is None or isinstance(b, bool) else a == b
+    if a is None:
+        return False
+    if op == "eq":
+        return a == b
+    if op == "neq":
+        return a != b
+    if op == "in":
+        return a in b
+    if op == "like":
+        return bool(_like(str(b)).match(str(a)))
+    if op == "ilike":
+        return bool(_like(str(b), re.IGNORECASE).match(str(a)))
+    if isinstance(a, (int, float)) and isinstance(b, str):
+        b = _coerce(b)
+    elif isinstance(a, str) and not isinstance(b, str):
+        b = str(b)
+    return _ORDERING[op](a, b)
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeSupabase", table: str):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._count = None
+        self._filters = []
+        self._order = []
+        self._offset = 0
+        self._limit = None
+        self._payload = None
+        self._on_conflict = None
+        self._negate = False
+
+    # ---------- thao tác ----------
+    def select(self, columns: str = "*", count: str = None):
+        if self._op == "select":
+            self._columns = columns
+        self._count = count
+        return self
+
+    def insert(self, rows):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def update(self, fields: dict):
+        self._op, self._payload = "update", fields
+        return self
+
+    def upsert(self, rows, on_conflict: str = None):
+        self._op, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    # ---------- bộ lọc ----------
+    def _add(self, op: str, column: str, value):
+        self._filters.append((self._negate, lambda row: _compare(op, row.get(column), value), op, column, value))
+        self._negate = False
+        return self
+
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def eq(self, column, value):
+        return self._add("eq", column, value)
+
+    def neq(self, column, value):
+        return self._add("neq", column, value)
+
+    def in_(self, column, values):
+        return self._add("in", column, set(values))
+
+    def like(self, column, pattern):
+        return self._add("like", column, pattern)
+
+    def ilike(self, column, pattern):
+        return self._add("ilike", column, pattern)
+
+    def lt(self, column, value):
+        return self._add("lt", column, value)
+
+    def lte(self, column, value):
+        return self._add("lte", column, value)
+
+    def gt(self, column, value):
+        return self._add("gt", column, value)
+
+    def gte(self, column, value):
+        return self._add("gte", column, value)
+
+    def is_(self, column, value):
+        return self._add("is", column, _coerce(value) if isinstance(value, str) else value)
+
+    def or_(self, filters: str):
+        conds = []
+        for part in filters.split(","):
+            column, op, value = part.split(".", 2)
+            negate = op == "not"
+            if negate:
+                op, value = value.split(".", 1)
+            conds.append((negate, column, op, _coerce(value)))
+
+        def match(row):
+            return any(_compare(op, row.get(col), val) != neg for neg, col, op, val in conds)
+        self._filters.append((self._negate, match, "or", None, None))
+        self._negate = False
+        return self
+
+    # ---------- sắp xếp / giới hạn ----------
+    def order(self, column: str, desc: bool = False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    # ---------- thực thi ----------
+    def _matches(self, row) -> bool:
+        return all(f(row) != neg for neg, f, *_ in self._filters)
+
+    def _candidates(self, rows: list) -> list:
+        """Các dòng cần xét: dùng index băm theo cột cho bộ lọc eq / in_ đầu tiên (như index trên DB)."""
+        for neg, _, op, column, value in self._filters:
+            if neg or op not in ("eq", "in"):
+                continue
+            index = self._db._column_index(self._table, column)
+            if index is None:
+                break
+            try:
+                positions = index.get(value, []) if op == "eq" else \
+                    sorted(p for v in value for p in index.get(v, []))
+            except TypeError:
+                break
+            return [rows[p] for p in positions]
+        return rows
+
+    def _projector(self):
+        """Hàm dòng → dict theo danh sách cột của select (phân tích chuỗi cột 1 lần)."""
+        cols = [c.strip() for c in re.split(r",(?![^()]*\))", self._columns) if c.strip()]
+        star = "*" in cols
+        plain, embeds = [], []
+        for col in cols:
+            m = re.match(r"^(\w+)\((.*)\)$", col)
+            if m:
+                parent = m.group(1)
+                embeds.append((parent, parent.rstrip("s") + "_id", [s.strip() for s in m.group(2).split(",")],
+                               self._db._index(parent)))
+            elif col != "*":
+                plain.append(col)
+
+        def project(row: dict) -> dict:
+            out = dict(row) if star else {}
+            for col in plain:
+                if col not in row:
+                    raise FakeAPIError("42703", f"column {self._table}.{col} does not exist")
+                out[col] = row[col]
+            for parent, fk, sub, index in embeds:
+                target = index.get(row.get(fk))
+                out[parent] = {k: target.get(k) for k in sub} if target else None
+            return out
+        return project
+
+    def execute(self):
+        db = self._db
+        db._hit(self._table, self._op)
+        with db._lock:
+            rows = db._rows(self._table)
+            if self._op == "insert":
+                return SimpleNamespace(data=db._insert(self._table, self._payload), count=None)
+            if self._op == "upsert":
+                return SimpleNamespace(data=db._upsert(self._table, self._payload, self._on_conflict), count=None)
+
+            matched = [r for r in self._candidates(rows) if self._matches(r)]
+            if self._op == "update":
+                for r in matched:
+                    r.update(self._payload)
+                db._invalidate(self._table)
+                return SimpleNamespace(data=copy.deepcopy(matched), count=None)
+            if self._op == "delete":
+                ids = {id(r) for r in matched}
+                rows[:] = [r for r in rows if id(r) not in ids]
+                db._invalidate(self._table)
+                return SimpleNamespace(data=copy.deepcopy(matched), count=None)
+
+            for column, desc in reversed(self._order):
+                matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+            total = len(matched) if self._count else None
+            end = None if self._limit is None else self._offset + self._limit
+            page = matched[self._offset:end]
+            project = self._projector()
+            return SimpleNamespace(data=[project(r) for r in page], count=total)
+
+
+class FakeSupabase:
+    def __init__(self, tables: dict, latency: float = 0.0, rpcs: dict = None):
+        self._tables = {name: [dict(r) for r in rows] for name, rows in tables.items()}
+        self._indexes = {}
+        self._rpcs = dict(rpcs or {})
+        self._lock = threading.RLock()
+        self.latency = latency
+        self.requests = Counter()
+
+    def _hit(self, table: str, op: str):
+        with self._lock:
+            self.requests[(table, op)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _rows(self, table: str) -> list:
+        if table not in self._tables:
+            raise FakeAPIError("PGRST205", f"Could not find the table 'public.{table}' in the schema cache")
+        return self._tables[table]
+
+    def _index(self, table: str) -> dict:
+        """id → dòng (dùng cho select nhúng bảng cha)."""
+        return self._column_index(table, "id", unique=True)
+
+    def _column_index(self, table: str, column: str, unique: bool = False):
+        """giá trị → [vị trí dòng] (hoặc → dòng nếu unique); None nếu cột có giá trị không băm được."""
+        key = (table, column, unique)
+        idx = self._indexes.get(key)
+        if idx is None:
+            idx = {}
+            try:
+                for pos, r in enumerate(self._rows(table)):
+                    if unique:
+                        idx[r.get(column)] = r
+                    else:
+                        idx.setdefault(r.get(column), []).append(pos)
+            except TypeError:
+                return None
+            self._indexes[key] = idx
+        return idx
+
+    def _invalidate(self, table: str):
+        for key in [k for k in self._indexes if k[0] == table]:
+            del self._indexes[key]
+
+    def _insert(self, table: str, payload):
+        rows = self._rows(table)
+        items = payload if isinstance(payload, list) else [payload]
+        next_id = max((r.get("id") or 0 for r in rows), default=0) + 1
+        out = []
+        for item in items:
+            rec = dict(item)
+            if "id" not in rec:
+                rec["id"] = next_id
+                next_id += 1
+            rows.append(rec)
+            out.append(dict(rec))
+        self._invalidate(table)
+        return out
+
+    def _upsert(self, table: str, payload, on_conflict: str = None):
+        rows = self._rows(table)
+        keys = [k.strip() for k in (on_conflict or "id").split(",")]
+        existing = {tuple(r.get(k) for k in keys): r for r in rows}
+        out = []
+        for item in payload if isinstance(payload, list) else [payload]:
+            rec = existing.get(tuple(item.get(k) for k in keys))
+            if rec is None:
+                out.extend(self._insert(table, item))
+            else:
+                rec.update(item)
+                out.append(dict(rec))
+        self._invalidate(table)
+        return out
+
+    # ---------- API giống supabase-py ----------
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    from_ = table
+
+    def rpc(self, fn: str, params: dict = None):
+        def execute():
+            self._hit(f"rpc:{fn}", "rpc")
+            handler = self._rpcs.get(fn)
+            if handler is None:
+                raise FakeAPIError("PGRST202", f"Could not find the function public.{fn} in the schema cache")
+            return SimpleNamespace(data=handler(self, **(params or {})), count=None)
+        return SimpleNamespace(execute=execute)
+
+    def rows(self, table: str) -> list:
+        """Bản sao dữ liệu của 1 bảng (để đối chiếu kết quả)."""
+        with self._lock:
+            return copy.deepcopy(self._rows(table))
+
+    def reset_requests(self):
+        with self._lock:
+            self.requests.clear()
@@ -0,0 +1,363 @@
+"""
+Benchmark offline các đường dữ liệu của từng trang, chạy trên FakeSupabase với
+dữ liệu sinh từ datagen ở nhiều quy mô (mặc định 1×, 10×, 100×):
+
+    visible_projects   dự án user thấy được (trang PM / user), 20 user
+    cong_nhat_tab      công nhật của admin: năm / quý / user (quarter_counts) + 1 trang grid
+                       (fetch_page + tách giờ + tính giờ + JSON cho grid)
+    attendance_buffer  bảng chấm công 1 tháng: đọc blob cũ + pivot + thống kê + mã để lưu
+    stats_aggregation  thống kê công việc mọi dự án (đường dự phòng pandas) + gộp nhóm
+    excel_export       xuất công nhật cả năm của các dự án public
+
+Mỗi kịch bản chạy 1 lần làm nóng (dò cột / RPC) rồi đo `--repeat` lần với cache
+trống, lấy trung vị. So với benchmarks/thresholds.json: chậm hơn ngưỡng ms
+hoặc nhiều request hơn ngưỡng → exit code 1.
+Trước khi đo, kiểm tra kết quả khớp nhau giữa các bản cài đặt:
+calc_hours_vectorized ↔ calc_hours, visible_projects dự phòng ↔ SQL, thống kê pandas ↔ SQL,
+quarter_counts pandas ↔ SQL.
+
+    python -m benchmarks.scenarios
+    python -m benchmarks.scenarios --scales 1 10 --latency 0.02     # giả lập round-trip 20ms
+    python -m benchmarks.scenarios --update-thresholds              # ghi lại ngưỡng (ms × SLACK)
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import date, datetime
+
+import pandas as pd
+
+import attendance
+import auth
+import db_client
+import project_members
+import project_service
+import repository
+import storage
+import task_stats
+import task_store
+import timesheet
+import cong_export
+from benchmarks import datagen
+from benchmarks.fake_supabase import FakeSupabase
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+# Ngưỡng ms = thời gian đo được × SLACK (máy CI chậm hơn / dao động)
+SLACK = 3.0
+
+SAMPLE_USERS = 20
+QUARTER = (date(datagen.YEAR, 4, 1), date(datagen.YEAR, 6, 30))
+MONTH = date(datagen.YEAR, 3, 1)
+TODAY = date(datagen.YEAR, 12, 31)
+
+
+# ==================== CÀI BACKEND GIẢ LẬP ====================
+
+def _reset_caches():
+    repository.invalidate()
+    task_store.invalidate_project()
+    project_service.invalidate_visible()
+
+
+def _reset_probes():
+    task_store._id_columns_available = None
+    task_store._quarter_rpc_available = None
+    timesheet._columns_available = None
+    project_members._table_available = None
+    project_service._rpc_available = None
+    project_service._visible_rpc_available = None
+    task_stats._rpc_available = None
+    attendance._cutover_done = False
+    attendance._cutover_checked_at = None
+
+
+def install(fake: FakeSupabase):
+    """Mọi get_connection() trả về fake (qua lớp bọc db_client như khi chạy thật)."""
+    auth.supabase = db_client.ClientProxy(fake)
+    _reset_probes()
+    _reset_caches()
+
+
+# ==================== KỊCH BẢN ====================
+
+class Context:
+    def __init__(self, data: dict):
+        self.data = data
+        users = data["users"]
+        self.user_map = {u["username"]: u["display_name"] for u in users}
+        self.sample_users = [u["username"] for u in users[:SAMPLE_USERS]]
+
+        public = {p["name"] for p in data["projects"] if p["project_type"] == "public"}
+        self.public_projects = sorted(public)
+
+        # Dự án public + user có nhiều công nhật nhất trong quý (trường hợp nặng nhất của grid)
+        counts = {}
+        for t in data["tasks"]:
+            if t["project"] in public and QUARTER[0].isoformat() <= t["start_date"] <= QUARTER[1].isoformat():
+                key = (t["project"], t["assignee"])
+                counts[key] = counts.get(key, 0) + 1
+        self.cong_project, self.cong_user = max(counts, key=counts.get)
+        self.all_projects = [p["name"] for p in data["projects"]]
+
+
+def scenario_visible_projects(ctx: Context) -> int:
+    rows = 0
+    for username in ctx.sample_users:
+        rows += len(project_service.visible_projects(username, include_managed=True))
+    return rows
+
+
+def scenario_cong_nhat_tab(ctx: Context) -> int:
+    # Giống phần "Công nhật" của admin_app: ô chọn năm / quý / user, rồi 1 trang của user đang chọn
+    task_store.quarter_counts(ctx.cong_project)
+    df_user, _ = task_store.fetch_page(
+        ctx.cong_project, assignee=ctx.cong_user, date_from=QUARTER[0], date_to=QUARTER[1], page=0
+    )
+    df_user["Ngày_dt"] = pd.to_datetime(df_user["start_date"], errors="coerce").dt.date
+    times = timesheet.time_fields(df_user)
+    df_display = pd.DataFrame({
+        "ID": df_user["id"],
+        "Ngày": df_user["Ngày_dt"].astype(str),
+        "Công việc": df_user["task"],
+        "Giờ bắt đầu": times["start_time"],
+        "Giờ kết thúc": times["end_time"],
+        "Khối lượng (giờ)": pd.to_numeric(df_user["khoi_luong"], errors="coerce").fillna(0).astype(float),
+        "Ghi chú": times["text"],
+        "approved": df_user["approved"].fillna(False).astype(bool),
+    })
+    auth.calc_hours_vectorized(times)
+    # AG-Grid gửi dữ liệu xuống trình duyệt dạng JSON records
+    df_display.to_json(orient="records", force_ascii=False)
+    return len(df_display)
+
+
+def scenario_attendance_buffer(ctx: Context) -> int:
+    # Giống trang "Chấm công – Nghỉ phép": bảng tháng, thống kê, mã chấm công để lưu
+    month_map = attendance.load_attendance_month(MONTH.strftime("%Y-%m"))
+    df_users = repository.load_users()
+    next_month = date(MONTH.year + MONTH.month // 12, MONTH.month % 12 + 1, 1)
+    days = pd.date_range(MONTH, next_month - pd.Timedelta(days=1))
+    grid = attendance.build_month_grid(df_users, month_map, days, TODAY)
+    day_cols = [c for c in grid.columns if "/" in c]
+    attendance.month_summary(grid)
+    attendance.month_codes_by_user(grid, day_cols, MONTH, TODAY)
+    return len(grid) * len(day_cols)
+
+
+def scenario_stats_aggregation(ctx: Context) -> int:
+    stats = task_stats.load_task_stats(ctx.all_projects)
+    task_stats.rollup(stats, ["project"])
+    task_stats.rollup(stats, ["assignee", "project"], ctx.user_map)
+    return int(stats["total"].sum())
+
+
+def scenario_excel_export(ctx: Context) -> int:
+    content, n_rows = cong_export.export_period(
+        ctx.public_projects, date(datagen.YEAR, 1, 1), date(datagen.YEAR, 12, 31), ctx.user_map
+    )
+    assert content[:2] == b"PK"
+    return n_rows
+
+
+SCENARIOS = {
+    "visible_projects": scenario_visible_projects,
+    "cong_nhat_tab": scenario_cong_nhat_tab,
+    "attendance_buffer": scenario_attendance_buffer,
+    "stats_aggregation": scenario_stats_aggregation,
+    "excel_export": scenario_excel_export,
+}
+
+
+# ==================== KIỂM TRA TƯƠNG ĐƯƠNG ====================
+
+def sqlite_from(data: dict) -> sqlite3.Connection:
+    """SQLite trong bộ nhớ với projects, tasks (có project_id, job_id), project_members, job_catalog."""
+    conn = sqlite3.connect(":memory:")
+    for name in ["projects", "tasks", "project_members", "job_catalog"]:
+        pd.DataFrame(data[name]).to_sql(name, conn, index=False)
+    # Cùng các index như trên Postgres (migrations/*.sql)
+    conn.executescript("""
+        CREATE INDEX tasks_assignee_project_id_idx ON tasks (assignee, project_id);
+        CREATE INDEX tasks_project_idx ON tasks (project);
+        CREATE INDEX project_members_project_id_idx ON project_members (project_id, username);
+        CREATE INDEX job_catalog_name_idx ON job_catalog (name);
+    """)
+    return conn
+
+
+def check_calc_hours(data: dict):
+    """Giờ tách từ cột riêng / note cũ → calc_hours_vectorized = calc_hours từng dòng = khoi_luong lúc sinh."""
+    public = {p["name"] for p in data["projects"] if p["project_type"] == "public"}
+    df = pd.DataFrame([t for t in data["tasks"] if t["project"] in public])
+    times = timesheet.time_fields(df)
+    vectorized = auth.calc_hours_vectorized(times)
+
+    def scalar(row):
+        return auth.calc_hours(
+            date.fromisoformat(row["start_date"]), date.fromisoformat(row["end_date"]),
+            datetime.strptime(row["start_time"], "%H:%M").time(),
+            datetime.strptime(row["end_time"], "%H:%M").time(),
+        )
+    expected = times.apply(scalar, axis=1)
+    bad = (vectorized - expected).abs() > 1e-9
+    assert not bad.any(), times[bad].head()
+    bad = (vectorized - df["khoi_luong"].astype(float)).abs() > 1e-9
+    assert not bad.any(), df[bad].head()
+
+
+def check_visible_projects(data: dict, conn: sqlite3.Connection, sample: list[str]):
+    for username in sample:
+        for include_managed in (True, False):
+            project_service.invalidate_visible()
+            got = project_service.visible_projects(username, include_managed)
+            want = project_service.visible_projects_sqlite(conn, username, include_managed)
+            got_set = set(zip(got["name"], got["managed"].astype(bool)))
+            want_set = set(zip(want["name"], want["managed"].astype(bool)))
+            assert got_set == want_set, (username, include_managed, got_set ^ want_set)
+
+
+def check_task_stats(data: dict, conn: sqlite3.Connection, projects: list[str]):
+    got = task_stats.load_task_stats(projects)
+    want = task_stats.aggregate_sqlite(conn, projects)
+    keys = task_stats.STAT_KEYS
+    numeric = [c for c in task_stats.STAT_COLUMNS if c not in keys]
+    got = got.sort_values(keys).reset_index(drop=True)
+    want = want.sort_values(keys).reset_index(drop=True)
+    assert got[keys].equals(want[keys]), "khác nhóm"
+    diff = (got[numeric].astype(float) - want[numeric].astype(float)).abs().to_numpy().max()
+    assert diff < 1e-9, diff
+    # Bản SQLite lọc theo project_id (như RPC task_stats(project_ids)) cho cùng kết quả
+    ids = [p["id"] for p in data["projects"] if p["name"] in set(projects)]
+    by_id = task_stats.aggregate_sqlite(conn, project_ids=ids).sort_values(keys).reset_index(drop=True)
+    assert by_id[keys].equals(want[keys]), "khác nhóm khi lọc theo project_id"
+
+
+def check_quarter_counts(data: dict, conn: sqlite3.Connection, projects: list[str]):
+    """quarter_counts dự phòng (pandas) ↔ bản SQL của RPC task_quarter_counts."""
+    ids = {p["name"]: p["id"] for p in data["projects"]}
+    keys = ["assignee", "year", "quarter"]
+    for project in projects:
+        got = task_store.quarter_counts(project).sort_values(keys).reset_index(drop=True)
+        want = pd.DataFrame(storage._rpc_task_quarter_counts(conn, ids[project]),
+                            columns=task_store.QUARTER_COLUMNS)
+        want["last_date"] = pd.to_datetime(want["last_date"]).dt.date
+        want = want.sort_values(keys).reset_index(drop=True)
+        assert got.astype(str).equals(want.astype(str)), project
+
+
+def run_checks(data: dict, ctx: Context):
+    conn = sqlite_from(data)
+    check_calc_hours(data)
+    check_visible_projects(data, conn, ctx.sample_users)
+    check_task_stats(data, conn, ctx.all_projects)
+    check_quarter_counts(data, conn, ctx.all_projects[:5])
+    _reset_caches()
+
+
+# ==================== ĐO ====================
+
+def measure(fn, ctx: Context, fake: FakeSupabase, repeat: int) -> dict:
+    fn(ctx)                         # làm nóng: dò cột / RPC chỉ 1 lần / tiến trình
+    timings = []
+    for _ in range(repeat):
+        _reset_caches()
+        fake.reset_requests()
+        t0 = time.perf_counter()
+        rows = fn(ctx)
+        timings.append((time.perf_counter() - t0) * 1000)
+    return {
+        "ms": round(statistics.median(timings), 1),
+        "requests": sum(fake.requests.values()),
+        "rows": rows,
+    }
+
+
+def load_thresholds() -> dict:
+    if not os.path.exists(THRESHOLDS_PATH):
+        return {}
+    with open(THRESHOLDS_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(result: dict, limit: dict, check_time: bool) -> str:
+    if not limit:
+        return "NEW"
+    problems = []
+    if check_time and result["ms"] > limit["ms"]:
+        problems.append(f"SLOW >{limit['ms']}ms")
+    if result["requests"] > limit["requests"]:
+        problems.append(f"REQUESTS >{limit['requests']}")
+    return ", ".join(problems) or "OK"
+
+
+def run(scales: list[int], repeat: int = 3, latency: float = 0.0, seed: int = 42,
+        only: list[str] = None, checks: bool = True) -> list[dict]:
+    results = []
+    original = auth.supabase
+    try:
+        for scale in scales:
+            data = datagen.generate(scale, seed)
+            fake = FakeSupabase(data)
+            install(fake)
+            ctx = Context(data)
+            if checks:
+                run_checks(data, ctx)
+            fake.latency = latency
+            for name, fn in SCENARIOS.items():
+                if only and name not in only:
+                    continue
+                results.append({"scenario": name, "scale": scale, **measure(fn, ctx, fake, repeat)})
+    finally:
+        auth.supabase = original
+        _reset_probes()
+        _reset_caches()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline các đường dữ liệu của app")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="độ trễ giả lập mỗi request (giây)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIOS))
+    parser.add_argument("--no-checks", action="store_true", help="bỏ qua kiểm tra tương đương")
+    parser.add_argument("--update-thresholds", action="store_true")
+    args = parser.parse_args()
+
+    results = run(args.scales, args.repeat, args.latency, args.seed, args.only, not args.no_checks)
+    if not args.no_checks:
+        print("✅ Kiểm tra tương đương: calc_hours, visible_projects, task_stats, quarter_counts khớp nhau")
+
+    thresholds = load_thresholds()
+    # Ngưỡng ms chỉ áp dụng khi không giả lập độ trễ mạng
+    check_time = args.latency == 0
+    failed = False
+    print(f"{'scenario':18s} {'scale':>5s} {'ms':>9s} {'requests':>8s} {'rows':>8s}  status")
+    for r in results:
+        limit = thresholds.get(r["scenario"], {}).get(str(r["scale"]))
+        status = compare(r, limit, check_time)
+        failed |= status not in ("OK", "NEW")
+        print(f"{r['scenario']:18s} {r['scale']:>4d}× {r['ms']:>9.1f} {r['requests']:>8d} {r['rows']:>8d}  {status}")
+
+    if args.update_thresholds:
+        for r in results:
+            thresholds.setdefault(r["scenario"], {})[str(r["scale"])] = {
+                "ms": round(max(r["ms"] * SLACK, 10.0), 1),
+                "requests": r["requests"],
+            }
+        with open(THRESHOLDS_PATH, "w", encoding="utf-8") as f:
+            json.dump(thresholds, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Đã ghi ngưỡng vào {THRESHOLDS_PATH}")
+    elif failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# cong_export.py
+import io
+
+import pandas as pd
+import xlsxwriter
+
+from auth import get_connection
+import timesheet
+import perf
+
+
+# ==================== XUẤT CÔNG NHẬT RA EXCEL ====================
+# - Chỉ dựng file khi người dùng bấm nút (không dựng lại ở mỗi lần rerun)
+# - Tách giờ / ngày bằng timesheet.time_fields (vectorized), không iterrows
+# - Ghi từng dòng vào xlsxwriter ở chế độ constant_memory: bộ nhớ không tăng theo
+#   số dòng, nên xuất cả năm cho nhiều dự án vẫn đọc DB theo trang và ghi dần
+
+EXPORT_COLUMNS = [
+    "User", "Ngày bắt đầu", "Ngày kết thúc", "Công việc",
+    "Giờ bắt đầu", "Giờ kết thúc", "Khối lượng (giờ)", "Ghi chú",
+]
+
+PAGE_SIZE = 1000
+
+COLUMN_WIDTH = 18
+
+
+def export_frame(df: pd.DataFrame, user_map: dict = None, include_project: bool = False,
+                 sort: bool = True) -> pd.DataFrame:
+    """Các dòng tasks (project, assignee, task, khoi_luong, note, start_date, ...) → bảng xuất Excel."""
+    columns = (["Dự án"] if include_project else []) + EXPORT_COLUMNS
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    times = timesheet.time_fields(df)
+    users = df["assignee"].map(user_map).fillna(df["assignee"]) if user_map else df["assignee"]
+
+    out = pd.DataFrame({
+        "Dự án": df["project"] if include_project else None,
+        "User": users,
+        "Ngày bắt đầu": times["start_date"],
+        "Ngày kết thúc": times["end_date"],
+        "Công việc": df["task"],
+        "Giờ bắt đầu": times["start_time"],
+        "Giờ kết thúc": times["end_time"],
+        "Khối lượng (giờ)": pd.to_numeric(df["khoi_luong"], errors="coerce").fillna(0).astype(float),
+        "Ghi chú": times["text"],
+    })[columns]
+
+    if sort:
+        keys = (["Dự án"] if include_project else []) + ["User", "Ngày bắt đầu", "Giờ bắt đầu"]
+        out = out.sort_values(keys).reset_index(drop=True)
+    return out
+
+
+def iter_task_pages(projects: list[str], date_from, date_to, page_size: int = PAGE_SIZE):
+    """Công nhật của các dự án trong khoảng ngày, đọc theo trang (range), đã sắp theo dự án / user / ngày."""
+    columns = "id, project, assignee, task, khoi_luong, note, start_date"
+    if timesheet.has_time_columns():
+        columns += ", " + ", ".join(timesheet.TIME_COLUMNS)
+
+    supabase = get_connection()
+    start = 0
+    while True:
+        res = supabase.table("tasks").select(columns) \
+            .in_("project", list(projects)) \
+            .gte("start_date", str(date_from)).lte("start_date", str(date_to)) \
+            .order("project").order("assignee").order("start_date").order("id") \
+            .range(start, start + page_size - 1).execute()
+        rows = res.data or []
+        if rows:
+            yield pd.DataFrame(rows)
+        if len(rows) < page_size:
+            break
+        start += page_size
+
+
+@perf.timed("export.write_xlsx", rows=lambda r: r[1], nbytes=lambda r: len(r[0]))
+def write_xlsx(frames, sheet_name: str = "Cong_nhat") -> tuple[bytes, int]:
+    """Ghi lần lượt các DataFrame (cùng cột) vào 1 sheet. Trả về (nội dung file, số dòng)."""
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_fmt = workbook.add_format({"bold": True})
+
+    row = 0
+    for frame in frames:
+        if row == 0:
+            worksheet.set_column(0, len(frame.columns) - 1, COLUMN_WIDTH)
+            worksheet.write_row(0, 0, list(frame.columns), header_fmt)
+            row = 1
+        values = frame.astype(object).where(frame.notna(), None)
+        for record in values.itertuples(index=False, name=None):
+            worksheet.write_row(row, 0, record)
+            row += 1
+
+    workbook.close()
+    return output.getvalue(), max(row - 1, 0)
+
+
+@perf.timed("export.period", rows=lambda r: r[1], nbytes=lambda r: len(r[0]))
+def export_period(projects: list[str], date_from, date_to, user_map: dict = None) -> tuple[bytes, int]:
+    """File Excel công nhật của nhiều dự án trong khoảng ngày (vd cả năm), dựng theo từng trang."""
+    frames = (
+        export_frame(page, user_map, include_project=True, sort=False)
+        for page in iter_task_pages(projects, date_from, date_to)
+    )
+    return write_xlsx(frames, "Cong_nhat")
@@ -0,0 +1,340 @@
+# db_client.py
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+import pandas as pd
+from supabase import create_client
+
+import perf
+
+
+# ==================== CLIENT SUPABASE: POOL + RETRY + CIRCUIT BREAKER + SỐ LIỆU ====================
+# auth.get_connection() trả về client đã bọc. Mọi truy vấn .table(...)...execute() / .rpc(...).execute()
+# đi qua _execute():
+# - HTTP: 1 httpx.Client dùng chung, giữ kết nối (keep-alive) → các lần rerun không phải bắt tay TLS lại.
+# - Retry: lỗi tạm thời (mất kết nối, timeout, 5xx) được thử lại với backoff có jitter.
+#   insert / rpc chỉ thử lại khi chắc chắn request chưa được xử lý (không kết nối được, 503)
+#   để tránh ghi 2 lần.
+# - Circuit breaker: lỗi tạm thời liên tiếp quá BREAKER_THRESHOLD lần → ngắt BREAKER_COOLDOWN giây,
+#   các truy vấn trong lúc ngắt báo lỗi ngay (CircuitOpenError) thay vì treo chờ timeout.
+# - Số liệu: số lần gọi / lỗi / retry / thời gian theo (bảng, thao tác) → trang chẩn đoán của admin.
+
+POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE", "20"))
+KEEPALIVE_EXPIRY = float(os.environ.get("SUPABASE_KEEPALIVE", "60"))
+REQUEST_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", "30"))
+CONNECT_TIMEOUT = 10.0
+
+MAX_RETRIES = int(os.environ.get("SUPABASE_MAX_RETRIES", "3"))
+BACKOFF_BASE = 0.2     # giây, nhân đôi sau mỗi lần thử
+BACKOFF_MAX = 3.0
+
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 20.0
+
+# Số mẫu thời gian gần nhất giữ lại cho mỗi (bảng, thao tác) để tính p50 / p95
+LATENCY_SAMPLES = 200
+
+_OPERATIONS = ("select", "insert", "update", "upsert", "delete")
+# Thao tác gửi lại nhiều lần vẫn cho cùng kết quả
+_IDEMPOTENT = {"select", "update", "upsert", "delete"}
+
+_TRANSIENT_STATUS = {500, 502, 503, 504, 520, 521, 522, 523, 524}
+# Lỗi của PostgREST / Postgres khi DB quá tải, mất kết nối, xung đột giao dịch
+# (55P03: SQLite / Postgres đang khoá, 08xxx: mất kết nối trực tiếp tới DB – xem storage.py)
+_TRANSIENT_CODES = {"PGRST000", "PGRST001", "PGRST002", "PGRST003", "57P01", "57P03", "40001", "40P01",
+                    "55P03", "08000", "08001", "08003", "08006"}
+# Những lỗi mà request chắc chắn chưa được xử lý
+_NOT_PROCESSED_STATUS = {503}
+_NOT_PROCESSED_CODES = {"PGRST000", "PGRST001", "PGRST002", "PGRST003", "57P03", "55P03", "08001"}
+
+
+class CircuitOpenError(RuntimeError):
+    """Kết nối tới Supabase đang bị ngắt tạm thời do lỗi liên tiếp."""
+
+
+# ==================== PHÂN LOẠI LỖI ====================
+
+def _error_code(e: Exception) -> str:
+    return str(getattr(e, "code", "") or "")
+
+
+def is_transient(e: Exception) -> bool:
+    if isinstance(e, httpx.TransportError):
+        return True
+    code = _error_code(e)
+    return code in _TRANSIENT_CODES or (code.isdigit() and int(code) in _TRANSIENT_STATUS)
+
+
+def _not_processed(e: Exception) -> bool:
+    """Request chưa tới được server / server từ chối trước khi xử lý → gửi lại an toàn cả với insert."""
+    if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    code = _error_code(e)
+    return code in _NOT_PROCESSED_CODES or (code.isdigit() and int(code) in _NOT_PROCESSED_STATUS)
+
+
+def _should_retry(e: Exception, operation: str) -> bool:
+    if not is_transient(e):
+        return False
+    return operation in _IDEMPOTENT or _not_processed(e)
+
+
+# DB chưa có hàm / bảng / cột (chưa chạy migration) → các module chuyển sang đường dự phòng.
+# Lỗi Supabase có thể chỉ mang mã trong nội dung nên kiểm tra cả mã lẫn thông báo.
+_MISSING_FUNCTION_CODES = ("PGRST202", "42883")
+_MISSING_TABLE_CODES = ("PGRST205", "42P01")
+_MISSING_COLUMN_CODES = ("PGRST204", "42703")
+
+
+def _has_code(e: Exception, codes) -> bool:
+    msg = str(e)
+    return _error_code(e) in codes or any(code in msg for code in codes)
+
+
+def is_missing_function(e: Exception) -> bool:
+    """DB chưa có hàm RPC."""
+    return _has_code(e, _MISSING_FUNCTION_CODES) or "could not find the function" in str(e).lower()
+
+
+def is_missing_table(e: Exception) -> bool:
+    """DB chưa có bảng."""
+    low = str(e).lower()
+    return _has_code(e, _MISSING_TABLE_CODES) or "could not find the table" in low or \
+        ("does not exist" in low and "relation" in low)
+
+
+def is_missing_column(e: Exception) -> bool:
+    """DB chưa có cột (hoặc chưa có cả bảng chứa cột đó)."""
+    low = str(e).lower()
+    return is_missing_table(e) or _has_code(e, _MISSING_COLUMN_CODES) or \
+        ("does not exist" in low and "column" in low)
+
+
+def is_duplicate(e: Exception) -> bool:
+    """Vi phạm ràng buộc unique."""
+    return _has_code(e, ("23505",)) or "duplicate key" in str(e).lower()
+
+
+def _backoff(attempt: int) -> float:
+    """Full jitter: ngẫu nhiên trong [0, min(max, base·2^attempt)]."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+# ==================== CIRCUIT BREAKER ====================
+
+class CircuitBreaker:
+    """closed → (lỗi liên tiếp ≥ threshold) → open → (hết cooldown) → half-open: cho 1 truy vấn thử."""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            wait = self._opened_at + self.cooldown - time.monotonic()
+            if wait > 0 or self._probing:
+                raise CircuitOpenError(
+                    f"Máy chủ dữ liệu đang gặp sự cố, vui lòng thử lại sau {max(1, round(wait))} giây."
+                )
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def record_neutral(self):
+        """Lỗi không phải do kết nối (vd vi phạm ràng buộc): server vẫn trả lời bình thường."""
+        self.record_success()
+
+    def state(self) -> dict:
+        with self._lock:
+            if self._opened_at is None:
+                status = "closed"
+            elif self._probing or time.monotonic() - self._opened_at >= self.cooldown:
+                status = "half-open"
+            else:
+                status = "open"
+            return {"state": status, "consecutive_failures": self._failures}
+
+
+breaker = CircuitBreaker()
+
+
+# ==================== SỐ LIỆU THEO (BẢNG, THAO TÁC) ====================
+
+_metrics: dict[tuple[str, str], dict] = {}
+_metrics_lock = threading.Lock()
+
+
+def _record(table: str, operation: str, elapsed: float, retries: int, error: Exception = None, rows: int = None):
+    perf.record(f"{perf.DB_PREFIX}{table}.{operation}", elapsed, rows)
+    with _metrics_lock:
+        m = _metrics.get((table, operation))
+        if m is None:
+            m = _metrics[(table, operation)] = {
+                "calls": 0, "errors": 0, "retries": 0, "total": 0.0, "max": 0.0,
+                "samples": deque(maxlen=LATENCY_SAMPLES), "last_error": None,
+            }
+        m["calls"] += 1
+        m["retries"] += retries
+        m["total"] += elapsed
+        m["max"] = max(m["max"], elapsed)
+        m["samples"].append(elapsed)
+        if error is not None:
+            m["errors"] += 1
+            m["last_error"] = f"{type(error).__name__}: {error}"[:300]
+
+
+def metrics_frame() -> pd.DataFrame:
+    """Bảng số liệu truy vấn (ms), truy vấn tốn nhiều thời gian nhất lên đầu."""
+    with _metrics_lock:
+        items = [(k, dict(v, samples=list(v["samples"]))) for k, v in _metrics.items()]
+
+    rows = []
+    for (table, operation), m in items:
+        samples = pd.Series(m["samples"]) * 1000
+        rows.append({
+            "table": table,
+            "operation": operation,
+            "calls": m["calls"],
+            "errors": m["errors"],
+            "retries": m["retries"],
+            "avg_ms": round(m["total"] * 1000 / m["calls"], 1),
+            "p50_ms": round(samples.quantile(0.5), 1),
+            "p95_ms": round(samples.quantile(0.95), 1),
+            "max_ms": round(m["max"] * 1000, 1),
+            "total_s": round(m["total"], 2),
+            "last_error": m["last_error"],
+        })
+    columns = ["table", "operation", "calls", "errors", "retries", "avg_ms", "p50_ms",
+               "p95_ms", "max_ms", "total_s", "last_error"]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(rows, columns=columns).sort_values("total_s", ascending=False, ignore_index=True)
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+# ==================== THỰC THI TRUY VẤN ====================
+
+def _execute(builder, table: str, operation: str):
+    retries = 0
+    started = time.perf_counter()
+    while True:
+        try:
+            breaker.before_call()
+        except CircuitOpenError as e:
+            _record(table, operation, time.perf_counter() - started, retries, e)
+            raise
+
+        try:
+            res = builder.execute()
+        except Exception as e:
+            if not is_transient(e):
+                breaker.record_neutral()
+                _record(table, operation, time.perf_counter() - started, retries, e)
+                raise
+            breaker.record_failure()
+            if retries >= MAX_RETRIES or not _should_retry(e, operation):
+                _record(table, operation, time.perf_counter() - started, retries, e)
+                raise
+            time.sleep(_backoff(retries))
+            retries += 1
+            continue
+
+        breaker.record_success()
+        data = getattr(res, "data", None)
+        _record(table, operation, time.perf_counter() - started, retries,
+                rows=len(data) if isinstance(data, list) else None)
+        return res
+
+
+class _QueryProxy:
+    """Bọc query builder của postgrest: mọi phương thức nối chuỗi như cũ, riêng execute() đi qua _execute."""
+
+    def __init__(self, builder, table: str, operation: str = None):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+
+    def _wrap(self, value, operation):
+        if hasattr(value, "execute"):
+            return _QueryProxy(value, self._table, operation)
+        return value
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        operation = self._operation or (name if name in _OPERATIONS else None)
+        if not callable(attr) or hasattr(attr, "execute"):
+            # vd .not_ là property trả về chính builder
+            return self._wrap(attr, operation)
+
+        def call(*args, **kwargs):
+            return self._wrap(attr(*args, **kwargs), operation)
+        return call
+
+    def execute(self):
+        return _execute(self._builder, self._table, self._operation or "select")
+
+
+class ClientProxy:
+    """Client Supabase đã bọc; các thuộc tính khác (auth, storage...) dùng nguyên bản."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str):
+        return _QueryProxy(self._client.table(name), name)
+
+    from_ = table
+
+    def rpc(self, fn: str, params: dict = None, *args, **kwargs):
+        return _QueryProxy(self._client.rpc(fn, params or {}, *args, **kwargs), f"rpc:{fn}", "rpc")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def _http_client() -> httpx.Client:
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=POOL_SIZE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        follow_redirects=True,
+    )
+
+
+def create(url: str, key: str) -> ClientProxy:
+    """Tạo client Supabase dùng pool HTTP riêng (nếu bản supabase-py hỗ trợ) và bọc lại."""
+    try:
+        from supabase import ClientOptions
+        client = create_client(url, key, options=ClientOptions(httpx_client=_http_client()))
+    except (ImportError, TypeError):
+        # supabase-py cũ chưa nhận httpx_client → dùng pool mặc định của thư viện
+        client = create_client(url, key)
+    return ClientProxy(client)
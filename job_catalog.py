@@ -0,0 +1,116 @@
+# job_catalog.py
+import threading
+
+import pandas as pd
+
+import repository
+
+
+# ==================== MỤC LỤC CÔNG VIỆC (CHỈ MỤC DỰNG SẴN) ====================
+# job_catalog được đọc ở mọi lần rerun của mọi vai trò. Thay vì mỗi trang tự lọc
+# DataFrame (jobs[jobs["parent_id"] == pid], job_map.loc[...] trong vòng lặp),
+# các chỉ mục được dựng 1 lần cho mỗi phiên bản bảng trong cache của repository
+# và dùng chung cho tất cả các trang / phiên.
+
+DEFAULT_PROJECT_TYPE = "group"
+
+
+class JobCatalog:
+    def __init__(self, df: pd.DataFrame):
+        self.source = df
+
+        frame = df.copy()
+        # Dữ liệu cũ có project_type NULL → coi như "group"
+        frame["project_type"] = frame["project_type"].fillna(DEFAULT_PROJECT_TYPE) \
+            .astype(str).str.strip().str.lower()
+        self.frame = frame
+
+        records = frame.to_dict("records")
+        self.by_id: dict[int, dict] = {}
+        self.by_name: dict[str, dict] = {}
+        self.children: dict[int, list[dict]] = {}
+        self.roots: list[dict] = []
+        self.by_type: dict[str, list[dict]] = {}
+
+        for rec in records:
+            self.by_id[int(rec["id"])] = rec
+            self.by_name.setdefault(rec["name"], rec)
+            self.by_type.setdefault(rec["project_type"], []).append(rec)
+            if pd.isna(rec["parent_id"]):
+                self.roots.append(rec)
+            else:
+                self.children.setdefault(int(rec["parent_id"]), []).append(rec)
+
+        # Tên đầu mục cha của mỗi công việc (công việc gốc trỏ về chính nó), theo tên và theo id
+        self.parent_name: dict[str, str] = {}
+        self.parent_name_by_id: dict[int, str] = {}
+        for rec in records:
+            parent = None if pd.isna(rec["parent_id"]) else self.by_id.get(int(rec["parent_id"]))
+            self.parent_name.setdefault(rec["name"], parent["name"] if parent else rec["name"])
+            self.parent_name_by_id[int(rec["id"])] = parent["name"] if parent else rec["name"]
+
+        self._type_frames: dict[str, pd.DataFrame] = {}
+
+    # -------------------- Tra cứu --------------------
+
+    def id_of(self, name: str):
+        rec = self.by_name.get(name)
+        return int(rec["id"]) if rec else None
+
+    def unit_of(self, name: str) -> str:
+        rec = self.by_name.get(name)
+        if not rec or pd.isna(rec.get("unit")):
+            return ""
+        return rec["unit"]
+
+    def units_for(self, tasks: pd.DataFrame) -> pd.Series:
+        """Đơn vị của từng task: theo job_id (số nguyên), dòng chưa có job_id thì theo tên công việc."""
+        unit_by_id = {i: r["unit"] for i, r in self.by_id.items()}
+        unit_by_name = {n: r["unit"] for n, r in self.by_name.items()}
+        by_name = tasks["task"].map(unit_by_name)
+        if "job_id" not in tasks.columns:
+            return by_name
+        by_id = pd.to_numeric(tasks["job_id"], errors="coerce").map(unit_by_id)
+        return by_id.where(tasks["job_id"].notna(), by_name)
+
+    def children_of(self, parent_id) -> list[dict]:
+        if parent_id is None:
+            return []
+        return self.children.get(int(parent_id), [])
+
+    def root_names(self, project_type: str = None) -> list[str]:
+        """Tên các đầu mục (công việc không có cha), sắp theo tên."""
+        roots = self.roots if project_type is None else \
+            [r for r in self.roots if r["project_type"] == project_type]
+        return sorted(r["name"] for r in roots)
+
+    def child_names(self, parent_name: str, project_type: str = None) -> list[str]:
+        """Tên các công việc con của 1 đầu mục, sắp theo tên."""
+        children = self.children_of(self.id_of(parent_name))
+        if project_type is not None:
+            children = [c for c in children if c["project_type"] == project_type]
+        return sorted(c["name"] for c in children)
+
+    def jobs_of_type(self, project_type: str) -> pd.DataFrame:
+        """Các công việc thuộc 1 nhóm dự án (cột id, name, unit, parent_id)."""
+        frame = self._type_frames.get(project_type)
+        if frame is None:
+            rows = self.by_type.get(project_type, [])
+            frame = pd.DataFrame(rows, columns=list(self.frame.columns))[["id", "name", "unit", "parent_id"]]
+            self._type_frames[project_type] = frame
+        return frame.copy()
+
+
+_catalog: JobCatalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog(refresh: bool = False) -> JobCatalog:
+    """JobCatalog của phiên bản job_catalog hiện có trong cache (dựng lại khi bảng được tải lại)."""
+    global _catalog
+
+    df = repository.job_catalog_snapshot(refresh)
+    with _catalog_lock:
+        if _catalog is None or _catalog.source is not df:
+            _catalog = JobCatalog(df)
+        return _catalog
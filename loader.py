@@ -0,0 +1,97 @@
+# loader.py
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+# ==================== TẢI SONG SONG CÁC TRUY VẤN ĐỘC LẬP ====================
+# Mỗi lần mở trang cần vài bảng không phụ thuộc nhau (users, dự án, job_catalog...).
+# Gọi lần lượt thì thời gian chờ = tổng các round-trip; gửi cùng lúc qua thread pool
+# thì chỉ còn ≈ round-trip chậm nhất. Client Supabase (httpx) dùng chung được giữa các luồng.
+# - Mỗi truy vấn có timeout riêng; quá hạn hoặc lỗi → ghi vào errors, các truy vấn khác vẫn trả kết quả.
+# - Pool dùng chung toàn tiến trình (mọi phiên Streamlit), giới hạn MAX_WORKERS luồng.
+
+MAX_WORKERS = 8
+
+# Thời gian chờ mặc định (giây) cho mỗi truy vấn
+LOAD_TIMEOUT = 15
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="loader")
+        return _executor
+
+
+class LoadTimeout(TimeoutError):
+    """Truy vấn không xong trong thời gian cho phép."""
+
+
+class GatherResult:
+    """Kết quả gather: values (tên → giá trị), errors (tên → Exception), durations (tên → giây)."""
+
+    def __init__(self):
+        self.values: dict = {}
+        self.errors: dict[str, Exception] = {}
+        self.durations: dict[str, float] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def get(self, name: str, default=None):
+        """Giá trị của truy vấn, hoặc default nếu truy vấn lỗi / quá hạn."""
+        return self.values.get(name, default)
+
+    def __getitem__(self, name: str):
+        """Giá trị của truy vấn; truy vấn lỗi thì ném lại đúng lỗi đó."""
+        if name in self.errors:
+            raise self.errors[name]
+        return self.values[name]
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - started
+
+
+def gather(calls: dict, timeout: float = LOAD_TIMEOUT, timeouts: dict = None) -> GatherResult:
+    """
+    Chạy đồng thời các hàm không tham số trong calls ({tên: fn}) và chờ tất cả.
+    - timeout: thời gian chờ mặc định cho mỗi truy vấn; timeouts: {tên: giây} riêng cho từng truy vấn
+    - Không ném lỗi: lỗi / quá hạn của từng truy vấn nằm trong result.errors
+    """
+    timeouts = timeouts or {}
+    result = GatherResult()
+    if not calls:
+        return result
+
+    started = time.monotonic()
+    executor = _get_executor()
+    # Mỗi truy vấn chạy trong bản sao context của phiên gọi (để perf ghi span đúng lần rerun)
+    futures = {name: executor.submit(contextvars.copy_context().run, _timed, fn)
+               for name, fn in calls.items()}
+
+    for name, future in futures.items():
+        limit = timeouts.get(name, timeout)
+        remaining = max(0.0, started + limit - time.monotonic())
+        try:
+            value, elapsed = future.result(timeout=remaining)
+            result.values[name] = value
+            result.durations[name] = elapsed
+        except FutureTimeout:
+            # Luồng vẫn chạy nốt ở nền; kết quả muộn bị bỏ qua
+            future.cancel()
+            result.errors[name] = LoadTimeout(f"'{name}' không phản hồi sau {limit:g}s")
+            result.durations[name] = time.monotonic() - started
+        except Exception as e:
+            result.errors[name] = e
+            result.durations[name] = time.monotonic() - started
+    return result
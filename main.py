@@ -5,7 +5,10 @@ import datetime
 from admin_app import admin_app
 from project_manager_app import project_manager_app
 from user_app import user_app   # nếu vẫn muốn dùng giao diện user thường
-from auth import get_connection, hash_password
+from auth import get_connection, hash_password, find_user_by_username, register_user, UsernameTakenError
+import repository
+import sessions
+import perf
 from streamlit_cookies_manager import EncryptedCookieManager
 
 # ==================== HỖ TRỢ ====================
@@ -14,35 +17,42 @@ if not cookies.ready():
     st.stop()
 
 
+BUILTIN_ADMIN = (0, "tdpro", "TDPRO", None, "Giadinh12", "admin")
+
+
+def _user_tuple(row):
+    return (
+        row["id"],
+        row["username"],
+        row["display_name"],
+        row["dob"],
+        row["password"],
+        row["role"]
+    )
+
+
 def check_login(username, password):
     u = (username or "").strip()
 
     p = password or ""
 
     if u == "tdpro" and p == "Giadinh12":
-        return (0, "tdpro", "TDPRO", None, "Giadinh12", "admin")
+        return BUILTIN_ADMIN
 
-    supabase = get_connection()
-    data = supabase.table("users") \
-        .select("id, username, display_name, dob, password, role") \
-        .ilike("username", u).execute()
+    row = find_user_by_username(u)
+    if row and row["password"] == hash_password(p):
+        return _user_tuple(row)
 
+    return None
 
-    if not data.data:
-        return None
 
-    row = data.data[0]
-    if row["password"] == hash_password(p):
-        return (
-            row["id"],
-            row["username"],
-            row["display_name"],
-            row["dob"],
-            row["password"],
-            row["role"]
-        )
+def load_user(username):
+    """User theo đúng username (dùng khi khôi phục phiên từ token, không kiểm tra mật khẩu)."""
+    if username == BUILTIN_ADMIN[1]:
+        return BUILTIN_ADMIN
 
-    return None
+    row = find_user_by_username(username)
+    return _user_tuple(row) if row else None
 
 
 
@@ -51,7 +61,9 @@ def logout_user():
     st.session_state.pop("user", None)
     st.session_state.pop("page", None)
 
-    # Xóa cookie đăng nhập
+    # Thu hồi phiên + xóa cookie đăng nhập
+    sessions.revoke(cookies.get("session"))
+    cookies["session"] = ""
     cookies["username"] = ""
     cookies["password"] = ""
     cookies.save()
@@ -94,12 +106,14 @@ def profile_page(user):
             "display_name": new_display,
             "dob": new_dob.strftime("%Y-%m-%d") if new_dob else None
         }).eq("username", user[1]).execute()
+        repository.invalidate("users")
 
         st.success("✅ Đã cập nhật hồ sơ.")
         user = list(user)
         user[2] = new_display
         user[3] = new_dob.strftime("%Y-%m-%d") if new_dob else None
         st.session_state["user"] = tuple(user)
+        sessions.update_principal(cookies.get("session"), tuple(user))
         st.rerun()
 
     st.subheader("Đổi mật khẩu")
@@ -109,14 +123,16 @@ def profile_page(user):
 
     if st.button("✅ Đổi mật khẩu", key="pf_change_pw"):
         
-        data = supabase.table("users").select("password").eq("username", user[1]).execute()
-        if not data.data or data.data[0]["password"] != hash_password(old_pw):
+        row = find_user_by_username(user[1], columns="password")
+        if not row or row["password"] != hash_password(old_pw):
 
             st.error("⚠️ Mật khẩu hiện tại không đúng.")
         elif new_pw != confirm_pw:
             st.error("⚠️ Mật khẩu mới và xác nhận không khớp.")
         else:
             supabase.table("users").update({"password": hash_password(new_pw)}).eq("username", user[1]).execute()
+            # Đăng xuất mọi phiên đang mở của user trên các thiết bị
+            sessions.revoke_user(user[1])
 
 
             
@@ -166,8 +182,9 @@ def main():
     
 
     if "user" not in st.session_state:
-        if "username" in cookies and "password" in cookies:
-            user_auto = check_login(cookies["username"], cookies["password"])
+        # Tự đăng nhập lại bằng token phiên (tra LRU, không kiểm tra lại mật khẩu)
+        if cookies.get("session"):
+            user_auto = sessions.resolve(cookies["session"], load_user)
             if user_auto:
                 st.session_state["user"] = user_auto
                 st.session_state["page"] = "home"
@@ -187,9 +204,11 @@ def main():
                     st.session_state["user"] = user
                     st.session_state["page"] = "home"
 
-                    # 👉 Lưu thông tin vào cookie để tự động đăng nhập sau khi refresh
+                    # 👉 Lưu token phiên vào cookie để tự động đăng nhập sau khi refresh
+                    # (không lưu mật khẩu; xoá mật khẩu còn sót từ cookie cũ)
+                    cookies["session"] = sessions.create_session(user)
                     cookies["username"] = user[1]
-                    cookies["password"] = password  # hoặc hash_password(password) để bảo mật hơn
+                    cookies["password"] = ""
                     cookies.save()
 
                     st.success("✅ Đăng nhập thành công! (Phiên sẽ được lưu lại)")
@@ -211,24 +230,12 @@ def main():
                 elif new_pass != confirm_pass:
                     st.error("⚠️ Mật khẩu nhập lại không khớp")
                 else:
-                    supabase = get_connection()
-                    data = supabase.table("users").select("username").eq("username", new_user.strip()).execute()
-                    if data.data:
-                        st.error("⚠️ Tên đăng nhập đã tồn tại.")
-                    else:
-                        # Lấy id cao nhất hiện có và +1
-                        data = supabase.table("users").select("id").order("id", desc=True).limit(1).execute()
-                        next_id = (data.data[0]["id"] + 1) if data.data else 1
-
-                        supabase.table("users").insert({
-                            "id": next_id,
-                            "username": new_user.strip(),
-                            "display_name": new_display or new_user.strip(),
-                            "dob": new_dob.strftime("%Y-%m-%d"),
-                            "password": hash_password(new_pass),
-                            "role": "user"
-                        }).execute()
+                    try:
+                        register_user(new_user, new_display, new_dob, new_pass, role="user")
+                        repository.invalidate("users")
                         st.success("✅ Đăng ký thành công! Hãy đăng nhập.")
+                    except UsernameTakenError:
+                        st.error("⚠️ Tên đăng nhập đã tồn tại.")
 
 
     else:
@@ -259,12 +266,16 @@ def main():
             elif isinstance(role, list):
                 role_list = [str(r).lower() for r in role]
 
+            # ⏱️ Mỗi lần rerun của trang chính được đo (xem trang "Hiệu năng" của admin)
             if any("admin" in r for r in role_list):
-                admin_app(user)
+                with perf.rerun("admin", user[1]):
+                    admin_app(user)
             elif any(("chủ nhiệm dự án" in r) or ("chủ trì dự án" in r) or ("project_manager" in r) for r in role_list):
-                project_manager_app(user)
+                with perf.rerun("pm", user[1]):
+                    project_manager_app(user)
             else:
-                user_app(user)
+                with perf.rerun("user", user[1]):
+                    user_app(user)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+"""
+Chép dữ liệu chấm công từ blob attendance_new.data sang bảng attendance_monthly
+(tạo bảng trước bằng migrations/attendance_monthly.sql).
+
+    python -m migrations.attendance_monthly            # chép tất cả các tháng
+    python -m migrations.attendance_monthly --dry-run  # chỉ đếm, không ghi
+
+Dòng (username, month) đã có trong bảng mới sẽ được giữ nguyên, nên chạy lại
+nhiều lần vẫn an toàn. Chép xong thì ghi cờ attendance_cutover: từ đó app và
+RPC save_attendance_month thôi đọc / ghi blob cũ.
+"""
+import argparse
+
+from auth import get_connection
+from attendance import CUTOVER_TABLE, LEGACY_TABLE, MONTHLY_TABLE, month_value, parse_json_blob
+
+BATCH_SIZE = 500
+
+
+def iter_month_rows(records):
+    """Tách mỗi blob nhiều tháng thành các dòng {username, month, data}."""
+    for rec in records:
+        username = str(rec.get("username") or "").strip()
+        if not username:
+            continue
+        for month, value in parse_json_blob(rec.get("data")).items():
+            yield {"username": username, "month": month, "data": month_value(value)}
+
+
+def migrate(dry_run: bool = False) -> int:
+    supabase = get_connection()
+    res = supabase.table(LEGACY_TABLE).select("username, data").execute()
+    rows = list(iter_month_rows(res.data or []))
+
+    if not dry_run:
+        for start in range(0, len(rows), BATCH_SIZE):
+            supabase.table(MONTHLY_TABLE).upsert(
+                rows[start:start + BATCH_SIZE],
+                on_conflict="username,month",
+                ignore_duplicates=True
+            ).execute()
+        # Chỉ đánh dấu khi mọi lô đã ghi xong (lô lỗi → ném lỗi, cờ chưa được ghi)
+        supabase.table(CUTOVER_TABLE).upsert({"id": 1}, on_conflict="id").execute()
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chuyển attendance_new → attendance_monthly")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ đếm số dòng, không ghi")
+    args = parser.parse_args()
+
+    count = migrate(dry_run=args.dry_run)
+    action = "Sẽ chép" if args.dry_run else "Đã chép"
+    print(f"✅ {action} {count} dòng (username, tháng) sang {MONTHLY_TABLE}")
+
+
+if __name__ == "__main__":
+    main()
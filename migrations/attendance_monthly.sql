@@ -0,0 +1,62 @@
+-- Chấm công phân vùng theo tháng: 1 dòng cho mỗi (username, month)
+-- thay cho blob nhiều tháng trong attendance_new.data.
+-- Chạy file này rồi chạy: python -m migrations.attendance_monthly
+-- (script chép lại toàn bộ blob cũ, chạy lại nhiều lần vẫn an toàn).
+
+create table if not exists public.attendance_monthly (
+    username   text        not null,
+    month      text        not null,            -- 'YYYY-MM'
+    data       jsonb       not null default '{}'::jsonb,
+    updated_at timestamptz not null default now(),
+    primary key (username, month)
+);
+
+create index if not exists attendance_monthly_month_idx
+    on public.attendance_monthly (month);
+
+-- Cờ "đã backfill xong" (tối đa 1 dòng), do python -m migrations.attendance_monthly ghi
+-- sau khi chép hết blob cũ. Có dòng này thì app thôi đọc / ghi attendance_new.
+create table if not exists public.attendance_cutover (
+    id           integer     primary key default 1 check (id = 1),
+    completed_at timestamptz not null default now()
+);
+
+-- Thay hàm lưu tháng ở migrations/save_attendance_month.sql:
+-- ghi bảng mới, đồng thời vẫn cập nhật data[month_str] của blob cũ
+-- để đọc dự phòng trong thời gian chuyển đổi (tới khi có cờ attendance_cutover).
+create or replace function public.save_attendance_month(month_str text, entries jsonb)
+returns integer
+language sql
+as $$
+    with e as (
+        select x ->> 'username' as username, x -> 'value' as value
+        from jsonb_array_elements(entries) x
+    ), monthly as (
+        insert into public.attendance_monthly as m (username, month, data, updated_at)
+        select e.username, month_str, e.value, now()
+        from e
+        on conflict (username, month) do update
+        set data = excluded.data, updated_at = now()
+        returning 1
+    ), legacy as (
+        insert into public.attendance_new as a (username, data, months)
+        select e.username, jsonb_build_object(month_str, e.value), jsonb_build_array(month_str)
+        from e
+        where not exists (select 1 from public.attendance_cutover)
+        on conflict (username) do update
+        set data = (
+                case jsonb_typeof(a.data)
+                    when 'object' then a.data
+                    when 'string' then (a.data #>> '{}')::jsonb
+                    else '{}'::jsonb
+                end
+            ) || jsonb_build_object(month_str, excluded.data -> month_str),
+            months = case
+                when coalesce(a.months, '[]'::jsonb) ? month_str then a.months
+                else coalesce(a.months, '[]'::jsonb) || jsonb_build_array(month_str)
+            end
+        returning 1
+    )
+    -- CTE ghi dữ liệu luôn được thực thi kể cả khi không được select tới
+    select count(*)::integer from monthly;
+$$;
@@ -0,0 +1,17 @@
+-- Cập nhật nhiều task trong 1 request (dùng bởi repository.bulk_update_tasks).
+-- changes: mảng JSON [{"id": 1, "note": "...", "khoi_luong": 2.5}, ...]
+-- Cột nào không có trong phần tử JSON thì giữ nguyên giá trị cũ.
+
+create or replace function public.bulk_update_tasks(changes jsonb)
+returns table (id bigint)
+language sql
+as $$
+    update public.tasks t
+    set (task, khoi_luong, progress, deadline, start_date, note, approved) = (
+        select r.task, r.khoi_luong, r.progress, r.deadline, r.start_date, r.note, r.approved
+        from jsonb_populate_record(t, c) r
+    )
+    from jsonb_array_elements(changes) c
+    where t.id = (c ->> 'id')::bigint
+    returning t.id::bigint;
+$$;
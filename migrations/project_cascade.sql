@@ -0,0 +1,95 @@
+-- Đổi tên / xoá dự án cùng dữ liệu liên quan trong 1 transaction
+-- (dùng bởi project_service.rename_project / project_service.delete_projects).
+-- Trả về số dòng bị ảnh hưởng ở mỗi bảng.
+
+-- CSV tên dự án trong users.project_manager_of / project_leader_of (phân cách "|" hoặc ",")
+-- → thay old_name bằng new_name (new_name null = bỏ đi), ghi lại phân cách ",", rỗng → null
+create or replace function public.csv_replace_project(csv text, old_names text[], new_name text)
+returns text
+language sql
+immutable
+as $$
+    select nullif(string_agg(case when v = any(old_names) then new_name else v end, ',' order by i), '')
+    from (
+        select btrim(p) as v, i
+        from unnest(regexp_split_to_array(coalesce(csv, ''), '[|,]')) with ordinality as t(p, i)
+    ) parts
+    where v <> '';
+$$;
+
+create or replace function public.csv_has_project(csv text, names text[])
+returns boolean
+language sql
+immutable
+as $$
+    select exists (
+        select 1 from unnest(regexp_split_to_array(coalesce(csv, ''), '[|,]')) p
+        where btrim(p) = any(names)
+    );
+$$;
+
+create or replace function public.rename_project(old_name text, new_name text)
+returns jsonb
+language plpgsql
+as $$
+declare
+    n_projects integer;
+    n_tasks integer;
+    n_users integer;
+begin
+    if old_name = new_name then
+        return jsonb_build_object('projects', 0, 'tasks', 0, 'members', 0);
+    end if;
+    if exists (select 1 from public.projects where name = new_name) then
+        raise exception 'duplicate key: project % already exists', new_name
+            using errcode = 'unique_violation';
+    end if;
+
+    update public.projects set name = new_name where name = old_name;
+    get diagnostics n_projects = row_count;
+
+    update public.tasks set project = new_name where project = old_name;
+    get diagnostics n_tasks = row_count;
+
+    update public.users
+    set project_manager_of = public.csv_replace_project(project_manager_of, array[old_name], new_name),
+        project_leader_of  = public.csv_replace_project(project_leader_of, array[old_name], new_name)
+    where public.csv_has_project(project_manager_of, array[old_name])
+       or public.csv_has_project(project_leader_of, array[old_name]);
+    get diagnostics n_users = row_count;
+
+    return jsonb_build_object('projects', n_projects, 'tasks', n_tasks, 'members', n_users);
+end;
+$$;
+
+create or replace function public.delete_projects(names text[])
+returns jsonb
+language plpgsql
+as $$
+declare
+    n_projects integer;
+    n_tasks integer;
+    n_payments integer;
+    n_users integer;
+begin
+    delete from public.tasks where project = any(names);
+    get diagnostics n_tasks = row_count;
+
+    delete from public.payments
+    where project_id in (select id from public.projects where name = any(names));
+    get diagnostics n_payments = row_count;
+
+    delete from public.projects where name = any(names);
+    get diagnostics n_projects = row_count;
+
+    update public.users
+    set project_manager_of = public.csv_replace_project(project_manager_of, names, null),
+        project_leader_of  = public.csv_replace_project(project_leader_of, names, null)
+    where public.csv_has_project(project_manager_of, names)
+       or public.csv_has_project(project_leader_of, names);
+    get diagnostics n_users = row_count;
+
+    return jsonb_build_object('projects', n_projects, 'tasks', n_tasks,
+                              'payments', n_payments, 'members', n_users);
+end;
+$$;
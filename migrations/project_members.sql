@@ -0,0 +1,88 @@
+-- Thành viên quản lý dự án (dùng bởi project_members.py), thay cho CSV
+-- users.project_manager_of / project_leader_of.
+-- role: 'manager' = Chủ nhiệm dự án, 'leader' = Chủ trì dự án.
+-- Chạy sau project_cascade.sql (định nghĩa lại rename_project / delete_projects).
+
+create table if not exists public.project_members (
+    username   text   not null,
+    project_id bigint not null references public.projects (id) on delete cascade,
+    role       text   not null check (role in ('manager', 'leader')),
+    primary key (username, project_id, role)
+);
+
+-- "Ai quản lý dự án P" (PK đã phục vụ "X quản lý dự án nào")
+create index if not exists project_members_project_idx
+    on public.project_members (project_id, role);
+
+-- Chuyển dữ liệu CSV cũ (phân cách "|" hoặc ",") sang bảng mới
+insert into public.project_members (username, project_id, role)
+select distinct u.username, p.id, m.role
+from public.users u
+cross join lateral (
+    values ('manager', u.project_manager_of), ('leader', u.project_leader_of)
+) m(role, csv)
+cross join lateral unnest(regexp_split_to_array(coalesce(m.csv, ''), '[|,]')) part
+join public.projects p on p.name = btrim(part)
+on conflict do nothing;
+
+-- Thành viên gắn theo project_id nên đổi tên dự án không phải sửa users nữa;
+-- xoá dự án thì project_members tự xoá theo (on delete cascade).
+create or replace function public.rename_project(old_name text, new_name text)
+returns jsonb
+language plpgsql
+as $$
+declare
+    n_projects integer;
+    n_tasks integer;
+    n_members integer;
+begin
+    if old_name = new_name then
+        return jsonb_build_object('projects', 0, 'tasks', 0, 'members', 0);
+    end if;
+    if exists (select 1 from public.projects where name = new_name) then
+        raise exception 'duplicate key: project % already exists', new_name
+            using errcode = 'unique_violation';
+    end if;
+
+    update public.projects set name = new_name where name = old_name;
+    get diagnostics n_projects = row_count;
+
+    update public.tasks set project = new_name where project = old_name;
+    get diagnostics n_tasks = row_count;
+
+    select count(*) into n_members
+    from public.project_members m join public.projects p on p.id = m.project_id
+    where p.name = new_name;
+
+    return jsonb_build_object('projects', n_projects, 'tasks', n_tasks, 'members', n_members);
+end;
+$$;
+
+create or replace function public.delete_projects(names text[])
+returns jsonb
+language plpgsql
+as $$
+declare
+    n_projects integer;
+    n_tasks integer;
+    n_payments integer;
+    n_members integer;
+begin
+    delete from public.tasks where project = any(names);
+    get diagnostics n_tasks = row_count;
+
+    delete from public.payments
+    where project_id in (select id from public.projects where name = any(names));
+    get diagnostics n_payments = row_count;
+
+    select count(*) into n_members
+    from public.project_members m join public.projects p on p.id = m.project_id
+    where p.name = any(names);
+
+    delete from public.projects where name = any(names);
+    get diagnostics n_projects = row_count;
+
+    return jsonb_build_object('projects', n_projects, 'tasks', n_tasks,
+                              'payments', n_payments, 'members', n_members);
+end;
+$$;
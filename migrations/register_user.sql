@@ -0,0 +1,46 @@
+-- Đăng ký user: id do DB cấp (identity) thay vì đọc max(id) + 1 ở client
+-- (dùng bởi auth.register_user). Cần chạy sau users_username_key.sql.
+
+-- users.id thành identity, bắt đầu sau id lớn nhất hiện có
+do $$
+begin
+    if not exists (
+        select 1 from information_schema.columns
+        where table_schema = 'public' and table_name = 'users'
+          and column_name = 'id' and is_identity = 'YES'
+    ) then
+        alter table public.users alter column id add generated by default as identity;
+    end if;
+end;
+$$;
+
+select setval(
+    pg_get_serial_sequence('public.users', 'id'),
+    greatest((select coalesce(max(id), 0) from public.users), 1)
+);
+
+-- Thêm 1 user trong 1 request; trùng username_key → lỗi 23505 (unique_violation)
+create or replace function public.register_user(
+    p_username text,
+    p_username_key text,
+    p_display_name text,
+    p_dob date,
+    p_password text,
+    p_role text default 'user'
+)
+returns setof public.users
+language plpgsql
+as $$
+begin
+    return query
+    insert into public.users (username, username_key, display_name, dob, password, role)
+    values (p_username, p_username_key, p_display_name, p_dob, p_password, coalesce(p_role, 'user'))
+    on conflict (username_key) do nothing
+    returning *;
+
+    if not found then
+        raise exception 'duplicate key: username % already exists', p_username
+            using errcode = 'unique_violation';
+    end if;
+end;
+$$;
@@ -0,0 +1,35 @@
+-- Lưu chấm công của 1 tháng cho nhiều user trong 1 request
+-- (dùng bởi attendance.save_attendance_month).
+-- entries: [{"username": "an", "value": {"01": "K", "02": "P"}}, ...]
+-- Chỉ ghi đè key data[month_str]; các tháng khác trong blob giữ nguyên.
+
+create unique index if not exists attendance_new_username_key
+    on public.attendance_new (username);
+
+create or replace function public.save_attendance_month(month_str text, entries jsonb)
+returns integer
+language sql
+as $$
+    with e as (
+        select x ->> 'username' as username, x -> 'value' as value
+        from jsonb_array_elements(entries) x
+    ), up as (
+        insert into public.attendance_new as a (username, data, months)
+        select e.username, jsonb_build_object(month_str, e.value), jsonb_build_array(month_str)
+        from e
+        on conflict (username) do update
+        set data = (
+                case jsonb_typeof(a.data)
+                    when 'object' then a.data
+                    when 'string' then (a.data #>> '{}')::jsonb   -- blob cũ lưu dạng chuỗi JSON
+                    else '{}'::jsonb
+                end
+            ) || jsonb_build_object(month_str, excluded.data -> month_str),
+            months = case
+                when coalesce(a.months, '[]'::jsonb) ? month_str then a.months
+                else coalesce(a.months, '[]'::jsonb) || jsonb_build_array(month_str)
+            end
+        returning 1
+    )
+    select count(*)::integer from up;
+$$;
@@ -0,0 +1,11 @@
+-- Phiên đăng nhập (dùng bởi sessions.py). Chỉ lưu sha256 của token, không lưu token gốc.
+
+create table if not exists public.sessions (
+    token_hash text primary key,
+    username   text not null,
+    created_at timestamptz not null default now(),
+    expires_at timestamptz not null,
+    revoked_at timestamptz
+);
+
+create index if not exists sessions_username_idx on public.sessions (username);
@@ -0,0 +1,59 @@
+-- Gom nhóm thống kê công việc ngay trong DB (dùng bởi task_stats.load_task_stats).
+-- Kết quả: 1 dòng / (project, assignee, parent_job) – phía Python tự gộp tiếp
+-- theo dự án / người dùng mà không phải tải từng task về.
+
+create or replace view public.task_stats_base as
+select
+    t.id,
+    t.project,
+    t.assignee,
+    t.progress,
+    coalesce(parent.name, j.name, t.task) as parent_job
+from public.tasks t
+left join lateral (
+    select jc.name, jc.parent_id
+    from public.job_catalog jc
+    where jc.name = t.task
+    order by jc.id
+    limit 1
+) j on true
+left join public.job_catalog parent on parent.id = j.parent_id;
+
+create or replace function public.task_stats(project_names text[])
+returns table (
+    project        text,
+    assignee       text,
+    parent_job     text,
+    total          bigint,
+    done           bigint,
+    not_done       bigint,
+    progress_sum   numeric,
+    progress_count bigint
+)
+language sql
+stable
+as $$
+    select
+        b.project,
+        b.assignee,
+        b.parent_job,
+        count(b.id),
+        count(*) filter (where b.progress = 100),
+        count(*) filter (where b.progress < 100),
+        coalesce(sum(b.progress), 0),
+        count(b.progress)
+    from public.task_stats_base b
+    where b.project = any(project_names)
+    group by b.project, b.assignee, b.parent_job;
+$$;
+
+create or replace function public.unfinished_projects()
+returns table (project text)
+language sql
+stable
+as $$
+    select distinct t.project from public.tasks t where t.progress < 100;
+$$;
+
+create index if not exists tasks_project_idx on public.tasks (project);
+create index if not exists job_catalog_name_idx on public.job_catalog (name);
@@ -0,0 +1,168 @@
+-- tasks tham chiếu dự án / công việc theo id thay vì theo tên.
+-- tasks.project và tasks.task vẫn được giữ (hiển thị, code cũ), nhưng do DB tự đồng bộ
+-- theo id: đổi tên dự án / công việc chỉ sửa 1 dòng ở projects / job_catalog.
+-- Chạy sau tasks_updated_at.sql, task_stats.sql và project_members.sql.
+
+alter table public.tasks
+    add column if not exists project_id bigint references public.projects (id) on delete cascade,
+    add column if not exists job_id bigint references public.job_catalog (id) on delete set null;
+
+create index if not exists tasks_project_id_updated_at_idx on public.tasks (project_id, updated_at);
+create index if not exists tasks_job_id_idx on public.tasks (job_id);
+
+-- ==================== Backfill ====================
+update public.tasks t
+set project_id = p.id
+from public.projects p
+where t.project_id is null and p.name = t.project;
+
+-- Tên công việc trùng nhau → lấy id nhỏ nhất (giống task_stats_base trước đây)
+update public.tasks t
+set job_id = j.id
+from (select distinct on (name) id, name from public.job_catalog order by name, id) j
+where t.job_id is null and j.name = t.task;
+
+-- ==================== Điền id khi thêm / sửa theo tên ====================
+-- Các trang vẫn insert tasks với project / task là tên: trigger tự tìm id.
+-- Chỉ tìm lại khi id còn trống hoặc không còn khớp tên (tránh nhảy sang công việc trùng tên).
+create or replace function public.tasks_resolve_ids()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.project_id is null
+       or (select name from public.projects where id = new.project_id) is distinct from new.project then
+        new.project_id := (select id from public.projects where name = new.project order by id limit 1);
+    end if;
+    if new.job_id is null
+       or (select name from public.job_catalog where id = new.job_id) is distinct from new.task then
+        new.job_id := (select id from public.job_catalog where name = new.task order by id limit 1);
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists tasks_resolve_ids on public.tasks;
+create trigger tasks_resolve_ids
+    before insert or update of project, task, project_id, job_id on public.tasks
+    for each row execute function public.tasks_resolve_ids();
+
+-- ==================== Đồng bộ tên khi đổi tên dự án / công việc ====================
+create or replace function public.projects_sync_task_names()
+returns trigger
+language plpgsql
+as $$
+begin
+    update public.tasks set project = new.name
+    where project_id = new.id and project is distinct from new.name;
+    return null;
+end;
+$$;
+
+drop trigger if exists projects_sync_task_names on public.projects;
+create trigger projects_sync_task_names
+    after update of name on public.projects
+    for each row execute function public.projects_sync_task_names();
+
+create or replace function public.job_catalog_sync_task_names()
+returns trigger
+language plpgsql
+as $$
+begin
+    update public.tasks set task = new.name
+    where job_id = new.id and task is distinct from new.name;
+    return null;
+end;
+$$;
+
+drop trigger if exists job_catalog_sync_task_names on public.job_catalog;
+create trigger job_catalog_sync_task_names
+    after update of name on public.job_catalog
+    for each row execute function public.job_catalog_sync_task_names();
+
+-- ==================== Thống kê join theo job_id, lọc theo project_id ====================
+-- project_id thêm ở cuối (create or replace view chỉ thêm được cột ở cuối)
+create or replace view public.task_stats_base as
+select
+    t.id,
+    t.project,
+    t.assignee,
+    t.progress,
+    coalesce(parent.name, j.name, jn.name, t.task) as parent_job,
+    t.project_id
+from public.tasks t
+left join public.job_catalog j on j.id = t.job_id
+-- dòng chưa có job_id (tên không có trong mục lục lúc backfill) → tìm theo tên như cũ
+left join lateral (
+    select jc.name, jc.parent_id
+    from public.job_catalog jc
+    where t.job_id is null and jc.name = t.task
+    order by jc.id
+    limit 1
+) jn on true
+left join public.job_catalog parent on parent.id = coalesce(j.parent_id, jn.parent_id);
+
+-- task_stats nhận id dự án (index tasks_project_id_updated_at_idx) thay vì tên;
+-- vẫn trả về tên project để phía Python gộp nhóm / hiển thị như cũ.
+drop function if exists public.task_stats(text[]);
+
+create or replace function public.task_stats(project_ids bigint[])
+returns table (
+    project        text,
+    assignee       text,
+    parent_job     text,
+    total          bigint,
+    done           bigint,
+    not_done       bigint,
+    progress_sum   numeric,
+    progress_count bigint
+)
+language sql
+stable
+as $$
+    select
+        b.project,
+        b.assignee,
+        b.parent_job,
+        count(b.id),
+        count(*) filter (where b.progress = 100),
+        count(*) filter (where b.progress < 100),
+        coalesce(sum(b.progress), 0),
+        count(b.progress)
+    from public.task_stats_base b
+    where b.project_id = any(project_ids)
+    group by b.project, b.assignee, b.parent_job;
+$$;
+
+-- ==================== Đổi tên dự án: tasks đi theo project_id ====================
+create or replace function public.rename_project(old_name text, new_name text)
+returns jsonb
+language plpgsql
+as $$
+declare
+    pid bigint;
+    n_projects integer;
+    n_tasks integer;
+    n_members integer;
+begin
+    if old_name = new_name then
+        return jsonb_build_object('projects', 0, 'tasks', 0, 'members', 0);
+    end if;
+    if exists (select 1 from public.projects where name = new_name) then
+        raise exception 'duplicate key: project % already exists', new_name
+            using errcode = 'unique_violation';
+    end if;
+
+    -- trigger projects_sync_task_names đổi tasks.project theo project_id
+    update public.projects set name = new_name where name = old_name returning id into pid;
+    get diagnostics n_projects = row_count;
+
+    -- dòng cũ chưa có project_id
+    update public.tasks set project = new_name where project = old_name;
+
+    select count(*) into n_tasks from public.tasks where project_id = pid;
+    select count(*) into n_members from public.project_members where project_id = pid;
+
+    return jsonb_build_object('projects', n_projects, 'tasks', n_tasks, 'members', n_members);
+end;
+$$;
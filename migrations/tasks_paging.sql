@@ -0,0 +1,33 @@
+-- Index cho task_store.fetch_page: lọc theo dự án + người thực hiện, sắp theo ngày rồi id.
+-- Chạy sau tasks_fk_ids.sql.
+
+create index if not exists tasks_project_id_assignee_start_date_idx
+    on public.tasks (project_id, assignee, start_date, id);
+
+-- DB chưa có project_id thì fetch_page lọc theo tên dự án
+create index if not exists tasks_project_assignee_start_date_idx
+    on public.tasks (project, assignee, start_date, id);
+
+-- Năm / quý / người thực hiện có công nhật của 1 dự án (dùng bởi task_store.quarter_counts):
+-- ô chọn năm, quý và danh sách user của trang công nhật không phải tải cả dự án.
+create or replace function public.task_quarter_counts(p_project_id bigint)
+returns table (
+    assignee  text,
+    year      integer,
+    quarter   integer,
+    n         bigint,
+    last_date date
+)
+language sql
+stable
+as $$
+    select
+        t.assignee,
+        extract(year from t.start_date)::integer,
+        extract(quarter from t.start_date)::integer,
+        count(*),
+        max(t.start_date)
+    from public.tasks t
+    where t.project_id = p_project_id and t.start_date is not null
+    group by 1, 2, 3;
+$$;
@@ -0,0 +1,71 @@
+"""
+Chuyển giờ công nhật nằm trong note sang các cột start_time, end_time, end_date
+(tạo cột trước bằng migrations/tasks_time_fields.sql).
+
+    python -m migrations.tasks_time_fields            # ghi vào DB
+    python -m migrations.tasks_time_fields --dry-run  # chỉ đếm, không ghi
+
+Chỉ xử lý các dòng có "⏰ ..." trong note và chưa có start_time; note được
+bỏ phần giờ / ngày và giữ lại ghi chú. Chạy lại nhiều lần vẫn an toàn.
+"""
+import argparse
+
+from auth import get_connection
+import repository
+from timesheet import parse_note
+
+PAGE_SIZE = 1000
+
+
+def iter_legacy_rows(supabase):
+    """Các task còn giờ trong note (đọc theo trang)."""
+    start = 0
+    while True:
+        res = supabase.table("tasks").select("id, note, start_date") \
+            .is_("start_time", None).like("note", "%⏰%") \
+            .order("id").range(start, start + PAGE_SIZE - 1).execute()
+        rows = res.data or []
+        yield from rows
+        if len(rows) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+
+
+def backfill_change(rec: dict):
+    """{"id", note, start_time, end_time, end_date} cho 1 task, hoặc None nếu note không có giờ."""
+    parsed = parse_note(rec.get("note"))
+    if not (parsed["start_time"] and parsed["end_time"]):
+        return None
+    return {
+        "id": int(rec["id"]),
+        "note": parsed["text"],
+        "start_time": parsed["start_time"],
+        "end_time": parsed["end_time"],
+        "end_date": parsed["end_date"] or rec.get("start_date"),
+    }
+
+
+def migrate(dry_run: bool = False) -> int:
+    supabase = get_connection()
+    changes = [c for c in map(backfill_change, iter_legacy_rows(supabase)) if c]
+
+    if not dry_run:
+        results = repository.bulk_update_tasks(changes)
+        failed = {tid: err for tid, err in results.items() if err}
+        if failed:
+            raise RuntimeError(f"Lỗi khi cập nhật {len(failed)} task: {failed}")
+    return len(changes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chuyển giờ công nhật từ note sang cột riêng")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ đếm số dòng, không ghi")
+    args = parser.parse_args()
+
+    count = migrate(dry_run=args.dry_run)
+    action = "Sẽ chuyển" if args.dry_run else "Đã chuyển"
+    print(f"✅ {action} {count} task sang start_time / end_time / end_date")
+
+
+if __name__ == "__main__":
+    main()
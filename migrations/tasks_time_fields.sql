@@ -0,0 +1,25 @@
+-- Cột riêng cho giờ công nhật (dùng bởi timesheet.py), thay cho chuỗi
+-- "⏰ HH:MM - HH:MM (YYYY-MM-DD → YYYY-MM-DD)" nhét trong note.
+-- Sau khi chạy file này: python -m migrations.tasks_time_fields để chuyển dữ liệu cũ.
+
+alter table public.tasks
+    add column if not exists start_time time,
+    add column if not exists end_time   time,
+    add column if not exists end_date   date;
+
+-- bulk_update_tasks ghi được cả các cột mới
+create or replace function public.bulk_update_tasks(changes jsonb)
+returns table (id bigint)
+language sql
+as $$
+    update public.tasks t
+    set (task, khoi_luong, progress, deadline, start_date, note, approved,
+         start_time, end_time, end_date) = (
+        select r.task, r.khoi_luong, r.progress, r.deadline, r.start_date, r.note, r.approved,
+               r.start_time, r.end_time, r.end_date
+        from jsonb_populate_record(t, c) r
+    )
+    from jsonb_array_elements(changes) c
+    where t.id = (c ->> 'id')::bigint
+    returning t.id::bigint;
+$$;
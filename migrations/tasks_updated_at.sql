@@ -0,0 +1,22 @@
+-- Mốc thời gian sửa đổi cho tasks, để task_store chỉ tải lại các dòng mới thay đổi.
+
+alter table public.tasks
+    add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists tasks_set_updated_at on public.tasks;
+create trigger tasks_set_updated_at
+    before update on public.tasks
+    for each row execute function public.set_updated_at();
+
+create index if not exists tasks_project_updated_at_idx
+    on public.tasks (project, updated_at);
@@ -0,0 +1,14 @@
+-- Ghi last_seen của nhiều user trong 1 request (dùng bởi presence.flush).
+-- entries: mảng JSON [{"username": "...", "last_seen": "2024-01-01T08:00:00+00:00"}, ...]
+-- Chỉ cập nhật user đã tồn tại và không lùi mốc thời gian.
+
+create or replace function public.touch_last_seen(entries jsonb)
+returns void
+language sql
+as $$
+    update public.users u
+    set last_seen = e.last_seen
+    from jsonb_to_recordset(entries) as e(username text, last_seen timestamptz)
+    where u.username = e.username
+      and (u.last_seen is null or u.last_seen < e.last_seen);
+$$;
@@ -0,0 +1,67 @@
+"""
+Điền users.username_key cho các user đã có (tạo cột trước bằng migrations/users_username_key.sql).
+
+    python -m migrations.users_username_key            # ghi vào DB
+    python -m migrations.users_username_key --dry-run  # chỉ đếm, không ghi
+
+Nếu 2 user khác nhau có cùng khoá (vd "NguyenA" và "nguyena") thì dừng và in
+danh sách để xử lý tay trước khi tạo unique index. Chạy lại nhiều lần vẫn an toàn.
+"""
+import argparse
+
+from auth import get_connection, username_key
+
+PAGE_SIZE = 1000
+
+
+def iter_users(supabase):
+    start = 0
+    while True:
+        res = supabase.table("users").select("id, username, username_key") \
+            .order("id").range(start, start + PAGE_SIZE - 1).execute()
+        rows = res.data or []
+        yield from rows
+        if len(rows) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+
+
+def plan(rows) -> tuple[list[dict], dict[str, list[str]]]:
+    """(các dòng cần ghi {"id", "username_key"}, {khoá: [username trùng]})."""
+    by_key: dict[str, list[str]] = {}
+    changes = []
+    for r in rows:
+        key = username_key(r["username"])
+        by_key.setdefault(key, []).append(r["username"])
+        if r.get("username_key") != key:
+            changes.append({"id": r["id"], "username_key": key})
+    collisions = {k: names for k, names in by_key.items() if len(names) > 1}
+    return changes, collisions
+
+
+def migrate(dry_run: bool = False) -> int:
+    supabase = get_connection()
+    changes, collisions = plan(iter_users(supabase))
+    if collisions:
+        lines = "\n".join(f"  {k}: {', '.join(names)}" for k, names in collisions.items())
+        raise RuntimeError(f"Có {len(collisions)} username trùng khoá, cần xử lý trước:\n{lines}")
+
+    if not dry_run:
+        for change in changes:
+            supabase.table("users").update({"username_key": change["username_key"]}) \
+                .eq("id", change["id"]).execute()
+    return len(changes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Điền users.username_key cho dữ liệu cũ")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ đếm số dòng, không ghi")
+    args = parser.parse_args()
+
+    count = migrate(dry_run=args.dry_run)
+    action = "Sẽ cập nhật" if args.dry_run else "Đã cập nhật"
+    print(f"✅ {action} username_key cho {count} user")
+
+
+if __name__ == "__main__":
+    main()
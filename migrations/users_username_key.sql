@@ -0,0 +1,32 @@
+-- Khoá so khớp username (auth.username_key): bỏ khoảng trắng đầu/cuối, Unicode NFC, chữ thường.
+-- Trigger dưới đây và auth.username_key dùng đúng 1 quy tắc (lower, không casefold).
+-- Thứ tự: chạy file này → python -m migrations.users_username_key → tạo unique index ở cuối file
+-- (script backfill liệt kê các username trùng khoá cần xử lý trước).
+
+alter table public.users
+    add column if not exists username_key text;
+
+-- App luôn tự ghi username_key (auth.username_key). Trigger chỉ điền khi dòng được
+-- thêm / đổi username từ nơi khác (SQL tay, dashboard) mà không kèm khoá.
+create or replace function public.set_username_key()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.username_key is null
+       or (tg_op = 'UPDATE'
+           and new.username is distinct from old.username
+           and new.username_key is not distinct from old.username_key) then
+        new.username_key := lower(normalize(btrim(new.username, E' \t\n\r\f\x0B'), NFC));
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists users_set_username_key on public.users;
+create trigger users_set_username_key
+    before insert or update of username, username_key on public.users
+    for each row execute function public.set_username_key();
+
+-- Sau khi backfill:
+create unique index if not exists users_username_key_idx on public.users (username_key);
@@ -0,0 +1,33 @@
+-- Dự án 1 user được thấy, trong 1 request (dùng bởi project_service.visible_projects):
+-- public + dự án có task giao cho user + (nếu include_managed) dự án user là Chủ nhiệm / Chủ trì.
+-- Cột managed cho biết user có quản lý dự án đó không.
+-- Chạy sau project_members.sql và tasks_fk_ids.sql.
+
+create index if not exists tasks_assignee_project_id_idx on public.tasks (assignee, project_id);
+
+create or replace function public.visible_projects(p_username text, p_include_managed boolean default true)
+returns table (
+    id           bigint,
+    name         text,
+    deadline     date,
+    project_type text,
+    managed      boolean
+)
+language sql
+stable
+as $$
+    select p.id, p.name, p.deadline, p.project_type, m.project_id is not null as managed
+    from public.projects p
+    left join (
+        select distinct project_id from public.project_members where username = p_username
+    ) m on m.project_id = p.id
+    where p.project_type = 'public'
+       or (p_include_managed and m.project_id is not null)
+       or exists (
+            -- task chưa có project_id (giao trước khi dự án được tạo) khớp theo tên
+            select 1 from public.tasks t
+            where t.assignee = p_username
+              and (t.project_id = p.id or (t.project_id is null and t.project = p.name))
+       )
+    order by p.name;
+$$;
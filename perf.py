@@ -0,0 +1,202 @@
+# perf.py
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+
+# ==================== ĐO THỜI GIAN CÁC ĐOẠN NÓNG ====================
+# - rerun(page, user): bao quanh 1 lần chạy lại script của 1 trang (main.py).
+#   set_section(...) đặt tên mục đang mở (vd chức năng admin chọn ở sidebar).
+# - span(name, rows=, nbytes=) / @timed(name): đo 1 đoạn (dựng AG-Grid, tính giờ công, xuất Excel...).
+#   Span "db:<bảng>.<thao tác>" do db_client ghi cho từng truy vấn Supabase.
+# - Kết quả nằm trong 2 ring buffer có giới hạn (chung toàn tiến trình) → trang "Hiệu năng" của admin.
+# Mỗi lần rerun tách được: thời gian chờ DB, dựng grid, phần còn lại (pandas / Streamlit).
+
+SPAN_BUFFER = 5000
+RERUN_BUFFER = 500
+
+# Tiền tố tên span dùng để gộp thời gian của 1 lần rerun
+DB_PREFIX = "db:"
+GRID_PREFIX = "grid:"
+
+_spans: deque = deque(maxlen=SPAN_BUFFER)
+_reruns: deque = deque(maxlen=RERUN_BUFFER)
+_lock = threading.Lock()
+
+# Lần rerun đang chạy của luồng hiện tại (mỗi phiên Streamlit chạy script trong luồng riêng)
+_current = contextvars.ContextVar("perf_rerun", default=None)
+
+
+class _Rerun:
+    def __init__(self, page: str, user: str):
+        self.page = page
+        self.section = ""
+        self.user = user
+        self.started = time.time()
+        self.spans: list[tuple[str, float]] = []
+
+
+class Span:
+    """Span đang đo; gán rows / nbytes khi biết (vd sau khi tải xong dữ liệu)."""
+
+    def __init__(self, name: str, rows: int = None, nbytes: int = None):
+        self.name = name
+        self.rows = rows
+        self.nbytes = nbytes
+
+    def set(self, rows: int = None, nbytes: int = None):
+        if rows is not None:
+            self.rows = rows
+        if nbytes is not None:
+            self.nbytes = nbytes
+
+
+def record(name: str, duration: float, rows: int = None, nbytes: int = None):
+    """Ghi 1 span đã đo xong (giây)."""
+    run = _current.get()
+    with _lock:
+        _spans.append({
+            "ts": time.time(),
+            "name": name,
+            "duration": duration,
+            "rows": rows,
+            "bytes": nbytes,
+            "page": f"{run.page}/{run.section}" if run else None,
+        })
+    if run is not None:
+        run.spans.append((name, duration))
+
+
+@contextmanager
+def span(name: str, rows: int = None, nbytes: int = None):
+    s = Span(name, rows, nbytes)
+    started = time.perf_counter()
+    try:
+        yield s
+    finally:
+        record(name, time.perf_counter() - started, s.rows, s.nbytes)
+
+
+def timed(name: str, rows=None, nbytes=None):
+    """
+    Decorator đo thời gian hàm.
+    - rows / nbytes: hàm nhận kết quả trả về → số dòng / số byte (không bắt buộc)
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name) as s:
+                result = fn(*args, **kwargs)
+                s.set(rows(result) if rows else None, nbytes(result) if nbytes else None)
+            return result
+        return wrapper
+    return deco
+
+
+def set_section(section: str):
+    """Đặt tên mục đang mở trong lần rerun hiện tại."""
+    run = _current.get()
+    if run is not None:
+        run.section = str(section)
+
+
+@contextmanager
+def rerun(page: str, user: str = None):
+    """Đo 1 lần chạy lại trang (kể cả khi kết thúc bằng st.rerun() / st.stop())."""
+    run = _Rerun(page, user)
+    token = _current.set(run)
+    started = time.perf_counter()
+    try:
+        yield run
+    finally:
+        total = time.perf_counter() - started
+        _current.reset(token)
+
+        db = sum(d for n, d in run.spans if n.startswith(DB_PREFIX))
+        grid = sum(d for n, d in run.spans if n.startswith(GRID_PREFIX))
+        others = {}
+        for n, d in run.spans:
+            if not n.startswith(DB_PREFIX):
+                others[n] = others.get(n, 0.0) + d
+        top = sorted(others.items(), key=lambda kv: kv[1], reverse=True)[:3]
+
+        with _lock:
+            _reruns.append({
+                "ts": run.started,
+                "section": f"{page}/{run.section}" if run.section else page,
+                "user": user,
+                "total": total,
+                "db": db,
+                "db_calls": sum(1 for n, _ in run.spans if n.startswith(DB_PREFIX)),
+                "grid": grid,
+                "other": max(0.0, total - db - grid),
+                "top_spans": ", ".join(f"{n} {d * 1000:.0f}ms" for n, d in top),
+            })
+
+
+# ==================== BÁO CÁO ====================
+
+def _percentiles(df: pd.DataFrame, key: str, value: str) -> pd.DataFrame:
+    g = df.groupby(key)[value]
+    out = pd.DataFrame({
+        "count": g.size(),
+        "p50_ms": g.quantile(0.5) * 1000,
+        "p95_ms": g.quantile(0.95) * 1000,
+        "max_ms": g.max() * 1000,
+        "total_s": g.sum(),
+    })
+    return out.round({"p50_ms": 1, "p95_ms": 1, "max_ms": 1, "total_s": 2})
+
+
+def rerun_stats() -> pd.DataFrame:
+    """p50 / p95 thời gian rerun theo trang/mục, kèm phần trung bình dành cho DB và grid."""
+    with _lock:
+        rows = list(_reruns)
+    if not rows:
+        return pd.DataFrame(columns=["section", "count", "p50_ms", "p95_ms", "max_ms", "total_s",
+                                     "avg_db_ms", "avg_grid_ms"])
+    df = pd.DataFrame(rows)
+    out = _percentiles(df, "section", "total")
+    out["avg_db_ms"] = (df.groupby("section")["db"].mean() * 1000).round(1)
+    out["avg_grid_ms"] = (df.groupby("section")["grid"].mean() * 1000).round(1)
+    return out.sort_values("p95_ms", ascending=False).reset_index()
+
+
+def span_stats() -> pd.DataFrame:
+    """p50 / p95 theo tên span, kèm số dòng / số byte trung bình."""
+    with _lock:
+        rows = list(_spans)
+    if not rows:
+        return pd.DataFrame(columns=["name", "count", "p50_ms", "p95_ms", "max_ms", "total_s",
+                                     "avg_rows", "avg_bytes"])
+    df = pd.DataFrame(rows)
+    out = _percentiles(df, "name", "duration")
+    out["avg_rows"] = df.groupby("name")["rows"].mean().round(0)
+    out["avg_bytes"] = df.groupby("name")["bytes"].mean().round(0)
+    return out.sort_values("total_s", ascending=False).reset_index()
+
+
+def slowest_reruns(n: int = 20) -> pd.DataFrame:
+    """n lần rerun chậm nhất còn trong buffer (ms)."""
+    with _lock:
+        rows = list(_reruns)
+    columns = ["time", "section", "user", "total_ms", "db_ms", "db_calls", "grid_ms", "other_ms", "top_spans"]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame(rows).nlargest(n, "total")
+    df["time"] = df["ts"].map(lambda t: datetime.fromtimestamp(t).strftime("%d/%m %H:%M:%S"))
+    for col in ["total", "db", "grid", "other"]:
+        df[f"{col}_ms"] = (df[col] * 1000).round(0)
+    return df[columns].reset_index(drop=True)
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _reruns.clear()
@@ -0,0 +1,143 @@
+# presence.py
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from auth import get_connection
+import db_client
+
+
+# ==================== TRẠNG THÁI ONLINE (last_seen) ====================
+# Mỗi lần rerun chỉ ghi nhận heartbeat vào bộ nhớ (không gọi DB).
+# 1 luồng nền gom heartbeat của mọi user và ghi last_seen theo lô,
+# tối đa 1 lần mỗi FLUSH_INTERVAL giây (RPC touch_last_seen, xem
+# migrations/touch_last_seen.sql).
+
+FLUSH_INTERVAL = float(os.environ.get("PRESENCE_FLUSH_INTERVAL", 15))
+
+# Khoảng thời gian (giây) coi là đang online
+ONLINE_WINDOW = 60
+
+_lock = threading.Lock()
+_pending: dict[str, datetime] = {}     # heartbeat chưa ghi xuống DB
+_seen: dict[str, datetime] = {}        # heartbeat gần nhất của mỗi user (tiến trình này)
+_db_snapshot = (0.0, {})              # (thời điểm đọc, {username: last_seen}) từ DB
+_flusher: threading.Thread = None
+_wake = threading.Event()
+
+# None = chưa biết, False = DB chưa có hàm RPC → update theo lô bằng in_
+_rpc_available = None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _username_of(user) -> str:
+    """Chấp nhận username (str), tuple user (id, username, ...) hoặc dict user."""
+    if isinstance(user, dict):
+        user = user.get("username")
+    elif isinstance(user, (tuple, list)):
+        user = user[1] if len(user) > 1 else None
+    return str(user).strip() if user else ""
+
+
+def _ensure_flusher():
+    global _flusher
+    with _lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name="presence-flusher", daemon=True)
+            _flusher.start()
+
+
+def heartbeat(user):
+    """Ghi nhận user vừa thao tác. Không chặn: chỉ cập nhật bộ nhớ."""
+    username = _username_of(user)
+    if not username:
+        return
+    ts = _now()
+    with _lock:
+        _pending[username] = ts
+        _seen[username] = ts
+    _ensure_flusher()
+
+
+def _write_batch(supabase, batch: dict):
+    global _rpc_available
+
+    if _rpc_available is not False:
+        entries = [{"username": u, "last_seen": ts.isoformat()} for u, ts in batch.items()]
+        try:
+            supabase.rpc("touch_last_seen", {"entries": entries}).execute()
+            _rpc_available = True
+            return
+        except Exception as e:
+            if not db_client.is_missing_function(e):
+                raise
+            _rpc_available = False
+
+    # Dự phòng: 1 request cho cả lô, dùng mốc mới nhất của lô
+    supabase.table("users").update(
+        {"last_seen": max(batch.values()).isoformat()}
+    ).in_("username", list(batch)).execute()
+
+
+def flush():
+    """Ghi tất cả heartbeat đang chờ xuống DB (1 request)."""
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+    if not batch:
+        return
+
+    try:
+        _write_batch(get_connection(), batch)
+    except Exception as e:
+        # Ghi lỗi thì trả lại hàng đợi (không đè heartbeat mới hơn) để lần sau ghi tiếp
+        with _lock:
+            for u, ts in batch.items():
+                if u not in _pending or _pending[u] < ts:
+                    _pending[u] = ts
+        print(f"⚠️ Lỗi khi ghi last_seen: {e}")
+
+
+def _flush_loop():
+    while True:
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        flush()
+
+
+def _db_last_seen() -> dict:
+    """last_seen trên DB (để thấy cả user ở tiến trình khác), đọc lại tối đa 1 lần / FLUSH_INTERVAL."""
+    global _db_snapshot
+
+    read_at, data = _db_snapshot
+    if time.monotonic() - read_at < FLUSH_INTERVAL:
+        return data
+
+    res = get_connection().table("users").select("username, last_seen") \
+        .gte("last_seen", (_now() - timedelta(seconds=ONLINE_WINDOW)).isoformat()).execute()
+    data = {}
+    for r in res.data or []:
+        ts = pd.to_datetime(r.get("last_seen"), errors="coerce", utc=True)
+        if pd.notna(ts):
+            data[str(r["username"]).strip()] = ts.to_pydatetime()
+    _db_snapshot = (time.monotonic(), data)
+    return data
+
+
+def online_users(within: int = ONLINE_WINDOW) -> pd.DataFrame:
+    """User có heartbeat trong `within` giây gần nhất (cột username, last_seen)."""
+    seen = dict(_db_last_seen())
+    with _lock:
+        for u, ts in _seen.items():
+            if u not in seen or seen[u] < ts:
+                seen[u] = ts
+
+    cutoff = _now() - timedelta(seconds=within)
+    rows = [{"username": u, "last_seen": ts} for u, ts in seen.items() if ts >= cutoff]
+    return pd.DataFrame(rows, columns=["username", "last_seen"])
@@ -3,10 +3,17 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from auth import get_connection
-
-import re
-
-from datetime import datetime, date, time, timedelta
+import repository
+import task_store
+import task_stats
+import job_catalog
+import timesheet
+import presence
+import project_service
+import loader
+import perf
+
+from datetime import date, time
 from auth import calc_hours
 
 
@@ -14,65 +21,9 @@ from auth import calc_hours
 # -----------------------------
 # Helpers
 # -----------------------------
-def _load_managed_projects(supabase, username: str) -> list[str]:
-    """Tên các dự án user là Chủ nhiệm/Chủ trì (từ bảng users)."""
-    data = supabase.table("users").select("project_manager_of, project_leader_of").eq("username", username).execute()
-    info = pd.DataFrame(data.data)
-    managed = []
-    if not info.empty:
-        for col in ["project_manager_of", "project_leader_of"]:
-            val = info.at[0, col]
-            if pd.notna(val) and str(val).strip():
-                # ✅ Ưu tiên tách theo dấu |
-                parts = [p.strip() for p in str(val).split("|") if p.strip()]
-                managed += parts
-
-    return sorted(set(managed))
-
-
-
-def _load_visible_projects(supabase, managed: list[str], username: str) -> pd.DataFrame:
-    """Dự án user có thể thấy: managed + public + dự án có task của user."""
-    try:
-        # Dự án public
-        data = supabase.table("projects").select("id, name, deadline, project_type")\
-            .eq("project_type", "public").execute()
-        public_df = pd.DataFrame(data.data)
-    except Exception:
-        # 🔁 Nếu lỗi, tạo lại kết nối Supabase
-        from auth import get_connection
-        supabase = get_connection()
-        data = supabase.table("projects").select("id, name, deadline, project_type")\
-            .eq("project_type", "public").execute()
-        public_df = pd.DataFrame(data.data)
-
-    # Dự án do user quản lý
-    managed_df = pd.DataFrame(columns=["id", "name", "deadline", "project_type"])
-    if managed and len(managed) > 0:
-        try:
-            data = supabase.table("projects").select("id, name, deadline, project_type")\
-                .in_("name", managed).execute()
-            managed_df = pd.DataFrame(data.data)
-        except Exception as e:
-            st.warning(f"⚠️ Không tải được danh sách dự án do bạn quản lý: {e}")
-
-
-    # Dự án user được giao task
-    data = supabase.table("tasks").select("project").eq("assignee", username).execute()
-    assigned_names = list({r["project"] for r in data.data})
-    if assigned_names:
-        data = supabase.table("projects").select("id, name, deadline, project_type")\
-            .in_("name", assigned_names).execute()
-        assigned_df = pd.DataFrame(data.data)
-    else:
-        assigned_df = pd.DataFrame(columns=["id", "name", "deadline", "project_type"])
-
-    # Gộp kết quả
-    all_df = pd.concat([public_df, managed_df, assigned_df], ignore_index=True) \
-               .drop_duplicates(subset=["name"]) \
-               .sort_values("name") \
-               .reset_index(drop=True)
-    return all_df
+def _load_visible_projects(username: str) -> pd.DataFrame:
+    """Dự án user có thể thấy: managed + public + dự án có task của user (1 request, cache theo user)."""
+    return project_service.visible_projects(username, include_managed=True)
 
 
 
@@ -88,21 +39,24 @@ def project_manager_app(user):
     """
     # st.set_page_config(layout="wide")
     supabase = get_connection()
-    try:
-        # 🕒 Cập nhật thời điểm truy cập cuối cùng của user
-        supabase.table("users").update(
-            {"last_seen": datetime.utcnow().isoformat()}
-        ).eq("username", user[1]).execute()
-    except Exception as e:
-        st.warning(f"⚠️ Không thể cập nhật thời gian truy cập: {e}")
-
-    # 🧭 Tải danh sách người dùng
-    try:
-        data = supabase.table("users").select("username, display_name").execute()
-        df_users = pd.DataFrame(data.data)
-    except Exception as e:
-        st.error(f"❌ Lỗi khi tải danh sách người dùng: {e}")
+    # 🕒 Cập nhật thời điểm truy cập cuối cùng của user (ghi nền theo lô, không chặn trang)
+    presence.heartbeat(user)
+
+    username = user[1]
+
+    # 🧭 Tải song song các dữ liệu độc lập của trang: users, dự án thấy được, mục lục công việc
+    # (thời gian chờ ≈ truy vấn chậm nhất thay vì tổng các truy vấn)
+    loaded = loader.gather({
+        "users": repository.load_users,
+        "projects": lambda: _load_visible_projects(username),
+        "catalog": job_catalog.get_catalog,
+    })
+
+    if "users" in loaded.errors:
+        st.error(f"❌ Lỗi khi tải danh sách người dùng: {loaded.errors['users']}")
         df_users = pd.DataFrame(columns=["username", "display_name"])
+    else:
+        df_users = loaded["users"][["username", "display_name"]]
 
     # ✅ Kiểm tra dữ liệu tránh KeyError
     if df_users.empty or "username" not in df_users.columns:
@@ -112,16 +66,19 @@ def project_manager_app(user):
     # 🧩 Tạo map username → display_name (nếu thiếu display_name thì fallback bằng username)
     user_map = dict(zip(df_users["username"], df_users.get("display_name", df_users["username"])))
 
-    username = user[1]
-
-    managed = _load_managed_projects(supabase, username)
-    projects_df = _load_visible_projects(supabase, managed, username)
+    if "projects" in loaded.errors:
+        st.error(f"❌ Lỗi khi tải danh sách dự án: {loaded.errors['projects']}")
+        return
+    projects_df = loaded["projects"]
+    # Dự án user là Chủ nhiệm/Chủ trì (cột managed trả về cùng truy vấn)
+    managed = projects_df.loc[projects_df["managed"].astype(bool), "name"].tolist()
 
     if projects_df.empty:
         st.warning("⚠️ Chưa có dự án nào bạn có quyền xem hoặc quản lý.")
         return
 
     choice = st.sidebar.radio("Chức năng", ["Quản lý Giao Việc", "Thống kê Công Việc"])
+    perf.set_section(choice)
 
         # ===========================================================
         # 1) QUẢN LÝ GIAO VIỆC / NHIỆM VỤ CỦA TÔI
@@ -137,24 +94,14 @@ def project_manager_app(user):
         is_public = (proj_type == "public")
         is_manager = project in managed
 
-        # Chuẩn hoá job_catalog: NULL -> 'group'
-        # ✅ An toàn hơn: Chuẩn hoá job_catalog để tránh lỗi NULL / mất kết nối
+        # ✅ Lấy danh mục công việc từ chỉ mục dùng chung (project_type NULL được coi là 'group')
         try:
-            supabase.table("job_catalog").update({"project_type": "group"}).is_("project_type", None).execute()
-        except Exception:
-            st.warning("⚠️ Không thể chuẩn hoá dữ liệu job_catalog, thử lại sau.")
-
-        # ✅ Lấy danh mục công việc an toàn
-        try:
-            data = supabase.table("job_catalog").select("id, name, unit, parent_id") \
-                .eq("project_type", proj_type).execute()
-            jobs = pd.DataFrame(data.data)
+            catalog = job_catalog.get_catalog()
+            jobs = catalog.jobs_of_type(proj_type)
         except Exception as e:
             st.error(f"❌ Lỗi khi tải danh mục công việc: {e}")
             st.stop()
 
-        parent_jobs = jobs[jobs["parent_id"].isnull()].sort_values("name")
-
         # =======================================================
         # A. QUẢN LÝ DỰ ÁN: giao việc + xem/sửa toàn bộ công việc
         # =======================================================
@@ -189,19 +136,17 @@ def project_manager_app(user):
                 c1, c2, c3, c4, c5 = st.columns([2, 2, 2, 2, 2])
                 with c1:
                     p_choice = st.selectbox(
-                        "", parent_jobs["name"].tolist(),
+                        "", catalog.root_names(proj_type),
                         key=f"pm_parent_{i}", label_visibility="collapsed"
                     )
-                pid = int(parent_jobs.loc[parent_jobs["name"] == p_choice, "id"].iloc[0])
-                childs = jobs[jobs["parent_id"] == pid].sort_values("name")
                 with c2:
                     child_choice = st.selectbox(
-                        "", childs["name"].tolist(),
+                        "", catalog.child_names(p_choice, proj_type),
                         key=f"pm_child_{i}", label_visibility="collapsed"
                     )
 
                 task_name = child_choice or p_choice
-                unit = jobs.loc[jobs["name"] == task_name, "unit"].iloc[0] if task_name in jobs["name"].values else ""
+                unit = catalog.unit_of(task_name) if task_name in jobs["name"].values else ""
 
                 if str(unit).strip().lower() == "công":
                     with c3:
@@ -230,18 +175,16 @@ def project_manager_app(user):
                     task_name = child_choice or p_choice
                     if not task_name:
                         continue
-                    unit = jobs.loc[jobs["name"] == task_name, "unit"].iloc[0] if task_name in jobs["name"].values else ""
+                    unit = catalog.unit_of(task_name) if task_name in jobs["name"].values else ""
 
                     if str(unit).strip().lower() == "công":
                         stime = st.session_state.get(f"pm_start_{i}")
                         etime = st.session_state.get(f"pm_end_{i}")
-                        time_txt = f"⏰ {stime} - {etime}" if stime and etime else ""
-                        note = (note_common + ("\n" if note_common and time_txt else "") + time_txt).strip()
                         supabase.table("tasks").insert({
                             "project": project,
                             "task": task_name,
                             "assignee": assignee,
-                            "note": note,
+                            **timesheet.task_fields(stime, etime, text=note_common),
                             "progress": 0
                         }).execute()
                     else:
@@ -260,6 +203,8 @@ def project_manager_app(user):
                         }).execute()
                 
                 st.success("✅ Đã giao việc")
+                task_store.invalidate_project(project)
+                project_service.invalidate_visible()
                 st.rerun()
 
             # ---- Bảng tất cả công việc: sửa & lưu tiến độ ----
@@ -267,8 +212,15 @@ def project_manager_app(user):
             st.subheader("📋 Tất cả công việc trong dự án")
 
             
-            data = supabase.table("tasks").select("id, assignee, task, khoi_luong, deadline, note, progress").eq("project", project).execute()
-            df_all = pd.DataFrame(data.data)
+            df_all = task_store.get_tasks(project)
+            # Giờ công nhật nằm ở cột riêng → ghi chú chỉ hiển thị phần chữ, giờ hiển thị ở cột "Giờ"
+            all_times = timesheet.time_fields(df_all)
+            times_by_id = dict(zip(df_all["id"].astype(int), all_times.to_dict("records")))
+            df_all = df_all[["id", "assignee", "task", "khoi_luong", "deadline", "note", "progress"]].copy()
+            df_all["note"] = all_times["text"]
+            df_all.insert(df_all.columns.get_loc("note"), "Giờ", (
+                all_times["start_time"] + " - " + all_times["end_time"]
+            ).where(all_times["start_time"] != "", ""))
             df_all["assignee"] = df_all["assignee"].map(user_map).fillna(df_all["assignee"])
 
             if df_all.empty:
@@ -293,31 +245,31 @@ def project_manager_app(user):
                 df_display = df_all.drop(columns=["ID"], errors="ignore").copy()
                 df_display["Xóa?"] = False
 
-                edited_df = st.data_editor(
-                    df_display,
-                    width="stretch",
-                    key=f"editor_all_{project}",
-                    hide_index=True,
-                    column_config={
-                        "Người thực hiện": st.column_config.TextColumn(disabled=True),
-                        "Công việc": st.column_config.TextColumn(disabled=True),
-                        "Khối lượng": st.column_config.NumberColumn("Khối lượng", min_value=0, step=0.25),
-                        "Deadline": st.column_config.DateColumn("Deadline", format="YYYY-MM-DD"),
-                        "Ghi chú": st.column_config.TextColumn(),
-                        "Tiến độ (%)": st.column_config.NumberColumn("Tiến độ (%)", min_value=0, max_value=100, step=1),
-                        "Xóa?": st.column_config.CheckboxColumn("Xóa?", help="Tick để xóa dòng này")
-                    }
-                )
+                with perf.span("grid:pm.tasks", rows=len(df_display)):
+                    edited_df = st.data_editor(
+                        df_display,
+                        width="stretch",
+                        key=f"editor_all_{project}",
+                        hide_index=True,
+                        column_config={
+                            "Người thực hiện": st.column_config.TextColumn(disabled=True),
+                            "Công việc": st.column_config.TextColumn(disabled=True),
+                            "Giờ": st.column_config.TextColumn(disabled=True),
+                            "Khối lượng": st.column_config.NumberColumn("Khối lượng", min_value=0, step=0.25),
+                            "Deadline": st.column_config.DateColumn("Deadline", format="YYYY-MM-DD"),
+                            "Ghi chú": st.column_config.TextColumn(),
+                            "Tiến độ (%)": st.column_config.NumberColumn("Tiến độ (%)", min_value=0, max_value=100, step=1),
+                            "Xóa?": st.column_config.CheckboxColumn("Xóa?", help="Tick để xóa dòng này")
+                        }
+                    )
 
                 col1, col2 = st.columns([1, 1])
 
                 # Nút lưu cập nhật công việc
                 with col1:                        
                     if st.button("💾 Lưu cập nhật công việc", key=f"save_all_{project}"):
-                        supabase = get_connection()  # ✅ Tạo lại kết nối Supabase ngay trước khi update
-                    
-                        for i, row in edited_df.iterrows():
-                            task_id = int(df_all.iloc[i]["ID"])
+
+                        def _task_fields(row):
                             update_data = {}
 
                             # --- Khối lượng ---
@@ -347,17 +299,30 @@ def project_manager_app(user):
                                     val = ""
                                 else:
                                     val = str(val).strip()
-                                update_data["note"] = val
-
-                            # --- Nếu có dữ liệu để cập nhật ---
-                            if update_data:
-                                try:
-                                    supabase.table("tasks").update(update_data).eq("id", task_id).execute()
-                                except Exception as e:
-                                    st.error(f"❌ Lỗi khi cập nhật task {task_id}: {e}")
-
-                    
-                        st.success("✅ Đã lưu cập nhật công việc vào cơ sở dữ liệu!")
+                                # Giữ nguyên giờ / khoảng ngày của công nhật khi sửa ghi chú
+                                t = times_by_id.get(int(row["ID"]), {})
+                                update_data.update(timesheet.task_fields(
+                                    t.get("start_time"), t.get("end_time"), t.get("start_date"), t.get("end_date"), val
+                                ))
+
+                            return update_data
+
+                        # ✅ Chỉ gửi các dòng thực sự thay đổi, gộp thành 1 request (theo lô)
+                        ids = df_all["ID"].values
+                        changes = repository.diff_task_rows(
+                            df_display.assign(ID=ids), edited_df.assign(ID=ids), _task_fields
+                        )
+                        results = repository.bulk_update_tasks(changes)
+                        task_store.invalidate_project(project)
+
+                        for task_id, err in results.items():
+                            if err:
+                                st.error(f"❌ Lỗi khi cập nhật task {task_id}: {err}")
+
+                        if changes:
+                            st.success(f"✅ Đã lưu {sum(1 for e in results.values() if not e)} công việc có thay đổi vào cơ sở dữ liệu!")
+                        else:
+                            st.info("ℹ️ Không có công việc nào thay đổi.")
                         st.rerun()
 
 
@@ -374,7 +339,8 @@ def project_manager_app(user):
                         if ids_to_delete:
                             for tid in ids_to_delete:
                                 supabase.table("tasks").delete().eq("id", tid).execute()
-                            
+                            task_store.invalidate_project(project)
+
                             st.success(f"✅ Đã xóa {len(ids_to_delete)} công việc")
                             st.rerun()
                         else:
@@ -396,18 +362,15 @@ def project_manager_app(user):
             )
 
             # ====== Danh sách công việc của chính user ======
-            data = supabase.table("tasks").select("id, task, khoi_luong, deadline, note, progress")\
-                .eq("project", project).eq("assignee", username).execute()
-            my_tasks = pd.DataFrame(data.data)
-            # === Tách giờ bắt đầu và kết thúc từ note nếu có dạng "⏰ 08:00 - 17:00 (...)" ===
-            def extract_times(note):
-                match = re.search(r"(\d{2}:\d{2})\s*-\s*(\d{2}:\d{2})", str(note))
-                if match:
-                    return match.group(1), match.group(2)
-                return "", ""
+            my_tasks = task_store.get_tasks(project, assignee=username)
+            # === Giờ bắt đầu / kết thúc, khoảng ngày và ghi chú (cột riêng, hoặc note với dữ liệu cũ) ===
+            my_times = timesheet.time_fields(my_tasks)
+            my_tasks = my_tasks[["id", "task", "khoi_luong", "deadline", "note", "progress"]].copy()
+            my_tasks["note"] = my_times["text"]
 
             if not my_tasks.empty:
-                my_tasks["Giờ bắt đầu"], my_tasks["Giờ kết thúc"] = zip(*my_tasks["note"].map(extract_times))
+                my_tasks["Giờ bắt đầu"] = my_times["start_time"]
+                my_tasks["Giờ kết thúc"] = my_times["end_time"]
 
                 def _to_time(x):
                     if x is None or str(x).strip() == "":
@@ -422,21 +385,6 @@ def project_manager_app(user):
 
                 my_tasks["Giờ bắt đầu"] = my_tasks["Giờ bắt đầu"].map(_to_time)
                 my_tasks["Giờ kết thúc"] = my_tasks["Giờ kết thúc"].map(_to_time)
-            
-                        
-            # 🧹 Làm sạch ghi chú: loại bỏ trùng lặp giờ/ngày nếu có
-            if not my_tasks.empty and "note" in my_tasks.columns:
-                def clean_note(n: str):
-                    if not isinstance(n, str) or not n.strip():
-                        return ""
-                    # Giữ lại duy nhất phần đầu chứa "⏰ HH:MM - HH:MM (...)" nếu xuất hiện nhiều
-                    matches = re.findall(r"⏰\s*\d{2}:\d{2}\s*-\s*\d{2}:\d{2}.*?\)", n)
-                    if len(matches) > 1:
-                        rest = n.split(matches[-1])[-1].strip()
-                        return f"{matches[0]} {rest}".strip()
-                    return n.strip()
-
-                my_tasks["note"] = my_tasks["note"].map(clean_note)
 
 
 
@@ -462,19 +410,20 @@ def project_manager_app(user):
                     df_show = df_show.drop(columns=drop_cols, errors="ignore")
 
                 # Hiển thị bảng cho user chỉnh sửa (không có cột ID)
-                edited = st.data_editor(
-                    df_show,
-                    key="my_tasks_editor",
-                    width="stretch",
-                    hide_index=True,
-                    column_config={
-                        "Công việc": st.column_config.TextColumn(disabled=True),
-                        "Giờ bắt đầu": st.column_config.TimeColumn("Giờ bắt đầu", format="HH:mm"),
-                        "Giờ kết thúc": st.column_config.TimeColumn("Giờ kết thúc", format="HH:mm"),
-                        "Ghi chú": st.column_config.TextColumn(),
-                        "Chọn": st.column_config.CheckboxColumn("Xóa?", help="Tick để xóa dòng này")
-                    }
-                )
+                with perf.span("grid:pm.my_tasks", rows=len(df_show)):
+                    edited = st.data_editor(
+                        df_show,
+                        key="my_tasks_editor",
+                        width="stretch",
+                        hide_index=True,
+                        column_config={
+                            "Công việc": st.column_config.TextColumn(disabled=True),
+                            "Giờ bắt đầu": st.column_config.TimeColumn("Giờ bắt đầu", format="HH:mm"),
+                            "Giờ kết thúc": st.column_config.TimeColumn("Giờ kết thúc", format="HH:mm"),
+                            "Ghi chú": st.column_config.TextColumn(),
+                            "Chọn": st.column_config.CheckboxColumn("Xóa?", help="Tick để xóa dòng này")
+                        }
+                    )
 
 
                 col1, col2 = st.columns([2, 1])
@@ -484,65 +433,23 @@ def project_manager_app(user):
                     if st.button("💾 Lưu khối lượng của tôi", key="save_my_qty_btn"):
                         
 
-                        def _fmt_time(t):
-                            if isinstance(t, time):
-                                return t.strftime("%H:%M")
-                            s = str(t).strip()
-                            for fmt in ("%H:%M", "%H:%M:%S"):
-                                try:
-                                    return datetime.strptime(s, fmt).strftime("%H:%M")
-                                except Exception:
-                                    pass
-                            return ""
-
-                        def _parse_time(t):
-                            if isinstance(t, time):
-                                return datetime.combine(date.today(), t)
-                            s = str(t).strip()
-                            for fmt in ("%H:%M", "%H:%M:%S"):
-                                try:
-                                    return datetime.strptime(s, fmt)
-                                except Exception:
-                                    pass
-                            return None
-
                         for i, row in edited.iterrows():
                             tid = int(my_tasks.iloc[i]["id"])
-                            update_data = {}
 
                             start_time = row.get("Giờ bắt đầu", "")
                             end_time = row.get("Giờ kết thúc", "")
-                            note_text = str(row.get("Ghi chú", "")).strip()
-
-                            # 🧹 Giữ lại phần ngày nếu có
-                            match_date = re.search(r"\(\d{4}-\d{2}-\d{2}\s*-\s*\d{4}-\d{2}-\d{2}\)", note_text)
-                            date_part = match_date.group(0) if match_date else ""
+                            note_text = str(row.get("Ghi chú", "") or "").strip()
 
-                            # 🧹 Xóa phần giờ cũ để tránh lặp
-                            note_text = re.sub(r"^⏰\s*\d{2}:\d{2}(?::\d{2})?\s*-\s*\d{2}:\d{2}(?::\d{2})?", "", note_text)
-                            note_text = re.sub(r"\(\d{4}-\d{2}-\d{2}\s*-\s*\d{4}-\d{2}-\d{2}\)", "", note_text).strip()
+                            # 📅 Khoảng ngày của công nhật (mặc định hôm nay nếu chưa có)
+                            day_range = my_times.iloc[i]
+                            start_date = pd.to_datetime(day_range["start_date"] or date.today()).date()
+                            end_date = pd.to_datetime(day_range["end_date"] or start_date).date()
 
-                            # 🕒 Ghép lại ghi chú mới
-                            start_str = _fmt_time(start_time)
-                            end_str = _fmt_time(end_time)
-                            if start_str and end_str:
-                                new_note = f"⏰ {start_str} - {end_str} {date_part} {note_text}".strip()
-                            else:
-                                new_note = note_text
-                            update_data["note"] = new_note
+                            # 🕒 Giờ vào cột riêng, ghi chú giữ nguyên
+                            update_data = timesheet.task_fields(start_time, end_time, start_date, end_date, note_text)
 
                             # 🧮 Tính lại khối lượng (giờ)
                             try:
-                                # Lấy ngày từ note nếu có (dạng "(YYYY-MM-DD - YYYY-MM-DD)")
-                                match_date = re.search(r"\((\d{4}-\d{2}-\d{2})\s*-\s*(\d{4}-\d{2}-\d{2})\)", note_text)
-                                if match_date:
-                                    start_date_str, end_date_str = match_date.groups()
-                                    start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-                                    end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-                                else:
-                                    # Nếu không có trong note thì mặc định cùng ngày hôm nay
-                                    start_date = end_date = date.today()
-
                                 # Dùng hàm chuẩn calc_hours từ auth.py
                                 total_hours = calc_hours(start_date, end_date, start_time, end_time)
                                 if total_hours > 0:
@@ -553,6 +460,7 @@ def project_manager_app(user):
 
                             supabase.table("tasks").update(update_data).eq("id", tid).execute()
 
+                        task_store.invalidate_project(project)
                         st.success("✅ Đã cập nhật giờ, ghi chú và khối lượng!")
                         st.rerun()
 
@@ -565,7 +473,8 @@ def project_manager_app(user):
                         if ids_to_delete:
                             for tid in ids_to_delete:
                                 supabase.table("tasks").delete().eq("id", tid).execute()
-                            
+                            task_store.invalidate_project(project)
+
                             st.success(f"✅ Đã xóa {len(ids_to_delete)} dòng")
                             st.rerun()
                         else:
@@ -593,22 +502,16 @@ def project_manager_app(user):
 
                 if st.button("➕ Thêm công nhật cho tôi", key="add_self_cong_btn"):
                     total_hours = calc_hours(start_date, end_date, start_time, end_time)
-                    # 📝 Tạo ghi chú gọn, chỉ thêm 1 lần
-                    if note.strip():
-                        note_txt = f"⏰ {start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')} ({start_date} - {end_date}) {note.strip()}"
-                    else:
-                        note_txt = f"⏰ {start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')} ({start_date} - {end_date})"
-
-
                     supabase.table("tasks").insert({
                         "project": project,
                         "task": task_name,
                         "assignee": username,
                         "khoi_luong": total_hours,
-                        "note": note_txt,
+                        **timesheet.task_fields(start_time, end_time, start_date, end_date, note),
                         "progress": 0
                     }).execute()
-                    
+                    task_store.invalidate_project(project)
+
                     st.success(f"✅ Đã thêm {total_hours} giờ công cho công việc '{task_name}'")
                     st.rerun()
 
@@ -631,32 +534,25 @@ def project_manager_app(user):
             st.info("⚠️ Không có dữ liệu công việc.")
             return
 
-        qmarks = ",".join(["%s"] * len(selected_projects))
-        
-        # ✅ Lấy đầy đủ cột bao gồm assignee để tránh KeyError
-        data = supabase.table("tasks").select("id, project, task, assignee, khoi_luong, note, progress, created_at, deadline").in_("project", selected_projects).execute()
-        df = pd.DataFrame(data.data)
+        # Số liệu đã gom nhóm sẵn trên server (project × người dùng × đầu mục)
+        stats = task_stats.load_task_stats(selected_projects)
 
-        # 🛡️ Kiểm tra cột assignee để tránh KeyError
-        if "assignee" in df.columns:
-            df["assignee"] = df["assignee"].map(user_map).fillna(df["assignee"])
-        else:
-            st.warning("⚠️ Dữ liệu tasks không có cột 'assignee'. Vui lòng kiểm tra bảng 'tasks' trên Supabase.")
-            df["assignee"] = "Không xác định"
-
-        if df.empty:
+        if stats.empty:
             st.info("⚠️ Không có dữ liệu công việc.")
             return
 
+        stat_columns = {
+            "total": "Tổng_công_việc",
+            "done": "Hoàn_thành",
+            "not_done": "Chưa_hoàn_thành",
+            "avg_progress": "Tiến_độ_TB",
+        }
+
         stat_mode = st.radio("Xem theo", ["Dự án", "Người dùng"], key="stat_mode")
 
         if stat_mode == "Dự án":
-            proj_summary = df.groupby("project").agg(
-                Tổng_công_việc=("id", "count"),
-                Hoàn_thành=("progress", lambda x: (x == 100).sum()),
-                Chưa_hoàn_thành=("progress", lambda x: (x < 100).sum()),
-                Tiến_độ_TB=("progress", "mean"),
-            ).reset_index().rename(columns={"project": "Dự án"})
+            proj_summary = task_stats.rollup(stats, ["project"]) \
+                .rename(columns={"project": "Dự án", **stat_columns})
 
             st.dataframe(
                 proj_summary.style.format({"Tiến_độ_TB": "{:.0f}%"}).bar(subset=["Tiến_độ_TB"], color="#4CAF50"),
@@ -671,12 +567,8 @@ def project_manager_app(user):
             fig.update_layout(yaxis=dict(title="Tiến độ (%)", range=[0, 100]), showlegend=False)
             st.plotly_chart(fig, use_container_width=True)
         else:
-            grouped = df.groupby(["assignee", "project"]).agg(
-                Tổng_công_việc=("id", "count"),
-                Hoàn_thành=("progress", lambda x: (x == 100).sum()),
-                Chưa_hoàn_thành=("progress", lambda x: (x < 100).sum()),
-                Tiến_độ_TB=("progress", "mean"),
-            ).reset_index().rename(columns={"assignee": "Người dùng", "project": "Dự án"})
+            grouped = task_stats.rollup(stats, ["assignee", "project"], user_map=user_map) \
+                .rename(columns={"assignee": "Người dùng", "project": "Dự án", **stat_columns})
 
             st.dataframe(
                 grouped.style.format({"Tiến_độ_TB": "{:.0f}%"}).bar(subset=["Tiến_độ_TB"], color="#FF9800"),
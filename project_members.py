@@ -0,0 +1,155 @@
+# project_members.py
+import re
+import threading
+
+import pandas as pd
+
+from auth import get_connection
+import db_client
+import repository
+
+
+# ==================== THÀNH VIÊN QUẢN LÝ DỰ ÁN ====================
+# Bảng project_members(username, project_id, role) (migrations/project_members.sql)
+# thay cho CSV users.project_manager_of / project_leader_of:
+# "X quản lý dự án nào" / "ai quản lý dự án P" là truy vấn theo index,
+# không phải tách chuỗi của cả bảng users. DB chưa có bảng → đọc / ghi CSV như cũ.
+
+ROLES = ("manager", "leader")
+
+# Cột CSV cũ tương ứng với từng role
+LEGACY_COLUMNS = {"manager": "project_manager_of", "leader": "project_leader_of"}
+
+TABLE = "project_members"
+
+# None = chưa biết, True/False = DB đã / chưa có bảng project_members
+_table_available = None
+_probe_lock = threading.Lock()
+
+
+def has_members_table() -> bool:
+    """
+    DB đã có bảng project_members chưa (kiểm tra 1 lần / tiến trình).
+    Chỉ ghi nhớ False khi DB báo thiếu bảng; lỗi tạm thời được ném lại và lần sau kiểm tra lại.
+    """
+    global _table_available
+    with _probe_lock:
+        if _table_available is None:
+            try:
+                get_connection().table(TABLE).select("username").limit(1).execute()
+                _table_available = True
+            except Exception as e:
+                if not db_client.is_missing_column(e):
+                    raise
+                _table_available = False
+        return _table_available
+
+
+def split_csv(value) -> list[str]:
+    """CSV cũ ("A|B", "A, B") → ["A", "B"]."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return []
+    return [p.strip() for p in re.split(r"[|,]", str(value)) if p.strip()]
+
+
+def _project_ids(names) -> dict[str, int]:
+    projects = repository.load_projects()
+    ids = dict(zip(projects["name"], projects["id"]))
+    missing = [n for n in names if n not in ids]
+    if missing:
+        projects = repository.load_projects(refresh=True)
+        ids = dict(zip(projects["name"], projects["id"]))
+    return {n: int(ids[n]) for n in names if n in ids}
+
+
+# ==================== ĐỌC ====================
+
+def projects_of(username: str, roles=ROLES) -> list[str]:
+    """Tên các dự án user là Chủ nhiệm / Chủ trì (theo roles), sắp theo tên."""
+    supabase = get_connection()
+
+    if has_members_table():
+        res = supabase.table(TABLE).select("projects(name)") \
+            .eq("username", username).in_("role", list(roles)).execute()
+        names = {(r.get("projects") or {}).get("name") for r in res.data or []}
+        return sorted(n for n in names if n)
+
+    cols = [LEGACY_COLUMNS[r] for r in roles]
+    res = supabase.table("users").select(", ".join(cols)).eq("username", username).execute()
+    names = set()
+    for row in res.data or []:
+        for col in cols:
+            names.update(split_csv(row.get(col)))
+    return sorted(names)
+
+
+def members_of(project_name: str, role: str = None) -> list[str]:
+    """Username các Chủ nhiệm / Chủ trì của 1 dự án (role=None → cả hai)."""
+    roles = ROLES if role is None else (role,)
+
+    if has_members_table():
+        project_id = _project_ids([project_name]).get(project_name)
+        if project_id is None:
+            return []
+        res = get_connection().table(TABLE).select("username") \
+            .eq("project_id", project_id).in_("role", list(roles)).execute()
+        return sorted({r["username"] for r in res.data or []})
+
+    users = memberships()
+    users = users[users["role"].isin(roles) & (users["project"] == project_name)]
+    return sorted(set(users["username"]))
+
+
+def memberships() -> pd.DataFrame:
+    """Toàn bộ thành viên (cột username, project, role) – dùng cho trang quản lý user."""
+    if has_members_table():
+        res = get_connection().table(TABLE).select("username, role, projects(name)").execute()
+        rows = [{"username": r["username"], "project": (r.get("projects") or {}).get("name"), "role": r["role"]}
+                for r in res.data or []]
+        return pd.DataFrame(rows, columns=["username", "project", "role"]).dropna(subset=["project"])
+
+    users = repository.load_users()
+    rows = [
+        {"username": u, "project": name, "role": role}
+        for role, col in LEGACY_COLUMNS.items() if col in users.columns
+        for u, csv in zip(users["username"], users[col])
+        for name in split_csv(csv)
+    ]
+    return pd.DataFrame(rows, columns=["username", "project", "role"])
+
+
+def projects_by_user(role: str) -> dict[str, list[str]]:
+    """{username: [tên dự án]} của 1 role."""
+    df = memberships()
+    df = df[df["role"] == role]
+    return {u: sorted(g["project"].unique()) for u, g in df.groupby("username")}
+
+
+# ==================== GHI ====================
+
+def set_user_projects(username: str, role: str, project_names) -> None:
+    """Đặt lại danh sách dự án của user cho 1 role (thêm cái mới, bỏ cái không còn)."""
+    names = [n for n in dict.fromkeys(project_names or []) if n]
+    supabase = get_connection()
+
+    if not has_members_table():
+        supabase.table("users").update({LEGACY_COLUMNS[role]: "|".join(names) or None}) \
+            .eq("username", username).execute()
+        return
+
+    ids = list(_project_ids(names).values())
+    remove = supabase.table(TABLE).delete().eq("username", username).eq("role", role)
+    if ids:
+        remove = remove.not_.in_("project_id", ids)
+    remove.execute()
+    if ids:
+        supabase.table(TABLE).upsert(
+            [{"username": username, "project_id": pid, "role": role} for pid in ids],
+            on_conflict="username,project_id,role", ignore_duplicates=True
+        ).execute()
+
+
+def remove_user(username: str) -> None:
+    """Bỏ mọi vai trò quản lý dự án của user (khi xoá user)."""
+    if has_members_table():
+        get_connection().table(TABLE).delete().eq("username", username).execute()
@@ -0,0 +1,229 @@
+# project_service.py
+import threading
+import time
+
+import pandas as pd
+
+from auth import get_connection
+import db_client
+import project_members
+import repository
+import task_store
+
+
+# ==================== ĐỔI TÊN / XOÁ DỰ ÁN (CASCADE) ====================
+# Tên dự án nằm ở projects.name và tasks.project; thành viên quản lý gắn theo
+# project_id (project_members, tự xoá theo dự án) hoặc nằm trong CSV cũ của users.
+# Đổi tên / xoá gọi 1 RPC (migrations/project_cascade.sql, project_members.sql) để
+# làm trong 1 transaction, thay vì tải mọi user về rồi ghi lại từng người
+# (dừng giữa chừng → dữ liệu lệch nhau).
+
+# None = chưa biết, False = DB chưa có các hàm RPC → làm từng bước phía client
+_rpc_available = None
+
+
+def _call_rpc(name: str, params: dict):
+    """Kết quả RPC (dict số dòng), hoặc None nếu DB chưa có hàm."""
+    global _rpc_available
+    if _rpc_available is False:
+        return None
+    try:
+        res = get_connection().rpc(name, params).execute()
+        _rpc_available = True
+        return res.data
+    except Exception as e:
+        if not db_client.is_missing_function(e):
+            raise
+        _rpc_available = False
+        return None
+
+
+def _rewrite_legacy_members(supabase, old_names: list[str], new_name: str = None) -> int:
+    """Dự phòng (chưa có project_members): sửa CSV của những user có nhắc tới old_names. Trả về số user đã sửa."""
+    columns = list(project_members.LEGACY_COLUMNS.values())
+    # 1 request cho cả 2 cột, chỉ lấy user có làm chủ nhiệm / chủ trì dự án nào đó
+    users = supabase.table("users").select(f"username, {', '.join(columns)}") \
+        .or_(",".join(f"{colu}.not.is.null" for colu in columns)).execute().data or []
+
+    changed = {}
+    for user in users:
+        for colu in columns:
+            parts = project_members.split_csv(user.get(colu))
+            new_parts = [p for p in (new_name if p in old_names else p for p in parts) if p]
+            if new_parts != parts:
+                changed.setdefault(user["username"], {})[colu] = ",".join(new_parts) or None
+
+    for username, fields in changed.items():
+        supabase.table("users").update(fields).eq("username", username).execute()
+    return len(changed)
+
+
+def rename_project(old_name: str, new_name: str) -> dict:
+    """
+    Đổi tên dự án ở projects, tasks (và CSV thành viên cũ nếu chưa có project_members).
+    Trả về {"projects", "tasks", "members"}: số dòng đã đổi / số thành viên của dự án.
+    Tên mới đã tồn tại → ValueError.
+    """
+    new_name = (new_name or "").strip()
+    if not new_name:
+        raise ValueError("Tên dự án không được để trống")
+    if new_name == old_name:
+        return {"projects": 0, "tasks": 0, "members": 0}
+
+    try:
+        counts = _call_rpc("rename_project", {"old_name": old_name, "new_name": new_name})
+    except Exception as e:
+        if db_client.is_duplicate(e):
+            raise ValueError("Dự án đã tồn tại") from e
+        raise
+
+    if counts is None:
+        supabase = get_connection()
+        if supabase.table("projects").select("id").eq("name", new_name).execute().data:
+            raise ValueError("Dự án đã tồn tại")
+        projects = supabase.table("projects").update({"name": new_name}).eq("name", old_name).execute()
+        tasks = supabase.table("tasks").update({"project": new_name}).eq("project", old_name).execute()
+        counts = {
+            "projects": len(projects.data or []),
+            "tasks": len(tasks.data or []),
+            "members": len(project_members.members_of(new_name))
+            if project_members.has_members_table()
+            else _rewrite_legacy_members(supabase, [old_name], new_name),
+        }
+
+    task_store.invalidate_project(old_name, new_name)
+    invalidate_visible()
+    return counts
+
+
+def delete_projects(names: list[str]) -> dict:
+    """
+    Xoá các dự án cùng task, thanh toán và thành viên quản lý.
+    Trả về {"projects", "tasks", "payments", "members"}: số dòng đã xoá / sửa.
+    """
+    names = [n for n in dict.fromkeys(names) if n]
+    if not names:
+        return {"projects": 0, "tasks": 0, "payments": 0, "members": 0}
+
+    counts = _call_rpc("delete_projects", {"names": names})
+
+    if counts is None:
+        supabase = get_connection()
+        ids = [r["id"] for r in supabase.table("projects").select("id").in_("name", names).execute().data or []]
+        if project_members.has_members_table():
+            # project_members tự xoá theo dự án (on delete cascade), chỉ đếm trước
+            members = supabase.table("project_members").select("username").in_("project_id", ids).execute() \
+                if ids else None
+            n_members = len(members.data or []) if members else 0
+        else:
+            n_members = _rewrite_legacy_members(supabase, names)
+        tasks = supabase.table("tasks").delete().in_("project", names).execute()
+        payments = supabase.table("payments").delete().in_("project_id", ids).execute() if ids else None
+        projects = supabase.table("projects").delete().in_("name", names).execute()
+        counts = {
+            "projects": len(projects.data or []),
+            "tasks": len(tasks.data or []),
+            "payments": len(payments.data or []) if payments else 0,
+            "members": n_members,
+        }
+
+    task_store.invalidate_project(*names)
+    invalidate_visible()
+    return counts
+
+
+# ==================== DỰ ÁN USER ĐƯỢC THẤY ====================
+# public + dự án có task giao cho user (+ dự án user quản lý nếu include_managed).
+# Task chưa có project_id (giao trước khi dự án được tạo) được khớp theo tên như đường dự phòng.
+# 1 RPC (migrations/visible_projects.sql) thay cho 3–4 request nối tiếp,
+# kết quả giữ trong cache theo user; giao việc / đổi thành viên / sửa dự án thì
+# gọi invalidate_visible() để lần sau tải lại.
+
+VISIBLE_COLUMNS = ["id", "name", "deadline", "project_type", "managed"]
+
+# Thời gian (giây) tin kết quả trong cache
+VISIBLE_TTL = 60
+
+_visible_cache: dict[tuple[str, bool], tuple[float, pd.DataFrame]] = {}
+_visible_lock = threading.Lock()
+
+# None = chưa biết, False = DB chưa có hàm visible_projects
+_visible_rpc_available = None
+
+VISIBLE_PROJECTS_SQLITE = """
+    SELECT p.id, p.name, p.deadline, p.project_type,
+           EXISTS (SELECT 1 FROM project_members m
+                   WHERE m.project_id = p.id AND m.username = :username) AS managed
+    FROM projects p
+    WHERE p.project_type = 'public'
+       OR (:include_managed AND EXISTS (SELECT 1 FROM project_members m
+                                        WHERE m.project_id = p.id AND m.username = :username))
+       OR EXISTS (SELECT 1 FROM tasks t
+                  WHERE t.assignee = :username
+                    AND (t.project_id = p.id OR (t.project_id IS NULL AND t.project = p.name)))
+    ORDER BY p.name
+"""
+
+
+def visible_projects_sqlite(conn, username: str, include_managed: bool = True) -> pd.DataFrame:
+    """Cùng kết quả với RPC visible_projects, chạy trên sqlite3 (projects, tasks, project_members)."""
+    df = pd.read_sql_query(VISIBLE_PROJECTS_SQLITE, conn,
+                           params={"username": username, "include_managed": int(include_managed)})
+    df["managed"] = df["managed"].astype(bool)
+    return df
+
+
+def _visible_fallback(username: str, include_managed: bool) -> pd.DataFrame:
+    """Khi DB chưa có RPC: bảng projects trong cache + 1 truy vấn tasks + project_members."""
+    all_projects = repository.load_projects()[["id", "name", "deadline", "project_type"]]
+    managed = set(project_members.projects_of(username))
+    data = get_connection().table("tasks").select("project").eq("assignee", username).execute()
+    assigned = {r["project"] for r in data.data or []}
+
+    keep = (all_projects["project_type"] == "public") | all_projects["name"].isin(assigned)
+    if include_managed:
+        keep |= all_projects["name"].isin(managed)
+    df = all_projects[keep].drop_duplicates(subset=["name"]).copy()
+    df["managed"] = df["name"].isin(managed)
+    return df.sort_values("name").reset_index(drop=True)
+
+
+def _load_visible(username: str, include_managed: bool) -> pd.DataFrame:
+    global _visible_rpc_available
+
+    if _visible_rpc_available is not False:
+        try:
+            res = get_connection().rpc("visible_projects", {
+                "p_username": username, "p_include_managed": include_managed,
+            }).execute()
+            _visible_rpc_available = True
+            return pd.DataFrame(res.data or [], columns=VISIBLE_COLUMNS)
+        except Exception as e:
+            if not db_client.is_missing_function(e):
+                raise
+            _visible_rpc_available = False
+    return _visible_fallback(username, include_managed)
+
+
+def visible_projects(username: str, include_managed: bool = True) -> pd.DataFrame:
+    """Dự án user được thấy (cột id, name, deadline, project_type, managed), sắp theo tên."""
+    key = (username, include_managed)
+    with _visible_lock:
+        hit = _visible_cache.get(key)
+    if hit is not None and time.monotonic() - hit[0] < VISIBLE_TTL:
+        return hit[1].copy()
+
+    df = _load_visible(username, include_managed)
+    with _visible_lock:
+        _visible_cache[key] = (time.monotonic(), df)
+    return df.copy()
+
+
+def invalidate_visible(*usernames: str):
+    """Bỏ cache dự án được thấy của các user. Không truyền tham số → bỏ tất cả."""
+    with _visible_lock:
+        if not usernames:
+            _visible_cache.clear()
+            return
+        for key in [k for k in _visible_cache if k[0] in usernames]:
+            del _visible_cache[key]
@@ -0,0 +1,198 @@
+# repository.py
+import threading
+import time
+
+import pandas as pd
+
+from auth import get_connection
+import db_client
+
+
+# ==================== CACHE DÙNG CHUNG TOÀN TIẾN TRÌNH ====================
+# Streamlit chạy mọi phiên (session) trong cùng một tiến trình, nên cache ở mức
+# module được chia sẻ giữa tất cả người dùng: 40 phiên cùng mở trang chỉ tốn
+# 1 lần tải mỗi bảng cho đến khi hết TTL hoặc có thao tác ghi gọi invalidate().
+
+_TABLES = {
+    "users": {
+        "columns": "id, stt, username, display_name, dob, role, project_manager_of, project_leader_of",
+        "order": "stt",
+    },
+    "projects": {
+        "columns": "id, name, deadline, project_type, design_step",
+        "order": None,
+    },
+    "job_catalog": {
+        "columns": "id, name, unit, parent_id, project_type",
+        "order": None,
+    },
+}
+
+# Thời gian sống (giây) của từng bảng trong cache
+CACHE_TTL = {
+    "users": 60,
+    "projects": 60,
+    "job_catalog": 120,
+}
+
+_cache: dict[str, tuple[float, pd.DataFrame]] = {}
+_generation = {name: 0 for name in _TABLES}
+_cache_lock = threading.Lock()
+_load_locks = {name: threading.Lock() for name in _TABLES}
+
+
+def _fetch_table(table: str) -> pd.DataFrame:
+    spec = _TABLES[table]
+    supabase = get_connection()
+    query = supabase.table(table).select(spec["columns"])
+    if spec["order"]:
+        query = query.order(spec["order"])
+    data = query.execute()
+
+    columns = [c.strip() for c in spec["columns"].split(",")]
+    if not data.data:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(data.data)
+
+
+def _get_table(table: str, refresh: bool = False) -> pd.DataFrame:
+    """Đọc bảng qua cache (read-through). Chỉ 1 phiên tải lại, các phiên khác chờ và dùng chung kết quả."""
+    requested_at = time.monotonic()
+
+    with _cache_lock:
+        hit = _cache.get(table)
+    if hit and not refresh and requested_at - hit[0] < CACHE_TTL[table]:
+        return hit[1]
+
+    with _load_locks[table]:
+        # Trong lúc chờ khoá, phiên khác có thể đã tải xong dữ liệu mới hơn yêu cầu này
+        with _cache_lock:
+            hit = _cache.get(table)
+            gen = _generation[table]
+        if hit and hit[0] >= requested_at:
+            return hit[1]
+        if hit and not refresh and time.monotonic() - hit[0] < CACHE_TTL[table]:
+            return hit[1]
+
+        df = _fetch_table(table)
+
+        with _cache_lock:
+            # Nếu có thao tác ghi xảy ra trong lúc đang tải thì không lưu bản cũ vào cache
+            if _generation[table] == gen:
+                _cache[table] = (time.monotonic(), df)
+        return df
+
+
+def invalidate(*tables: str):
+    """Xoá cache của các bảng vừa bị ghi. Không truyền tham số → xoá tất cả."""
+    names = tables or tuple(_TABLES)
+    with _cache_lock:
+        for name in names:
+            _cache.pop(name, None)
+            if name in _generation:
+                _generation[name] += 1
+
+
+# ==================== API ĐỌC DỮ LIỆU ====================
+
+def load_users(refresh: bool = False) -> pd.DataFrame:
+    """Danh sách user (không có mật khẩu), sắp xếp theo STT."""
+    return _get_table("users", refresh).copy()
+
+
+def load_projects(refresh: bool = False) -> pd.DataFrame:
+    return _get_table("projects", refresh).copy()
+
+
+def load_job_catalog(refresh: bool = False) -> pd.DataFrame:
+    return _get_table("job_catalog", refresh).copy()
+
+
+def job_catalog_snapshot(refresh: bool = False) -> pd.DataFrame:
+    """
+    Bản job_catalog đang nằm trong cache (KHÔNG copy — chỉ đọc).
+    Cùng 1 object cho đến khi bảng được tải lại → dùng làm phiên bản cho job_catalog.JobCatalog.
+    """
+    return _get_table("job_catalog", refresh)
+
+
+# ==================== GHI TASKS THEO LÔ ====================
+# Thay vì gửi 1 request update cho mỗi dòng, chỉ gửi các dòng thực sự thay đổi
+# và gửi theo lô qua RPC bulk_update_tasks (xem migrations/bulk_update_tasks.sql).
+
+TASK_CHUNK_SIZE = 500
+
+# None = chưa biết, False = DB chưa có hàm RPC → dùng cách update từng dòng
+_bulk_rpc_available = None
+
+
+def diff_task_rows(original: pd.DataFrame, edited: pd.DataFrame, to_fields, key: str = "ID") -> list[dict]:
+    """
+    So sánh bảng đã sửa với bảng gốc lúc tải lên.
+    - to_fields(row) → dict {cột DB: giá trị đã chuẩn hoá}
+    - Trả về [{"id": ..., cột DB: giá trị mới}] chỉ gồm các dòng/cột có thay đổi.
+    """
+    if edited is None or edited.empty:
+        return []
+
+    base = {}
+    if original is not None and not original.empty:
+        for _, row in original.iterrows():
+            base[int(row[key])] = to_fields(row)
+
+    changes = []
+    for _, row in edited.iterrows():
+        task_id = int(row[key])
+        new_fields = to_fields(row)
+        old_fields = base.get(task_id, {})
+        delta = {k: v for k, v in new_fields.items() if k not in old_fields or old_fields[k] != v}
+        if delta:
+            changes.append({"id": task_id, **delta})
+    return changes
+
+
+def _update_rows_one_by_one(supabase, chunk: list[dict], results: dict):
+    for change in chunk:
+        task_id = int(change["id"])
+        fields = {k: v for k, v in change.items() if k != "id"}
+        try:
+            supabase.table("tasks").update(fields).eq("id", task_id).execute()
+            results[task_id] = None
+        except Exception as e:
+            results[task_id] = str(e)
+
+
+def bulk_update_tasks(changes: list[dict]) -> dict:
+    """
+    Ghi các thay đổi của tasks theo lô (mỗi lô 1 request, chạy trong 1 câu lệnh UPDATE).
+    - changes: [{"id": task_id, cột: giá trị, ...}] (thường lấy từ diff_task_rows)
+    - Trả về {task_id: None nếu thành công, hoặc thông báo lỗi}
+    """
+    global _bulk_rpc_available
+
+    results = {}
+    if not changes:
+        return results
+
+    supabase = get_connection()
+    for start in range(0, len(changes), TASK_CHUNK_SIZE):
+        chunk = changes[start:start + TASK_CHUNK_SIZE]
+
+        if _bulk_rpc_available is False:
+            _update_rows_one_by_one(supabase, chunk, results)
+            continue
+
+        try:
+            res = supabase.rpc("bulk_update_tasks", {"changes": chunk}).execute()
+            _bulk_rpc_available = True
+            updated_ids = {int(r["id"]) for r in (res.data or [])}
+            for change in chunk:
+                task_id = int(change["id"])
+                results[task_id] = None if task_id in updated_ids else "Không tìm thấy task"
+        except Exception as e:
+            if db_client.is_missing_function(e):
+                _bulk_rpc_available = False
+            # Lô lỗi → ghi lại từng dòng để biết chính xác dòng nào hỏng
+            _update_rows_one_by_one(supabase, chunk, results)
+
+    return results
@@ -0,0 +1,248 @@
+# sessions.py
+import hashlib
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from auth import get_connection
+import db_client
+
+
+# ==================== PHIÊN ĐĂNG NHẬP (SESSION TOKEN) ====================
+# Cookie chỉ giữ 1 token ngẫu nhiên, không giữ mật khẩu.
+# - Bảng sessions (migrations/sessions.sql) lưu sha256(token), username, hạn dùng, thời điểm thu hồi.
+#   Nếu DB chưa có bảng thì dùng file SQLite cục bộ (SQLITE_PATH) với cùng cấu trúc.
+# - Token đã kiểm tra được giữ trong LRU (token → user) → tự đăng nhập lại chỉ là 1 lần tra dict.
+# - Đăng xuất: revoke(token). Đổi mật khẩu: revoke_user(username) thu hồi mọi phiên của user.
+
+SESSION_TTL = timedelta(days=30)
+
+# LRU: số phiên tối đa giữ trong bộ nhớ và thời gian (giây) tin kết quả đã kiểm tra
+# (phiên bị thu hồi từ tiến trình khác sẽ hết hiệu lực sau tối đa khoảng này)
+CACHE_SIZE = 1024
+CACHE_TTL = 300
+
+SQLITE_PATH = os.environ.get("SESSIONS_SQLITE_PATH", "sessions.db")
+
+TABLE = "sessions"
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ==================== LƯU TRỮ ====================
+
+class _SupabaseStore:
+    def insert(self, token_hash: str, username: str, expires_at: datetime):
+        get_connection().table(TABLE).insert({
+            "token_hash": token_hash,
+            "username": username,
+            "expires_at": expires_at.isoformat(),
+        }).execute()
+
+    def find(self, token_hash: str):
+        """(username, expires_at) của phiên còn hiệu lực, hoặc None."""
+        res = get_connection().table(TABLE).select("username, expires_at") \
+            .eq("token_hash", token_hash).is_("revoked_at", None) \
+            .gt("expires_at", _now().isoformat()).limit(1).execute()
+        if not res.data:
+            return None
+        row = res.data[0]
+        return row["username"], datetime.fromisoformat(row["expires_at"])
+
+    def revoke(self, token_hash: str):
+        get_connection().table(TABLE).update({"revoked_at": _now().isoformat()}) \
+            .eq("token_hash", token_hash).execute()
+
+    def revoke_user(self, username: str):
+        get_connection().table(TABLE).update({"revoked_at": _now().isoformat()}) \
+            .eq("username", username).is_("revoked_at", None).execute()
+
+
+class SQLiteStore:
+    """Bản SQLite của bảng sessions (chạy 1 máy / khi DB chưa có bảng)."""
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {TABLE} (
+                    token_hash TEXT PRIMARY KEY,
+                    username   TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    expires_at TEXT NOT NULL,
+                    revoked_at TEXT
+                )
+            """)
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_username_idx ON {TABLE} (username)")
+
+    def insert(self, token_hash: str, username: str, expires_at: datetime):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO {TABLE} (token_hash, username, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (token_hash, username, _now().isoformat(), expires_at.isoformat())
+            )
+
+    def find(self, token_hash: str):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT username, expires_at FROM {TABLE} "
+                f"WHERE token_hash = ? AND revoked_at IS NULL AND expires_at > ?",
+                (token_hash, _now().isoformat())
+            ).fetchone()
+        return (row[0], datetime.fromisoformat(row[1])) if row else None
+
+    def revoke(self, token_hash: str):
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE {TABLE} SET revoked_at = ? WHERE token_hash = ?",
+                               (_now().isoformat(), token_hash))
+
+    def revoke_user(self, username: str):
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE {TABLE} SET revoked_at = ? WHERE username = ? AND revoked_at IS NULL",
+                               (_now().isoformat(), username))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _call_store(method: str, *args):
+    """Gọi store hiện tại; nếu Supabase chưa có bảng sessions thì chuyển hẳn sang SQLite."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = _SupabaseStore()
+        store = _store
+    try:
+        return getattr(store, method)(*args)
+    except Exception as e:
+        if not (isinstance(store, _SupabaseStore) and db_client.is_missing_table(e)):
+            raise
+        with _store_lock:
+            if isinstance(_store, _SupabaseStore):
+                _store = SQLiteStore()
+            store = _store
+        return getattr(store, method)(*args)
+
+
+def use_store(store):
+    """Chỉ định nơi lưu phiên (vd SQLiteStore(":memory:") khi chạy thử)."""
+    global _store
+    with _store_lock:
+        _store = store
+    _cache_clear()
+
+
+# ==================== LRU TOKEN → USER ====================
+
+_cache: "OrderedDict[str, tuple[float, tuple]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(token_hash: str):
+    with _cache_lock:
+        hit = _cache.get(token_hash)
+        if hit is None:
+            return None
+        valid_until, user = hit
+        if time.monotonic() >= valid_until:
+            del _cache[token_hash]
+            return None
+        _cache.move_to_end(token_hash)
+        return user
+
+
+def _cache_put(token_hash: str, user: tuple, expires_at: datetime):
+    remaining = (expires_at - _now()).total_seconds()
+    valid_until = time.monotonic() + max(0.0, min(CACHE_TTL, remaining))
+    with _cache_lock:
+        _cache[token_hash] = (valid_until, user)
+        _cache.move_to_end(token_hash)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _cache_drop(token_hash: str = None, username: str = None):
+    with _cache_lock:
+        if token_hash is not None:
+            _cache.pop(token_hash, None)
+        if username is not None:
+            for key in [k for k, (_, u) in _cache.items() if u[1] == username]:
+                del _cache[key]
+
+
+def _cache_clear():
+    with _cache_lock:
+        _cache.clear()
+
+
+# ==================== API ====================
+
+def create_session(user: tuple) -> str:
+    """Tạo phiên mới cho user (tuple id, username, ...) → token để lưu vào cookie."""
+    token = secrets.token_urlsafe(32)
+    token_hash = _hash_token(token)
+    expires_at = _now() + SESSION_TTL
+    _call_store("insert", token_hash, user[1], expires_at)
+    _cache_put(token_hash, user, expires_at)
+    return token
+
+
+def resolve(token: str, load_user) -> tuple:
+    """
+    User của token, hoặc None nếu token sai / hết hạn / đã thu hồi.
+    - load_user(username) → tuple user (chỉ gọi khi token chưa có trong LRU)
+    """
+    if not token:
+        return None
+    token_hash = _hash_token(token)
+
+    user = _cache_get(token_hash)
+    if user is not None:
+        return user
+
+    found = _call_store("find", token_hash)
+    if not found:
+        return None
+    username, expires_at = found
+    user = load_user(username)
+    if user:
+        _cache_put(token_hash, user, expires_at)
+    return user
+
+
+def update_principal(token: str, user: tuple):
+    """Cập nhật user đã lưu trong LRU (vd sau khi sửa hồ sơ)."""
+    if not token:
+        return
+    token_hash = _hash_token(token)
+    with _cache_lock:
+        hit = _cache.get(token_hash)
+        if hit is not None:
+            _cache[token_hash] = (hit[0], user)
+
+
+def revoke(token: str):
+    """Đăng xuất: thu hồi 1 phiên."""
+    if not token:
+        return
+    token_hash = _hash_token(token)
+    _cache_drop(token_hash=token_hash)
+    _call_store("revoke", token_hash)
+
+
+def revoke_user(username: str):
+    """Đổi mật khẩu: thu hồi mọi phiên của user."""
+    _cache_drop(username=username)
+    _call_store("revoke_user", username)
@@ -0,0 +1,959 @@
+# storage.py
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, time
+from decimal import Decimal
+from types import SimpleNamespace
+
+import db_client
+
+
+# ==================== BACKEND LƯU TRỮ ====================
+# Cả app chỉ dùng 1 kiểu client: auth.get_connection().table(...).select(...).eq(...).execute()
+# (và .rpc(...)). Backend được chọn bằng biến môi trường STORAGE_BACKEND:
+# - supabase (mặc định): REST qua supabase-py.
+# - sqlite: file cục bộ (DATABASE_URL = đường dẫn file, mặc định work_manager.db; ":memory:" = trong RAM).
+#   Dùng để phát triển / chạy offline / load test. Cần SQLite ≥ 3.35 (RETURNING).
+# - postgres: nối thẳng Postgres (DATABASE_URL = DSN), pool kết nối của psycopg
+#   (pip install "psycopg[binary,pool]", hoặc psycopg2).
+# Với sqlite / postgres, SqlClient dịch query builder sang SQL, bỏ 1 lượt HTTP mỗi truy vấn
+# và cho phép join (select("..., projects(name)")). Lỗi được đổi sang mã giống PostgREST
+# (PGRST202 / PGRST205 / 23505...) nên các đường dự phòng sẵn có của app (RPC chưa có,
+# bảng chưa có) chạy như trên Supabase.
+# Mọi backend đều đi qua db_client (retry, circuit breaker, số liệu, perf).
+
+BACKENDS = ("supabase", "sqlite", "postgres")
+
+BACKEND = os.environ.get("STORAGE_BACKEND", "supabase").strip().lower()
+DATABASE_URL = os.environ.get("DATABASE_URL", "").strip()
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+
+SQLITE_DEFAULT_PATH = "work_manager.db"
+SQLITE_BUSY_TIMEOUT = 30.0      # giây chờ khi file đang bị khoá ghi
+
+# Số dòng tối đa mỗi câu INSERT nhiều dòng
+INSERT_CHUNK = 500
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+class StorageError(Exception):
+    """Lỗi của backend SQL, mang mã giống PostgREST / Postgres (.code) như APIError của supabase-py."""
+
+    def __init__(self, code: str, message: str):
+        self.code = code
+        self.message = message
+        super().__init__(f"{code}: {message}")
+
+
+# ==================== SCHEMA ====================
+# Kiểu cột dùng chung → (kiểu SQLite, kiểu Postgres)
+_TYPES = {
+    "id": ("INTEGER PRIMARY KEY AUTOINCREMENT", "bigint generated by default as identity primary key"),
+    "int": ("INTEGER", "bigint"),
+    "real": ("REAL", "double precision"),
+    "text": ("TEXT", "text"),
+    "bool": ("BOOLEAN", "boolean"),
+    "date": ("TEXT", "date"),
+    "time": ("TEXT", "time"),
+    "timestamp": ("TEXT", "timestamptz"),
+    "json": ("TEXT", "jsonb"),
+}
+_NOW = ("(strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))", "now()")
+
+# (tên cột, kiểu[, "now" = mặc định thời điểm hiện tại])
+SCHEMA = {
+    "users": [
+        ("id", "id"), ("stt", "int"), ("username", "text"), ("username_key", "text"),
+        ("display_name", "text"), ("dob", "date"), ("password", "text"), ("role", "text"),
+        ("project_manager_of", "text"), ("project_leader_of", "text"),
+        ("online", "bool"), ("last_seen", "timestamp"),
+    ],
+    "projects": [
+        ("id", "id"), ("name", "text"), ("deadline", "date"), ("project_type", "text"), ("design_step", "text"),
+    ],
+    "project_members": [
+        ("username", "text"), ("project_id", "int"), ("role", "text"),
+    ],
+    "job_catalog": [
+        ("id", "id"), ("name", "text"), ("unit", "text"), ("parent_id", "int"), ("project_type", "text"),
+    ],
+    "tasks": [
+        ("id", "id"), ("project", "text"), ("project_id", "int"), ("task", "text"), ("job_id", "int"),
+        ("assignee", "text"), ("khoi_luong", "real"), ("progress", "real"), ("deadline", "date"),
+        ("note", "text"), ("approved", "bool"), ("start_date", "date"), ("start_time", "time"),
+        ("end_time", "time"), ("end_date", "date"),
+        ("created_at", "timestamp", "now"), ("updated_at", "timestamp", "now"),
+    ],
+    "payments": [
+        ("id", "id"), ("project_id", "int"), ("payment_number", "int"), ("percent", "real"),
+        ("note", "text"), ("paid_at", "date"),
+    ],
+    "attendance_new": [
+        ("username", "text"), ("data", "json"), ("months", "json"),
+    ],
+    "attendance_monthly": [
+        ("username", "text"), ("month", "text"), ("data", "json"), ("updated_at", "timestamp", "now"),
+    ],
+    "attendance_cutover": [
+        ("id", "int"), ("completed_at", "timestamp", "now"),
+    ],
+    "sessions": [
+        ("token_hash", "text"), ("username", "text"), ("created_at", "timestamp", "now"),
+        ("expires_at", "timestamp"), ("revoked_at", "timestamp"),
+    ],
+}
+
+# Khoá chính của bảng không có cột id (cũng là on_conflict mặc định của upsert)
+_PRIMARY_KEYS = {
+    "project_members": ("username", "project_id", "role"),
+    "attendance_new": ("username",),
+    "attendance_monthly": ("username", "month"),
+    "attendance_cutover": ("id",),
+    "sessions": ("token_hash",),
+}
+_UNIQUE = {
+    "users": [("username_key",)],
+    "projects": [("name",)],
+}
+# Cùng các index trong migrations/*.sql
+_INDEXES = {
+    "tasks": [("project", "updated_at"), ("project_id", "updated_at"), ("job_id",),
+              ("assignee", "project_id"), ("project_id", "assignee", "start_date")],
+    "job_catalog": [("name",)],
+    "project_members": [("project_id", "role")],
+    "attendance_monthly": [("month",)],
+    "sessions": [("username",)],
+}
+
+# tasks.updated_at tự cập nhật khi sửa dòng (bản Postgres: migrations/tasks_updated_at.sql).
+# Trên SQLite trigger chỉ chạy sau câu lệnh nên update() của query builder tự ghi cột này
+# để dòng trả về (RETURNING) có mốc mới; trigger dành cho SQL thuần.
+_TOUCH_ON_UPDATE = {"tasks": "updated_at"}
+
+# tasks.project_id / job_id lấy theo tên project / task khi thêm / sửa dòng
+# (bản Postgres: trigger tasks_resolve_ids trong migrations/tasks_fk_ids.sql).
+# SQLite không sửa được NEW trong trigger nên cập nhật lại dòng sau câu lệnh;
+# dòng trả về (RETURNING) của chính câu insert vẫn mang giá trị trước trigger.
+_STALE_PROJECT_ID = ("(NEW.project_id IS NULL OR "
+                     "(SELECT name FROM projects WHERE id = NEW.project_id) IS NOT NEW.project)")
+_STALE_JOB_ID = ("(NEW.job_id IS NULL OR "
+                 "(SELECT name FROM job_catalog WHERE id = NEW.job_id) IS NOT NEW.task)")
+_RESOLVE_TASK_IDS = f"""FOR EACH ROW WHEN {_STALE_PROJECT_ID} OR {_STALE_JOB_ID}
+        BEGIN UPDATE tasks SET
+            project_id = CASE WHEN {_STALE_PROJECT_ID}
+                THEN (SELECT id FROM projects WHERE name = NEW.project ORDER BY id LIMIT 1)
+                ELSE NEW.project_id END,
+            job_id = CASE WHEN {_STALE_JOB_ID}
+                THEN (SELECT id FROM job_catalog WHERE name = NEW.task ORDER BY id LIMIT 1)
+                ELSE NEW.job_id END
+        WHERE id = NEW.id; END"""
+
+_SQLITE_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS tasks_set_updated_at AFTER UPDATE ON tasks
+        FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+        BEGIN UPDATE tasks SET updated_at = {_NOW[0]} WHERE id = NEW.id; END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tasks_resolve_ids_insert AFTER INSERT ON tasks
+        {_RESOLVE_TASK_IDS}""",
+    f"""CREATE TRIGGER IF NOT EXISTS tasks_resolve_ids_update
+        AFTER UPDATE OF project, task, project_id, job_id ON tasks
+        {_RESOLVE_TASK_IDS}""",
+]
+
+# Chạy trên Postgres mới tạo (theo thứ tự đã áp dụng trên Supabase) để có RPC, trigger, view
+POSTGRES_MIGRATIONS = [
+    "bulk_update_tasks.sql", "save_attendance_month.sql", "attendance_monthly.sql",
+    "tasks_updated_at.sql", "task_stats.sql", "tasks_time_fields.sql", "touch_last_seen.sql",
+    "sessions.sql", "users_username_key.sql", "register_user.sql", "project_cascade.sql",
+    "project_members.sql", "tasks_fk_ids.sql", "visible_projects.sql", "tasks_paging.sql",
+]
+
+
+def _column_types(table: str) -> dict:
+    return {col[0]: col[1] for col in SCHEMA.get(table, [])}
+
+
+def _primary_key(table: str) -> tuple:
+    return _PRIMARY_KEYS.get(table, ("id",))
+
+
+def schema_statements(dialect: str) -> list[str]:
+    """Câu lệnh tạo bảng / index (chạy lại nhiều lần vẫn an toàn)."""
+    pos = 0 if dialect == "sqlite" else 1
+    stmts = []
+    for table, columns in SCHEMA.items():
+        defs = []
+        for name, kind, *extra in columns:
+            col = f"{_quote(name)} {_TYPES[kind][pos]}"
+            if extra and extra[0] == "now":
+                col += f" NOT NULL DEFAULT {_NOW[pos]}"
+            defs.append(col)
+        if table in _PRIMARY_KEYS:
+            defs.append(f"PRIMARY KEY ({', '.join(map(_quote, _PRIMARY_KEYS[table]))})")
+        stmts.append(f"CREATE TABLE IF NOT EXISTS {_quote(table)} ({', '.join(defs)})")
+
+        for cols in _UNIQUE.get(table, []):
+            stmts.append(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_{'_'.join(cols)}_idx "
+                         f"ON {_quote(table)} ({', '.join(map(_quote, cols))})")
+        for cols in _INDEXES.get(table, []):
+            stmts.append(f"CREATE INDEX IF NOT EXISTS {table}_{'_'.join(cols)}_idx "
+                         f"ON {_quote(table)} ({', '.join(map(_quote, cols))})")
+    if dialect == "sqlite":
+        stmts.extend(_SQLITE_TRIGGERS)
+    return stmts
+
+
+# ==================== CHUYỂN ĐỔI GIÁ TRỊ ====================
+
+_IDENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _quote(name: str) -> str:
+    if not _IDENT.match(str(name)):
+        raise StorageError("PGRST100", f"Tên bảng / cột không hợp lệ: {name!r}")
+    return f'"{name}"'
+
+
+def _encode(value, kind: str = None):
+    """Giá trị Python → tham số SQL (JSON dạng chuỗi, ngày giờ dạng ISO)."""
+    if value is None:
+        return None
+    if kind == "json":
+        return json.dumps(value, ensure_ascii=False, default=str)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def _jsonable(value):
+    """Giá trị đọc từ Postgres → giống JSON của PostgREST."""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _split_top(text: str) -> list[str]:
+    """Tách theo dấu phẩy nằm ngoài ngoặc: "a, b(c, d)" → ["a", "b(c, d)"]."""
+    parts, depth, buf = [], 0, ""
+    for ch in text:
+        if ch == "," and depth == 0:
+            parts.append(buf.strip())
+            buf = ""
+            continue
+        depth += (ch == "(") - (ch == ")")
+        buf += ch
+    if buf.strip():
+        parts.append(buf.strip())
+    return parts
+
+
+def _coerce(value: str):
+    """Giá trị trong chuỗi or_() → kiểu Python (số giữ dạng chuỗi, DB tự ép kiểu theo cột)."""
+    low = value.lower()
+    if low == "null":
+        return None
+    if low in ("true", "false"):
+        return low == "true"
+    return value
+
+
+# ==================== QUERY BUILDER ====================
+
+_COMPARE = {"eq": "=", "neq": "<>", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+
+
+class SqlQuery:
+    """Query builder cùng cách gọi với supabase-py, sinh SQL cho SqlClient."""
+
+    def __init__(self, client: "SqlClient", table: str):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._count = None
+        self._where = []        # [(sql, params)]
+        self._negate = False
+        self._order = []
+        self._limit = None
+        self._offset = 0
+        self._payload = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+
+    # ---------- thao tác ----------
+    def select(self, *columns, count: str = None):
+        if self._op == "select":
+            self._columns = ",".join(columns) or "*"
+        self._count = count
+        return self
+
+    def insert(self, rows, **_):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def update(self, fields: dict, **_):
+        self._op, self._payload = "update", fields
+        return self
+
+    def upsert(self, rows, on_conflict: str = None, ignore_duplicates: bool = False, **_):
+        self._op, self._payload = "upsert", rows
+        self._on_conflict, self._ignore_duplicates = on_conflict, ignore_duplicates
+        return self
+
+    def delete(self, **_):
+        self._op = "delete"
+        return self
+
+    # ---------- bộ lọc ----------
+    def _column(self, column: str) -> str:
+        return f"{_quote(self._table)}.{_quote(column)}"
+
+    def _condition(self, column: str, op: str, value) -> tuple[str, list]:
+        col = self._column(column)
+        kind = _column_types(self._table).get(column)
+        if op in _COMPARE:
+            return f"{col} {_COMPARE[op]} %s", [_encode(value)]
+        if op == "in":
+            values = [_encode(v) for v in value]
+            if not values:
+                return "1 = 0", []
+            return f"{col} IN ({', '.join(['%s'] * len(values))})", values
+        if op in ("like", "ilike"):
+            pattern = str(value).replace("*", "%")
+            if op == "like":
+                return f"{col} LIKE %s ESCAPE '\\'", [pattern]
+            if self._client.dialect == "postgres":
+                return f"{col} ILIKE %s ESCAPE '\\'", [pattern]
+            return f"py_casefold({col}) LIKE py_casefold(%s) ESCAPE '\\'", [pattern]
+        if op == "is":
+            if isinstance(value, str):
+                value = _coerce(value)
+            if value is None:
+                return f"{col} IS NULL", []
+            if kind == "bool" or isinstance(value, bool):
+                return f"{col} IS {'TRUE' if value else 'FALSE'}", []
+            return f"{col} = %s", [_encode(value)]
+        raise StorageError("PGRST100", f"Toán tử lọc không hỗ trợ: {op}")
+
+    def _filter(self, sql: str, params: list):
+        if self._negate:
+            sql = f"NOT ({sql})"
+            self._negate = False
+        self._where.append((sql, params))
+        return self
+
+    def _add(self, op: str, column: str, value):
+        return self._filter(*self._condition(column, op, value))
+
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def eq(self, column, value):
+        return self._add("eq", column, value)
+
+    def neq(self, column, value):
+        return self._add("neq", column, value)
+
+    def lt(self, column, value):
+        return self._add("lt", column, value)
+
+    def lte(self, column, value):
+        return self._add("lte", column, value)
+
+    def gt(self, column, value):
+        return self._add("gt", column, value)
+
+    def gte(self, column, value):
+        return self._add("gte", column, value)
+
+    def in_(self, column, values):
+        return self._add("in", column, list(values))
+
+    def like(self, column, pattern):
+        return self._add("like", column, pattern)
+
+    def ilike(self, column, pattern):
+        return self._add("ilike", column, pattern)
+
+    def is_(self, column, value):
+        return self._add("is", column, value)
+
+    def match(self, query: dict):
+        for column, value in query.items():
+            self.eq(column, value)
+        return self
+
+    def or_(self, filters: str, **_):
+        """Cú pháp PostgREST: "approved.is.null,approved.eq.false", "a.not.in.(x,y)"."""
+        conds, params = [], []
+        for part in _split_top(filters):
+            column, op, value = part.split(".", 2)
+            negate = op == "not"
+            if negate:
+                op, value = value.split(".", 1)
+            if op == "in":
+                value = [_coerce(v) for v in _split_top(value.strip()[1:-1])]
+            else:
+                value = _coerce(value)
+            sql, p = self._condition(column, op, value)
+            conds.append(f"NOT ({sql})" if negate else sql)
+            params.extend(p)
+        return self._filter(f"({' OR '.join(conds)})", params)
+
+    # ---------- sắp xếp / giới hạn ----------
+    def order(self, column: str, desc: bool = False, nullsfirst: bool = None, **_):
+        # Mặc định như Postgres: NULL đứng cuối khi tăng dần, đầu khi giảm dần
+        nulls_first = desc if nullsfirst is None else nullsfirst
+        self._order.append(f"{self._column(column)} {'DESC' if desc else 'ASC'} "
+                           f"NULLS {'FIRST' if nulls_first else 'LAST'}")
+        return self
+
+    def limit(self, n: int, **_):
+        self._limit = int(n)
+        return self
+
+    def range(self, start: int, end: int, **_):
+        self._offset, self._limit = int(start), int(end) - int(start) + 1
+        return self
+
+    # ---------- sinh SQL ----------
+    def _where_sql(self) -> tuple[str, list]:
+        if not self._where:
+            return "", []
+        params = [p for _, ps in self._where for p in ps]
+        return " WHERE " + " AND ".join(sql for sql, _ in self._where), params
+
+    def _select_sql(self) -> tuple[str, list]:
+        table = _quote(self._table)
+        fields, joins = [], []
+        for col in _split_top(self._columns):
+            m = re.match(r"^(\w+)\((.*)\)$", col)
+            if m:
+                # Nhúng bảng cha qua khoá <bảng cha số ít>_id, vd projects(name) → project_id
+                parent = m.group(1)
+                ref = _quote(parent)
+                joins.append(f" LEFT JOIN {ref} ON {ref}.\"id\" = {self._column(parent.rstrip('s') + '_id')}")
+                fields.append(f'{ref}."id" AS "{parent}.__id"')
+                for sub in _split_top(m.group(2)):
+                    fields.append(f'{ref}.{_quote(sub)} AS "{parent}.{sub}"')
+            elif col == "*":
+                fields.append(f"{table}.*")
+            else:
+                fields.append(self._column(col))
+        where, params = self._where_sql()
+        sql = f"SELECT {', '.join(fields) or table + '.*'} FROM {table}{''.join(joins)}{where}"
+        if self._order:
+            sql += " ORDER BY " + ", ".join(self._order)
+        if self._limit is not None:
+            sql += " LIMIT %s"
+            params.append(self._limit)
+        if self._offset:
+            if self._limit is None:
+                sql += " LIMIT -1" if self._client.dialect == "sqlite" else " LIMIT ALL"
+            sql += " OFFSET %s"
+            params.append(self._offset)
+        return sql, params
+
+    def _nest(self, row: dict) -> dict:
+        """{"projects.name": x, "projects.__id": 1} → {"projects": {"name": x}} (None nếu không khớp)."""
+        out, embeds = {}, {}
+        for key, value in row.items():
+            if "." in key:
+                parent, sub = key.split(".", 1)
+                embeds.setdefault(parent, {})[sub] = value
+            else:
+                out[key] = value
+        for parent, values in embeds.items():
+            found = values.pop("__id") is not None
+            out[parent] = self._client.decode(parent, values) if found else None
+        return out
+
+    # ---------- thực thi ----------
+    def execute(self):
+        client = self._client
+        if self._op == "select":
+            sql, params = self._select_sql()
+            rows = [self._nest(r) for r in client.query(sql, params)]
+            count = None
+            if self._count:
+                where, wparams = self._where_sql()
+                count = client.query(f"SELECT COUNT(*) AS n FROM {_quote(self._table)}{where}", wparams)[0]["n"]
+            return SimpleNamespace(data=[client.decode(self._table, r) for r in rows], count=count)
+        if self._op in ("insert", "upsert"):
+            return SimpleNamespace(data=self._write_rows(), count=None)
+
+        where, params = self._where_sql()
+        if self._op == "update":
+            if not self._payload:
+                return SimpleNamespace(data=[], count=None)
+            kinds = _column_types(self._table)
+            sets = [f"{_quote(c)} = %s" for c in self._payload]
+            values = [_encode(v, kinds.get(c)) for c, v in self._payload.items()]
+            touch = _TOUCH_ON_UPDATE.get(self._table)
+            if client.dialect == "sqlite" and touch and touch not in self._payload:
+                sets.append(f"{_quote(touch)} = {_NOW[0]}")
+            sql = f"UPDATE {_quote(self._table)} SET {', '.join(sets)}{where} RETURNING *"
+            rows = client.query(sql, values + params)
+        else:
+            rows = client.query(f"DELETE FROM {_quote(self._table)}{where} RETURNING *", params)
+        return SimpleNamespace(data=[client.decode(self._table, r) for r in rows], count=None)
+
+    def _write_rows(self) -> list[dict]:
+        items = self._payload if isinstance(self._payload, list) else [self._payload]
+        kinds = _column_types(self._table)
+        conflict = ""
+        if self._op == "upsert":
+            keys = [k.strip() for k in self._on_conflict.split(",")] if self._on_conflict \
+                else list(_primary_key(self._table))
+            conflict = f" ON CONFLICT ({', '.join(map(_quote, keys))}) DO "
+
+        # Mỗi nhóm dòng cùng tập cột → 1 câu INSERT nhiều dòng
+        groups: dict[tuple, list] = {}
+        for item in items:
+            groups.setdefault(tuple(item), []).append(item)
+
+        out = []
+        for columns, rows in groups.items():
+            tail = ""
+            if conflict:
+                updates = [c for c in columns if c not in keys]
+                if self._ignore_duplicates or not updates:
+                    tail = conflict + "NOTHING"
+                else:
+                    tail = conflict + "UPDATE SET " + ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in updates)
+            for start in range(0, len(rows), INSERT_CHUNK):
+                chunk = rows[start:start + INSERT_CHUNK]
+                marks = "(" + ", ".join(["%s"] * len(columns)) + ")"
+                sql = (f"INSERT INTO {_quote(self._table)} ({', '.join(map(_quote, columns))}) "
+                       f"VALUES {', '.join([marks] * len(chunk))}{tail} RETURNING *")
+                params = [_encode(r[c], kinds.get(c)) for r in chunk for c in columns]
+                out.extend(self._client.decode(self._table, r) for r in self._client.query(sql, params))
+        return out
+
+
+class _SqlRpc:
+    def __init__(self, client: "SqlClient", fn: str, params: dict):
+        self._client = client
+        self._fn = fn
+        self._params = params
+
+    def execute(self):
+        return SimpleNamespace(data=self._client.call(self._fn, self._params), count=None)
+
+
+# ==================== DRIVER ====================
+
+class _Driver:
+    """Cấp kết nối DB-API (autocommit, mỗi truy vấn tự commit; riêng trong atomic() thì chung 1 giao dịch)."""
+
+    dialect = ""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _acquire(self):
+        raise NotImplementedError
+
+    def _release(self, conn):
+        pass
+
+    @contextmanager
+    def connection(self):
+        conn = getattr(self._local, "atomic", None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def atomic(self):
+        """Mọi truy vấn của luồng trong khối chạy trên 1 kết nối, commit / rollback cùng nhau (dùng cho seed)."""
+        with self.connection() as conn:
+            self._local.atomic = conn
+            try:
+                conn.cursor().execute("BEGIN")
+                try:
+                    yield
+                except BaseException:
+                    conn.cursor().execute("ROLLBACK")
+                    raise
+                conn.cursor().execute("COMMIT")
+            finally:
+                self._local.atomic = None
+
+    def run(self, sql: str, params=()) -> list[dict]:
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self.prepare(sql), tuple(params))
+            if not cur.description:
+                return []
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    def prepare(self, sql: str) -> str:
+        return sql
+
+    def script(self, sql: str):
+        with self.connection() as conn:
+            conn.cursor().execute(sql)
+
+
+def _casefold(value):
+    return value.casefold() if isinstance(value, str) else value
+
+
+class _SqliteDriver(_Driver):
+    """Mỗi luồng 1 kết nối (sqlite3 không chia kết nối giữa các luồng), WAL để đọc không chặn ghi."""
+
+    dialect = "sqlite"
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path or SQLITE_DEFAULT_PATH
+        self._uri = False
+        self._anchor = None
+        if self.path == ":memory:":
+            # DB trong RAM dùng chung cho mọi luồng, sống cùng tiến trình
+            self.path, self._uri = f"file:work_manager_{id(self)}?mode=memory&cache=shared", True
+            self._anchor = self._connect()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                               check_same_thread=False, uri=self._uri)
+        if not self._uri:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        # LIKE phân biệt hoa-thường như Postgres; ilike dùng casefold (đúng cả chữ có dấu)
+        conn.execute("PRAGMA case_sensitive_like=ON")
+        conn.create_function("py_casefold", 1, _casefold, deterministic=True)
+        return conn
+
+    def _acquire(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def prepare(self, sql: str) -> str:
+        return sql.replace("%s", "?")
+
+    def script(self, sql: str):
+        with self.connection() as conn:
+            conn.executescript(sql)
+
+
+class _PostgresDriver(_Driver):
+    """Pool kết nối psycopg 3 (psycopg_pool), không có thì psycopg2."""
+
+    dialect = "postgres"
+
+    def __init__(self, dsn: str, pool_size: int = DB_POOL_SIZE):
+        super().__init__()
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            ConnectionPool = None
+        if ConnectionPool is not None:
+            self._pool = ConnectionPool(dsn, min_size=1, max_size=pool_size, kwargs={"autocommit": True}, open=True)
+            self._psycopg2 = False
+            return
+        try:
+            from psycopg2.pool import ThreadedConnectionPool
+        except ImportError:
+            raise RuntimeError('STORAGE_BACKEND=postgres cần cài "psycopg[binary,pool]" hoặc psycopg2') from None
+        self._pool = ThreadedConnectionPool(1, pool_size, dsn)
+        self._psycopg2 = True
+
+    def _acquire(self):
+        conn = self._pool.getconn()
+        if self._psycopg2:
+            conn.autocommit = True
+        return conn
+
+    def _release(self, conn):
+        self._pool.putconn(conn)
+
+
+def _translate(e: Exception) -> Exception:
+    """Lỗi sqlite3 / psycopg → StorageError với mã như PostgREST / Postgres."""
+    if isinstance(e, StorageError):
+        return e
+    msg = str(e).strip()
+    low = msg.lower()
+    if isinstance(e, sqlite3.Error):
+        if "no such table" in low:
+            return StorageError("PGRST205", msg)
+        if "no such column" in low or "has no column named" in low:
+            return StorageError("42703", msg)
+        if "locked" in low or "busy" in low:
+            return StorageError("55P03", msg)
+        if isinstance(e, sqlite3.IntegrityError):
+            if "unique" in low:
+                return StorageError("23505", f"duplicate key: {msg}")
+            if "not null" in low:
+                return StorageError("23502", msg)
+            return StorageError("23000", msg)
+        return StorageError("HY000", msg)
+
+    code = getattr(e, "sqlstate", None) or getattr(e, "pgcode", None)
+    if code == "42P01":
+        return StorageError("PGRST205", msg)
+    if code == "42883":
+        return StorageError("PGRST202", msg)
+    if code:
+        return StorageError(code, msg)
+    if type(e).__name__ in ("OperationalError", "InterfaceError", "PoolTimeout"):
+        # Mất kết nối / pool hết chỗ (chưa có mã SQLSTATE)
+        return StorageError("08006", msg)
+    return e
+
+
+# ==================== RPC TRÊN SQLITE ====================
+# Hàm nào không có ở đây → PGRST202, app tự dùng đường dự phòng như khi Supabase chưa có RPC.
+
+def _rpc_task_stats(conn, project_names=None, project_ids=None):
+    import task_stats
+    return task_stats.aggregate_sqlite(conn, project_names, project_ids).to_dict("records")
+
+
+def _rpc_unfinished_projects(conn):
+    import task_stats
+    return [{"project": p} for p in task_stats.unfinished_projects_sqlite(conn)]
+
+
+def _rpc_task_quarter_counts(conn, p_project_id):
+    rows = conn.execute("""
+        SELECT assignee,
+               CAST(strftime('%Y', start_date) AS INTEGER),
+               (CAST(strftime('%m', start_date) AS INTEGER) + 2) / 3,
+               COUNT(*),
+               MAX(start_date)
+        FROM tasks
+        WHERE project_id = ? AND start_date IS NOT NULL
+        GROUP BY 1, 2, 3
+    """, (p_project_id,)).fetchall()
+    return [dict(zip(("assignee", "year", "quarter", "n", "last_date"), r)) for r in rows]
+
+
+SQLITE_RPCS = {
+    "task_stats": _rpc_task_stats,
+    "unfinished_projects": _rpc_unfinished_projects,
+    "task_quarter_counts": _rpc_task_quarter_counts,
+}
+
+
+# ==================== CLIENT SQL ====================
+
+class SqlClient:
+    """Client cùng giao diện với supabase-py (table / from_ / rpc) chạy trên SQLite hoặc Postgres."""
+
+    def __init__(self, driver: _Driver):
+        self.driver = driver
+        self.dialect = driver.dialect
+        self._rpc_signatures = {}
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> SqlQuery:
+        return SqlQuery(self, name)
+
+    from_ = table
+
+    def rpc(self, fn: str, params: dict = None, *args, **kwargs) -> _SqlRpc:
+        return _SqlRpc(self, fn, params or {})
+
+    # ---------- SQL ----------
+    def query(self, sql: str, params=()) -> list[dict]:
+        try:
+            return self.driver.run(sql, params)
+        except Exception as e:
+            err = _translate(e)
+            if err is e:
+                raise
+            raise err from e
+
+    def decode(self, table: str, row: dict) -> dict:
+        """Dòng đọc từ DB → dict như JSON của PostgREST (bool, JSON, ngày giờ dạng chuỗi)."""
+        kinds = _column_types(table) if table else {}
+        out = {}
+        for key, value in row.items():
+            kind = kinds.get(key)
+            if value is None:
+                pass
+            elif kind == "json" and isinstance(value, str):
+                value = json.loads(value)
+            elif kind == "bool" and not isinstance(value, bool):
+                value = bool(value)
+            elif not isinstance(value, dict):
+                value = _jsonable(value)
+            out[key] = value
+        return out
+
+    # ---------- RPC ----------
+    def call(self, fn: str, params: dict):
+        if self.dialect == "sqlite":
+            handler = SQLITE_RPCS.get(fn)
+            if handler is None:
+                raise StorageError("PGRST202", f"Could not find the function public.{fn} in the schema cache")
+            try:
+                with self.driver.connection() as conn:
+                    return handler(conn, **params)
+            except Exception as e:
+                err = _translate(e)
+                if err is e:
+                    raise
+                raise err from e
+        return self._call_postgres(fn, params)
+
+    def _signature(self, fn: str) -> dict:
+        """Kiểu trả về + kiểu tham số của hàm public.<fn> (đọc pg_proc 1 lần)."""
+        with self._lock:
+            sig = self._rpc_signatures.get(fn)
+        if sig is None:
+            rows = self.query("""
+                SELECT p.proretset AS retset, format_type(p.prorettype, NULL) AS rettype, t.typtype,
+                       p.proargnames AS names,
+                       array(SELECT format_type(a, NULL) FROM unnest(p.proargtypes::oid[]) a) AS types
+                FROM pg_proc p
+                JOIN pg_namespace n ON n.oid = p.pronamespace
+                JOIN pg_type t ON t.oid = p.prorettype
+                WHERE n.nspname = 'public' AND p.proname = %s
+            """, [fn])
+            if not rows:
+                raise StorageError("PGRST202", f"Could not find the function public.{fn} in the schema cache")
+            r = rows[0]
+            types = list(r["types"] or [])
+            sig = {
+                "rows": r["retset"] or r["typtype"] == "c" or r["rettype"] == "record",
+                "void": r["rettype"] == "void",
+                "args": dict(zip((r["names"] or [])[:len(types)], types)),
+            }
+            with self._lock:
+                self._rpc_signatures[fn] = sig
+        return sig
+
+    def _call_postgres(self, fn: str, params: dict):
+        sig = self._signature(fn)
+        missing = [k for k in params if k not in sig["args"]]
+        if missing:
+            raise StorageError("PGRST202", f"Could not find the function public.{fn}({', '.join(params)})")
+        args, values = [], []
+        for name, value in params.items():
+            kind = sig["args"][name]
+            args.append(f"{_quote(name)} => %s::{kind}")
+            values.append(_encode(value, "json" if kind in ("json", "jsonb") else None))
+        rows = self.query(f"SELECT * FROM {_quote(fn)}({', '.join(args)})", values)
+        if sig["void"]:
+            return None
+        if sig["rows"]:
+            return [self.decode(None, r) for r in rows]
+        return _jsonable(next(iter(rows[0].values()))) if rows else None
+
+    # ---------- schema ----------
+    def init_schema(self):
+        """Tạo bảng / index còn thiếu; Postgres mới tạo thì chạy thêm migrations/*.sql (RPC, trigger)."""
+        fresh = False
+        if self.dialect == "postgres":
+            fresh = not self.query("SELECT to_regclass('public.tasks') IS NOT NULL AS ok")[0]["ok"]
+        for stmt in schema_statements(self.dialect):
+            self.query(stmt)
+        if fresh:
+            for name in POSTGRES_MIGRATIONS:
+                with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as f:
+                    self.driver.script(f.read())
+
+
+# ==================== CHỌN BACKEND ====================
+
+def create_sql_client(backend: str = None, url: str = None) -> SqlClient:
+    """SqlClient cho sqlite / postgres (schema được tạo nếu chưa có)."""
+    backend = (backend or BACKEND).lower()
+    url = DATABASE_URL if url is None else url
+    if backend == "sqlite":
+        driver = _SqliteDriver(url or SQLITE_DEFAULT_PATH)
+    elif backend == "postgres":
+        if not url:
+            raise RuntimeError("STORAGE_BACKEND=postgres cần DATABASE_URL (DSN Postgres)")
+        driver = _PostgresDriver(url)
+    else:
+        raise ValueError(f"Backend SQL không hợp lệ: {backend}")
+    client = SqlClient(driver)
+    client.init_schema()
+    return client
+
+
+def create_client(supabase_url: str, supabase_key: str) -> db_client.ClientProxy:
+    """Client dùng chung của app theo STORAGE_BACKEND, luôn bọc bởi db_client."""
+    if BACKEND not in BACKENDS:
+        raise ValueError(f"STORAGE_BACKEND phải là một trong {', '.join(BACKENDS)} (đang là {BACKEND!r})")
+    if BACKEND == "supabase":
+        return db_client.create(supabase_url, supabase_key)
+    return db_client.ClientProxy(create_sql_client())
+
+
+def init_db(client):
+    """Tạo schema nếu backend là SQL; Supabase quản lý schema bằng migrations/*.sql nên bỏ qua."""
+    init_schema = getattr(client, "init_schema", None)
+    if init_schema is not None:
+        init_schema()
+
+
+def describe() -> str:
+    """Tên backend đang dùng (hiển thị ở trang chẩn đoán)."""
+    if BACKEND == "sqlite":
+        return f"SQLite ({DATABASE_URL or SQLITE_DEFAULT_PATH})"
+    return {"supabase": "Supabase REST", "postgres": "Postgres"}.get(BACKEND, BACKEND)
+
+
+# ==================== DÒNG LỆNH ====================
+# python -m storage init                       → tạo schema cho backend đang chọn
+# python -m storage seed --scale 1             → + dữ liệu giả lập (benchmarks/datagen.py) để dev / load test
+
+def seed(client: SqlClient, scale: int = 1, seed_value: int = 42) -> dict:
+    """Nạp dữ liệu giả lập vào DB rỗng, trả về số dòng mỗi bảng."""
+    from benchmarks import datagen
+
+    counts = {}
+    # Lỗi giữa chừng → rollback, không để lại DB nạp dở
+    with client.driver.atomic():
+        for table, rows in datagen.generate(scale, seed_value).items():
+            client.table(table).insert(rows).execute()
+            counts[table] = len(rows)
+            if client.dialect == "postgres" and "id" in _column_types(table):
+                # id ghi tay → đẩy identity lên sau id lớn nhất
+                client.query(f"SELECT setval(pg_get_serial_sequence('public.{table}', 'id'), "
+                             f"GREATEST((SELECT COALESCE(MAX(id), 0) FROM {_quote(table)}), 1))")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Khởi tạo DB cho backend SQLite / Postgres")
+    parser.add_argument("command", choices=["init", "seed"])
+    parser.add_argument("--backend", default=None, help="sqlite | postgres (mặc định: STORAGE_BACKEND)")
+    parser.add_argument("--url", default=None, help="đường dẫn SQLite / DSN Postgres (mặc định: DATABASE_URL)")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    backend = args.backend or (BACKEND if BACKEND != "supabase" else "sqlite")
+    client = create_sql_client(backend, args.url)
+    print(f"✅ Schema sẵn sàng ({backend})")
+    if args.command == "seed":
+        for table, n in seed(client, args.scale, args.seed).items():
+            print(f"{table:20s} {n:>8d} dòng")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# task_stats.py
+import pandas as pd
+
+from auth import get_connection
+import db_client
+import job_catalog
+import repository
+import task_store
+import perf
+
+
+# ==================== THỐNG KÊ CÔNG VIỆC ====================
+# Hợp đồng chung cho mọi backend: 1 dòng cho mỗi (project, assignee, parent_job) với
+#   total, done (progress = 100), not_done (progress < 100),
+#   progress_sum, progress_count (để tính lại trung bình chính xác khi gộp nhóm).
+# parent_job = tên đầu mục cha của công việc (hoặc chính nó nếu không có cha).
+#
+# Backend:
+#   1. RPC task_stats trên Supabase (migrations/task_stats.sql, theo project_id: tasks_fk_ids.sql)
+#      – gom nhóm ngay trong DB
+#   2. aggregate_sqlite(conn, ...) – bản SQLite cùng hợp đồng, dùng cho test / chạy offline
+#   3. aggregate_frame(df, ...) – gom nhóm bằng pandas (vectorized) khi DB chưa có RPC
+
+STAT_KEYS = ["project", "assignee", "parent_job"]
+STAT_COLUMNS = STAT_KEYS + ["total", "done", "not_done", "progress_sum", "progress_count"]
+
+_rpc_available = None
+
+
+def _empty_stats() -> pd.DataFrame:
+    return pd.DataFrame(columns=STAT_COLUMNS)
+
+
+# -------------------- Backend pandas --------------------
+
+def aggregate_frame(df_tasks: pd.DataFrame, parent_lookup: dict, parent_by_id: dict = None) -> pd.DataFrame:
+    """
+    Gom nhóm tasks (cột id, project, assignee, task, progress) theo hợp đồng chung.
+    - parent_by_id: {job_id: tên đầu mục cha}, dùng cho các dòng có cột job_id
+    """
+    if df_tasks.empty:
+        return _empty_stats()
+
+    parent_job = df_tasks["task"].map(parent_lookup)
+    if parent_by_id is not None and "job_id" in df_tasks.columns:
+        by_id = pd.to_numeric(df_tasks["job_id"], errors="coerce").map(parent_by_id)
+        parent_job = by_id.where(df_tasks["job_id"].notna(), parent_job)
+
+    progress = pd.to_numeric(df_tasks["progress"], errors="coerce")
+    df = pd.DataFrame({
+        "project": df_tasks["project"],
+        "assignee": df_tasks["assignee"],
+        "parent_job": parent_job.fillna(df_tasks["task"]),
+        "id": df_tasks["id"],
+        "done": (progress == 100).astype(int),
+        "not_done": (progress < 100).astype(int),
+        "progress": progress,
+        "has_progress": progress.notna().astype(int),
+    })
+    return df.groupby(STAT_KEYS, dropna=False).agg(
+        total=("id", "count"),
+        done=("done", "sum"),
+        not_done=("not_done", "sum"),
+        progress_sum=("progress", "sum"),
+        progress_count=("has_progress", "sum"),
+    ).reset_index()
+
+
+# -------------------- Backend SQLite --------------------
+
+SQLITE_STATS_SQL = """
+    SELECT t.project,
+           t.assignee,
+           COALESCE(parent.name, j.name, t.task)         AS parent_job,
+           COUNT(t.id)                                   AS total,
+           SUM(CASE WHEN t.progress = 100 THEN 1 ELSE 0 END) AS done,
+           SUM(CASE WHEN t.progress < 100 THEN 1 ELSE 0 END) AS not_done,
+           COALESCE(SUM(t.progress), 0)                  AS progress_sum,
+           COUNT(t.progress)                             AS progress_count
+    FROM tasks t
+    LEFT JOIN job_catalog j ON j.id = COALESCE(
+        t.job_id, (SELECT MIN(id) FROM job_catalog WHERE name = t.task)
+    )
+    LEFT JOIN job_catalog parent ON parent.id = j.parent_id
+    WHERE t.{column} IN ({placeholders})
+    GROUP BY 1, 2, 3
+"""
+
+
+def aggregate_sqlite(conn, projects: list[str] = None, project_ids: list[int] = None) -> pd.DataFrame:
+    """
+    Cùng hợp đồng với RPC task_stats, chạy trên sqlite3 (bảng tasks có cột job_id + job_catalog).
+    - Lọc theo project_ids (cột project_id) nếu có, không thì theo tên dự án
+    """
+    column, values = ("project_id", project_ids) if project_ids is not None else ("project", projects)
+    if not values:
+        return _empty_stats()
+    sql = SQLITE_STATS_SQL.format(column=column, placeholders=",".join("?" * len(values)))
+    return pd.read_sql_query(sql, conn, params=list(values))
+
+
+def unfinished_projects_sqlite(conn) -> list[str]:
+    rows = conn.execute("SELECT DISTINCT project FROM tasks WHERE progress < 100").fetchall()
+    return [r[0] for r in rows]
+
+
+# -------------------- Backend Supabase --------------------
+
+def _project_ids(projects: list[str]) -> list[int]:
+    """Tên dự án → id (tải lại danh sách dự án 1 lần nếu có tên chưa thấy)."""
+    df = repository.load_projects()
+    if not set(projects) <= set(df["name"]):
+        df = repository.load_projects(refresh=True)
+    ids = df.loc[df["name"].isin(projects), "id"]
+    return [int(i) for i in ids]
+
+
+@perf.timed("stats.load_task_stats", rows=len)
+def load_task_stats(projects: list[str]) -> pd.DataFrame:
+    """Số liệu thống kê của các dự án, gom nhóm trên server nếu có RPC."""
+    global _rpc_available
+
+    if not projects:
+        return _empty_stats()
+
+    supabase = get_connection()
+    # Có cột project_id (migrations/tasks_fk_ids.sql) → lọc theo id (index số nguyên) thay vì tên
+    by_id = task_store.has_id_columns()
+    if by_id:
+        column, values, params = "project_id", _project_ids(projects), "project_ids"
+        if not values:
+            return _empty_stats()
+    else:
+        column, values, params = "project", list(projects), "project_names"
+
+    if _rpc_available is not False:
+        try:
+            res = supabase.rpc("task_stats", {params: values}).execute()
+            _rpc_available = True
+            return pd.DataFrame(res.data, columns=STAT_COLUMNS) if res.data else _empty_stats()
+        except Exception as e:
+            if not db_client.is_missing_function(e):
+                raise
+            _rpc_available = False
+
+    # Dự phòng: chỉ tải các cột cần cho thống kê rồi gom nhóm bằng pandas
+    columns = "id, project, assignee, task, progress" + (", job_id" if by_id else "")
+    data = supabase.table("tasks").select(columns).in_(column, values).execute()
+    df_tasks = pd.DataFrame(data.data)
+    catalog = job_catalog.get_catalog()
+    return aggregate_frame(df_tasks, catalog.parent_name, catalog.parent_name_by_id)
+
+
+def unfinished_projects() -> list[str]:
+    """Tên các dự án còn ít nhất 1 công việc chưa xong."""
+    supabase = get_connection()
+    if _rpc_available is not False:
+        try:
+            res = supabase.rpc("unfinished_projects", {}).execute()
+            return [r["project"] for r in res.data or []]
+        except Exception as e:
+            if not db_client.is_missing_function(e):
+                raise
+    data = supabase.table("tasks").select("project").lt("progress", 100).execute()
+    return list({r["project"] for r in data.data})
+
+
+# ==================== GỘP NHÓM ĐỂ HIỂN THỊ ====================
+
+def rollup(stats: pd.DataFrame, keys: list[str], user_map: dict = None) -> pd.DataFrame:
+    """
+    Gộp số liệu về các cột keys (vd ["project"] hoặc ["assignee", "project"]).
+    - user_map: đổi username → tên hiển thị trước khi gộp
+    - Trả về keys + total, done, not_done, avg_progress
+    """
+    df = stats.copy()
+    if user_map and "assignee" in keys:
+        df["assignee"] = df["assignee"].map(user_map).fillna(df["assignee"])
+
+    out = df.groupby(keys)[["total", "done", "not_done", "progress_sum", "progress_count"]] \
+        .sum().reset_index()
+    count = out["progress_count"].astype(float).where(out["progress_count"] > 0)
+    out["avg_progress"] = out["progress_sum"].astype(float) / count
+    return out.drop(columns=["progress_sum", "progress_count"])
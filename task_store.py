@@ -0,0 +1,282 @@
+# task_store.py
+import threading
+import time
+
+import pandas as pd
+
+from auth import get_connection
+import db_client
+import repository
+import perf
+
+
+# ==================== KHO TASKS DÙNG CHUNG ====================
+# Giữ tasks của từng dự án trong bộ nhớ tiến trình, đánh chỉ mục theo dự án và theo
+# người thực hiện. Mỗi lần đọc chỉ tải thêm các dòng có updated_at (hoặc created_at
+# nếu DB chưa chạy migrations/tasks_updated_at.sql) mới hơn lần đồng bộ trước.
+# Khi ghi (thêm/sửa/xoá) thì gọi invalidate_project(<tên dự án>) → chỉ dự án đó
+# bị tải lại, các dự án khác và users/projects/job_catalog không bị ảnh hưởng.
+# Dòng bị xoá ở tiến trình khác được phát hiện khi đồng bộ bằng cách so số dòng.
+
+TASK_COLUMNS = [
+    "id", "project", "project_id", "task", "job_id", "assignee", "khoi_luong", "progress", "deadline",
+    "note", "approved", "start_date", "start_time", "end_time", "end_date",
+    "created_at", "updated_at",
+]
+
+# Trong khoảng này (giây) dùng luôn dữ liệu đang có, không hỏi lại server
+REFRESH_INTERVAL = 15
+# Tải lại toàn bộ dự án định kỳ (phòng hờ thay đổi mà mốc updated_at + số dòng không bắt được)
+FULL_RELOAD_INTERVAL = 600
+
+# Số dòng mỗi trang của fetch_page (grid công nhật)
+PAGE_SIZE = 200
+
+# Kết quả của quarter_counts: số công nhật theo (người thực hiện, năm, quý) + ngày muộn nhất
+QUARTER_COLUMNS = ["assignee", "year", "quarter", "n", "last_date"]
+
+# None = chưa biết, False = DB chưa có RPC task_quarter_counts
+_quarter_rpc_available = None
+
+# Cột dùng làm mốc đồng bộ; tự lùi về created_at nếu bảng chưa có updated_at
+_watermark_column = "updated_at"
+
+# None = chưa biết, True/False = bảng tasks đã / chưa có project_id, job_id
+# (migrations/tasks_fk_ids.sql)
+_id_columns_available = None
+
+
+def has_id_columns() -> bool:
+    """
+    Bảng tasks đã có project_id / job_id chưa (kiểm tra 1 lần / tiến trình).
+    Chỉ ghi nhớ "chưa có" khi DB báo thiếu cột; lỗi khác (mất mạng, timeout) được ném lại
+    để lần sau kiểm tra tiếp thay vì chuyển hẳn sang đường cũ.
+    """
+    global _id_columns_available
+    if _id_columns_available is None:
+        try:
+            get_connection().table("tasks").select("project_id, job_id").limit(1).execute()
+            _id_columns_available = True
+        except Exception as e:
+            if not db_client.is_missing_column(e):
+                raise
+            _id_columns_available = False
+    return _id_columns_available
+
+
+def _project_id(project: str):
+    """id của dự án theo tên (danh sách dự án đã cache), None nếu không có."""
+    projects = repository.load_projects()
+    ids = projects.loc[projects["name"] == project, "id"]
+    return int(ids.iloc[0]) if not ids.empty else None
+
+
+def _project_query(supabase, project: str, count: str = None, columns: str = "*"):
+    """select tasks của 1 dự án: lọc theo project_id (index số nguyên) nếu có, không thì theo tên."""
+    query = supabase.table("tasks").select(columns, count=count)
+    if has_id_columns():
+        project_id = _project_id(project)
+        if project_id is not None:
+            return query.eq("project_id", project_id)
+    return query.eq("project", project)
+
+
+class _ProjectTasks:
+    def __init__(self):
+        self.rows: dict[int, dict] = {}
+        self.by_assignee: dict[str, set[int]] = {}
+        self.watermark = None
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+        self.frame = None
+        self.lock = threading.Lock()
+
+    def merge(self, records: list[dict]):
+        changed = False
+        for rec in records:
+            task_id = int(rec["id"])
+            old = self.rows.get(task_id)
+            if old == rec:
+                # Dòng trùng mốc (gte) đã có sẵn, không đổi → giữ nguyên frame đã dựng
+                continue
+            changed = True
+            if old is not None:
+                self.by_assignee.get(old.get("assignee"), set()).discard(task_id)
+            self.rows[task_id] = rec
+            self.by_assignee.setdefault(rec.get("assignee"), set()).add(task_id)
+
+            mark = rec.get(_watermark_column)
+            if mark and (self.watermark is None or str(mark) > str(self.watermark)):
+                self.watermark = mark
+        if changed:
+            self.frame = None
+
+    def to_frame(self, ids=None) -> pd.DataFrame:
+        if ids is None:
+            if self.frame is None:
+                self.frame = _records_to_frame([self.rows[i] for i in sorted(self.rows)])
+            return self.frame.copy()
+        return _records_to_frame([self.rows[i] for i in sorted(ids) if i in self.rows])
+
+
+_projects: dict[str, _ProjectTasks] = {}
+_projects_lock = threading.Lock()
+
+
+def _records_to_frame(records: list[dict]) -> pd.DataFrame:
+    if not records:
+        return pd.DataFrame(columns=TASK_COLUMNS)
+    return pd.DataFrame(records).reset_index(drop=True)
+
+
+def _entry(project: str) -> _ProjectTasks:
+    with _projects_lock:
+        entry = _projects.get(project)
+        if entry is None:
+            entry = _projects[project] = _ProjectTasks()
+        return entry
+
+
+def _full_load(supabase, project: str, entry: _ProjectTasks):
+    data = _project_query(supabase, project).execute()
+    entry.rows.clear()
+    entry.by_assignee.clear()
+    entry.watermark = None
+    entry.frame = None
+    entry.merge(data.data or [])
+    entry.loaded_at = entry.checked_at = time.monotonic()
+
+
+def _incremental_load(supabase, project: str, entry: _ProjectTasks):
+    global _watermark_column
+
+    query = _project_query(supabase, project)
+    try:
+        # gte (không phải gt) để không sót dòng trùng mốc thời gian; trùng id thì ghi đè
+        data = query.gte(_watermark_column, entry.watermark).execute()
+    except Exception as e:
+        if _watermark_column == "updated_at" and "updated_at" in str(e):
+            _watermark_column = "created_at"
+            _full_load(supabase, project, entry)
+            return
+        raise
+    entry.merge(data.data or [])
+
+    # Dòng bị xoá từ phiên / tiến trình khác không có mốc updated_at để tải thêm:
+    # đếm số dòng trên server (chỉ trả count), lệch với bộ nhớ → tải lại cả dự án.
+    total = _project_query(supabase, project, count="exact").limit(0).execute().count
+    if total is not None and int(total) != len(entry.rows):
+        _full_load(supabase, project, entry)
+        return
+    entry.checked_at = time.monotonic()
+
+
+def _sync(project: str) -> _ProjectTasks:
+    entry = _entry(project)
+    with entry.lock:
+        now = time.monotonic()
+        if entry.loaded_at and now - entry.checked_at < REFRESH_INTERVAL:
+            return entry
+
+        supabase = get_connection()
+        if not entry.loaded_at or entry.watermark is None or now - entry.loaded_at > FULL_RELOAD_INTERVAL:
+            _full_load(supabase, project, entry)
+        else:
+            _incremental_load(supabase, project, entry)
+        return entry
+
+
+# ==================== API ====================
+
+@perf.timed("tasks.get_project_tasks", rows=len)
+def get_project_tasks(project: str) -> pd.DataFrame:
+    """Toàn bộ tasks của 1 dự án (tất cả cột)."""
+    entry = _sync(project)
+    with entry.lock:
+        return entry.to_frame()
+
+
+@perf.timed("tasks.get_tasks", rows=len)
+def get_tasks(project: str, assignee: str = None) -> pd.DataFrame:
+    """Tasks của 1 dự án, lọc theo người thực hiện qua chỉ mục (không quét cả bảng)."""
+    entry = _sync(project)
+    with entry.lock:
+        if assignee is None:
+            return entry.to_frame()
+        return entry.to_frame(entry.by_assignee.get(assignee, set()))
+
+
+def invalidate_project(*projects: str):
+    """Bỏ dữ liệu của các dự án vừa bị ghi. Không truyền tham số → bỏ tất cả."""
+    with _projects_lock:
+        names = projects or tuple(_projects)
+        for name in names:
+            _projects.pop(name, None)
+
+
+@perf.timed("tasks.fetch_page", rows=lambda r: len(r[0]))
+def fetch_page(project: str, assignee: str = None, date_from=None, date_to=None,
+               approved: bool = None, page: int = 0, page_size: int = PAGE_SIZE) -> tuple[pd.DataFrame, int]:
+    """
+    1 trang tasks của dự án, lọc ngay trên server (không qua kho trong bộ nhớ).
+    - date_from / date_to: lọc start_date; approved: True / False (False gồm cả NULL) / None = tất cả
+    - page bắt đầu từ 0, sắp theo start_date rồi id
+    Trả về (trang, tổng số dòng khớp bộ lọc).
+    """
+    query = _project_query(get_connection(), project, count="exact")
+    if assignee is not None:
+        query = query.eq("assignee", assignee)
+    if date_from is not None:
+        query = query.gte("start_date", str(date_from))
+    if date_to is not None:
+        query = query.lte("start_date", str(date_to))
+    if approved is True:
+        query = query.eq("approved", True)
+    elif approved is False:
+        query = query.or_("approved.is.null,approved.eq.false")
+
+    start = max(page, 0) * page_size
+    res = query.order("start_date").order("id").range(start, start + page_size - 1).execute()
+    return _records_to_frame(res.data or []), int(res.count or 0)
+
+
+@perf.timed("tasks.quarter_counts", rows=len)
+def quarter_counts(project: str) -> pd.DataFrame:
+    """
+    Số công nhật của dự án theo (assignee, year, quarter) và ngày muộn nhất (last_date),
+    cho các ô chọn năm / quý / người thực hiện mà không tải cả dự án.
+    - RPC task_quarter_counts (migrations/tasks_paging.sql) gom nhóm trong DB
+    - Dự phòng: chỉ tải 2 cột assignee, start_date rồi gom nhóm bằng pandas
+    """
+    global _quarter_rpc_available
+
+    supabase = get_connection()
+    project_id = _project_id(project) if has_id_columns() else None
+    if project_id is not None and _quarter_rpc_available is not False:
+        try:
+            res = supabase.rpc("task_quarter_counts", {"p_project_id": project_id}).execute()
+            _quarter_rpc_available = True
+            df = pd.DataFrame(res.data or [], columns=QUARTER_COLUMNS)
+            df["last_date"] = pd.to_datetime(df["last_date"], errors="coerce").dt.date
+            return df
+        except Exception as e:
+            if not db_client.is_missing_function(e):
+                raise
+            _quarter_rpc_available = False
+
+    data = _project_query(supabase, project, columns="assignee, start_date").execute()
+    df = pd.DataFrame(data.data or [], columns=["assignee", "start_date"])
+    dates = pd.to_datetime(df["start_date"], errors="coerce")
+    df = pd.DataFrame({
+        "assignee": df["assignee"],
+        "year": dates.dt.year,
+        "quarter": dates.dt.quarter,
+        "date": dates.dt.date,
+    })[dates.notna()]
+    if df.empty:
+        return pd.DataFrame(columns=QUARTER_COLUMNS)
+    out = df.groupby(["assignee", "year", "quarter"], dropna=False).agg(
+        n=("date", "size"), last_date=("date", "max")
+    ).reset_index()
+    out[["year", "quarter"]] = out[["year", "quarter"]].astype(int)
+    return out[QUARTER_COLUMNS]
@@ -0,0 +1,17 @@
+# tests/conftest.py
+import pytest
+
+import auth
+import storage
+from benchmarks import scenarios
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """SQLite trong bộ nhớ (schema rỗng) làm backend của get_connection(); probe / cache được xoá trước và sau."""
+    sql = storage.create_sql_client("sqlite", ":memory:")
+    monkeypatch.setattr(auth, "supabase", auth.supabase)
+    scenarios.install(sql)
+    yield auth.supabase
+    scenarios._reset_probes()
+    scenarios._reset_caches()
@@ -0,0 +1,41 @@
+# tests/test_attendance_cutover.py
+# Đã backfill xong (attendance_cutover có dòng) → load_attendance_month thôi đọc blob attendance_new.
+# Chạy: python -m pytest -q tests
+import attendance
+from migrations import attendance_monthly
+
+
+def _legacy(client, rows):
+    client.table(attendance.LEGACY_TABLE).insert(
+        [{"username": u, "data": data, "months": list(data)} for u, data in rows.items()]
+    ).execute()
+
+
+def test_reads_legacy_until_cutover(client):
+    _legacy(client, {"a": {"2025-03": {"01": "P"}}, "b": {"2025-03": {"01": "H"}}})
+    client.table(attendance.MONTHLY_TABLE).insert(
+        [{"username": "a", "month": "2025-03", "data": {"01": "K"}}]
+    ).execute()
+
+    assert attendance.load_attendance_month("2025-03") == {"a": {"01": "K"}, "b": {"01": "H"}}
+    assert attendance.legacy_retired(client) is False
+
+
+def test_backfill_sets_cutover_and_stops_legacy_reads(client, monkeypatch):
+    _legacy(client, {"a": {"2025-03": {"01": "P"}}, "b": {"2025-03": {"01": "H"}}})
+
+    assert attendance_monthly.migrate() == 2
+    monkeypatch.setattr(attendance, "_cutover_checked_at", None)
+    assert attendance.legacy_retired(client) is True
+
+    # Blob cũ không còn được đọc: dữ liệu chỉ ở đó thì không hiện nữa
+    client.table(attendance.LEGACY_TABLE).upsert(
+        [{"username": "c", "data": {"2025-03": {"01": "L"}}, "months": ["2025-03"]}]
+    ).execute()
+    assert attendance.load_attendance_month("2025-03") == {"a": {"01": "P"}, "b": {"01": "H"}}
+
+
+def test_dry_run_keeps_legacy(client):
+    _legacy(client, {"a": {"2025-03": {"01": "P"}}})
+    attendance_monthly.migrate(dry_run=True)
+    assert attendance.legacy_retired(client) is False
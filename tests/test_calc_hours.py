@@ -0,0 +1,138 @@
+# tests/test_calc_hours.py
+# calc_hours_vectorized phải cho cùng kết quả với calc_hours (từng dòng) trên mọi đầu vào.
+# Chạy: python -m pytest -q tests
+import math
+import random
+from datetime import date, time, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from auth import calc_hours, calc_hours_vectorized
+
+
+def _parse_time(value):
+    """Giá trị ô giờ → time cho calc_hours (None nếu trống / sai, như calc_hours_vectorized)."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, time):
+        return value
+    try:
+        h, m = str(value).split(":")[:2]
+        return time(int(h), int(m))
+    except ValueError:
+        return None
+
+
+def _parse_date(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _expected(rows: list[dict]) -> list[float]:
+    return [
+        calc_hours(_parse_date(r["start_date"]), _parse_date(r["end_date"]),
+                   _parse_time(r["start_time"]), _parse_time(r["end_time"]))
+        for r in rows
+    ]
+
+
+def _assert_same(rows: list[dict]):
+    got = calc_hours_vectorized(pd.DataFrame(rows))
+    expected = _expected(rows)
+    for row, g, e in zip(rows, got, expected):
+        assert g == pytest.approx(e, abs=1e-9), row
+
+
+def _fmt_time(t: time, style: int):
+    """Các dạng giờ gặp trong DB / grid: time, "H:MM", "HH:MM", "HH:MM:SS"."""
+    if style == 0:
+        return t
+    if style == 1:
+        return f"{t.hour}:{t.minute:02d}"
+    if style == 2:
+        return t.strftime("%H:%M")
+    return t.strftime("%H:%M:%S")
+
+
+def _random_row(rnd: random.Random) -> dict:
+    start = date(2025, 1, 1) + timedelta(days=rnd.randrange(365))
+    # Phần lớn 0–3 ngày, có cả ngày kết thúc trước ngày bắt đầu và khoảng dài qua cuối tuần
+    days = rnd.choice([0, 0, 0, 1, 1, 2, 3, -1, rnd.randrange(4, 15)])
+    t1 = time(rnd.randrange(24), rnd.choice([0, 15, 30, 45, rnd.randrange(60)]))
+    t2 = time(rnd.randrange(24), rnd.choice([0, 15, 30, 45, rnd.randrange(60)]))
+    return {
+        "start_date": start.isoformat(),
+        "end_date": (start + timedelta(days=days)).isoformat(),
+        "start_time": _fmt_time(t1, rnd.randrange(4)),
+        "end_time": _fmt_time(t2, rnd.randrange(4)),
+    }
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_generated_rows_match_scalar(seed):
+    rnd = random.Random(seed)
+    _assert_same([_random_row(rnd) for _ in range(500)])
+
+
+def test_same_day():
+    _assert_same([
+        {"start_date": "2025-03-03", "end_date": "2025-03-03", "start_time": "08:00", "end_time": "17:00"},
+        {"start_date": "2025-03-03", "end_date": "2025-03-03", "start_time": "08:00", "end_time": "12:00"},
+        {"start_date": "2025-03-03", "end_date": "2025-03-03", "start_time": "12:30", "end_time": "13:00"},
+        {"start_date": "2025-03-03", "end_date": "2025-03-03", "start_time": "13:00", "end_time": "21:15"},
+    ])
+    got = calc_hours_vectorized(pd.DataFrame([
+        {"start_date": "2025-03-03", "end_date": "2025-03-03", "start_time": "08:00", "end_time": "17:00"},
+    ]))
+    assert got.iloc[0] == 8.0
+
+
+def test_end_before_start_is_zero():
+    rows = [
+        {"start_date": "2025-03-03", "end_date": "2025-03-03", "start_time": "17:00", "end_time": "08:00"},
+        {"start_date": "2025-03-03", "end_date": "2025-03-03", "start_time": "08:00", "end_time": "08:00"},
+        {"start_date": "2025-03-04", "end_date": "2025-03-03", "start_time": "08:00", "end_time": "17:00"},
+    ]
+    _assert_same(rows)
+    assert calc_hours_vectorized(pd.DataFrame(rows)).tolist() == [0.0, 0.0, 0.0]
+
+
+def test_overnight_shift():
+    _assert_same([
+        {"start_date": "2025-03-03", "end_date": "2025-03-04", "start_time": "22:00", "end_time": "06:00"},
+        {"start_date": "2025-03-03", "end_date": "2025-03-04", "start_time": "17:30", "end_time": "08:00"},
+        {"start_date": "2025-03-03", "end_date": "2025-03-04", "start_time": "08:00", "end_time": "17:00"},
+    ])
+
+
+def test_middle_days_count_calendar_days():
+    # Ngày giữa tính theo ngày lịch, 8h/ngày kể cả T7 / CN (giống calc_hours)
+    rows = [
+        {"start_date": "2025-03-07", "end_date": "2025-03-10", "start_time": "08:00", "end_time": "17:00"},  # T6 → T2
+        {"start_date": "2025-03-03", "end_date": "2025-03-13", "start_time": "13:00", "end_time": "12:00"},
+    ]
+    _assert_same(rows)
+    # T6: 8h, T7 + CN: 16h, T2: 8h
+    assert calc_hours_vectorized(pd.DataFrame(rows[:1])).iloc[0] == 32.0
+
+
+@pytest.mark.parametrize("missing", [None, np.nan, "", "abc", "25"])
+def test_missing_or_invalid_values_are_zero(missing):
+    base = {"start_date": "2025-03-03", "end_date": "2025-03-03", "start_time": "08:00", "end_time": "17:00"}
+    rows = [dict(base, **{col: missing}) for col in ("start_time", "end_time")]
+    got = calc_hours_vectorized(pd.DataFrame(rows))
+    assert got.tolist() == [0.0, 0.0]
+    for col in ("start_date", "end_date"):
+        got = calc_hours_vectorized(pd.DataFrame([dict(base, **{col: None})]))
+        assert got.tolist() == [0.0]
+
+
+def test_keeps_index():
+    df = pd.DataFrame(
+        [{"start_date": "2025-03-03", "end_date": "2025-03-03", "start_time": "08:00", "end_time": "17:00"}] * 3,
+        index=[10, 20, 30],
+    )
+    assert calc_hours_vectorized(df).index.tolist() == [10, 20, 30]
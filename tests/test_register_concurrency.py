@@ -0,0 +1,108 @@
+# tests/test_register_concurrency.py
+# Nhiều luồng gọi auth.register_user cùng lúc trên 1 file SQLite (qua storage.SqlClient):
+# - RPC register_user (migrations/register_user.sql): id do DB cấp
+# - Dự phòng _insert_with_next_id khi users.id chưa có identity: max(id) + 1, trùng id thì thử lại
+# Không được có id trùng, và mỗi username (không phân biệt hoa-thường) chỉ đăng ký được 1 lần.
+# Chạy: python -m pytest -q tests
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import pytest
+
+import auth
+import storage
+from benchmarks import scenarios
+
+THREADS = 16
+USERS = 60
+DUPLICATES = ["Dup.User", "dup.user", "DUP.USER", " dup.user "] * 5
+
+
+def _rpc_register_user(conn, p_username, p_username_key, p_display_name, p_dob, p_password, p_role):
+    cur = conn.execute(
+        "INSERT INTO users (username, username_key, display_name, dob, password, role) "
+        "VALUES (?, ?, ?, ?, ?, ?) RETURNING *",
+        (p_username, p_username_key, p_display_name, p_dob, p_password, p_role),
+    )
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+# users.id kiểu INT không tự tăng (như trước migrations/register_user.sql) → insert không kèm id
+# bị từ chối (23502) và register_user phải đi đường max(id) + 1
+LEGACY_USERS = """
+    CREATE TABLE users (
+        id INT NOT NULL PRIMARY KEY, stt INT, username TEXT, username_key TEXT,
+        display_name TEXT, dob TEXT, password TEXT, role TEXT,
+        project_manager_of TEXT, project_leader_of TEXT, online INTEGER, last_seen TEXT
+    )
+"""
+
+
+@pytest.fixture
+def users_db(request, tmp_path, monkeypatch):
+    """File SQLite (WAL, mỗi luồng 1 kết nối) làm backend; probe của auth được xoá."""
+    # Luồng chờ khoá ghi quá lâu → lỗi 55P03 sớm, db_client gửi lại (insert chưa được xử lý)
+    monkeypatch.setattr(storage, "SQLITE_BUSY_TIMEOUT", 2.0)
+    path = str(tmp_path / "users.db")
+    if getattr(request, "param", None) == "legacy_id":
+        with closing(sqlite3.connect(path)) as conn:
+            conn.execute(LEGACY_USERS)
+    client = storage.create_sql_client("sqlite", path)
+    monkeypatch.setattr(auth, "supabase", auth.supabase)
+    for name in ("_register_rpc_available", "_id_default_available", "_username_key_available"):
+        monkeypatch.setattr(auth, name, None)
+    scenarios.install(client)
+    yield client
+    scenarios._reset_probes()
+    scenarios._reset_caches()
+
+
+def _register_all(names):
+    def one(name):
+        try:
+            return auth.register_user(name, name, "1990-01-01", "pw")
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return list(pool.map(one, names))
+
+
+def _assert_consistent(client, results, names):
+    errors = [r for r in results if isinstance(r, Exception)]
+    assert not errors, errors[:3]
+    rows = client.query("SELECT COUNT(*) AS n, COUNT(DISTINCT id) AS ids FROM users")[0]
+    assert rows["n"] == rows["ids"] == len(names)
+    assert len({r["id"] for r in results}) == len(names)
+
+
+def _assert_one_duplicate_wins(client):
+    results = _register_all(DUPLICATES)
+    ok = [r for r in results if not isinstance(r, Exception)]
+    assert len(ok) == 1
+    assert all(isinstance(r, auth.UsernameTakenError) for r in results if isinstance(r, Exception))
+    n = client.query("SELECT COUNT(*) AS n FROM users WHERE username_key = 'dup.user'")[0]["n"]
+    assert n == 1
+
+
+def test_rpc_register_concurrent(users_db, monkeypatch):
+    monkeypatch.setitem(storage.SQLITE_RPCS, "register_user", _rpc_register_user)
+    names = [f"user{i:03d}" for i in range(USERS)]
+
+    _assert_consistent(users_db, _register_all(names), names)
+    assert auth._register_rpc_available is True
+    _assert_one_duplicate_wins(users_db)
+
+
+@pytest.mark.parametrize("users_db", ["legacy_id"], indirect=True)
+def test_next_id_fallback_concurrent(users_db, monkeypatch):
+    # Nhiều luồng tranh cùng max(id) + 1: đủ lượt thử lại để mọi người đều có id
+    monkeypatch.setattr(auth, "NEXT_ID_RETRIES", USERS)
+    names = [f"user{i:03d}" for i in range(USERS)]
+
+    _assert_consistent(users_db, _register_all(names), names)
+    assert auth._register_rpc_available is False
+    assert auth._id_default_available is False
+    _assert_one_duplicate_wins(users_db)
@@ -0,0 +1,41 @@
+# tests/test_seed.py
+# storage.seed() lỗi giữa chừng → rollback, DB không bị nạp dở.
+# Chạy: python -m pytest -q tests
+import pytest
+
+import storage
+from benchmarks import datagen
+
+
+def _sqlite():
+    return storage.create_sql_client("sqlite", ":memory:")
+
+
+def _count(client, table):
+    return client.query(f"SELECT COUNT(*) AS n FROM {table}")[0]["n"]
+
+
+def test_seed_loads_every_table():
+    client = _sqlite()
+    counts = storage.seed(client, scale=1)
+    assert counts["tasks"] > 0
+    assert {t: _count(client, t) for t in counts} == counts
+
+
+def test_failed_seed_rolls_back(monkeypatch):
+    def broken(scale, seed_value):
+        data = dict(real(scale, seed_value))
+        # Dòng cuối của bảng sau cùng trùng username → lỗi sau khi các bảng trước đã được ghi
+        data["attendance_new"] = data["attendance_new"] + data["attendance_new"][:1]
+        return data
+
+    real = datagen.generate
+    monkeypatch.setattr(datagen, "generate", broken)
+    client = _sqlite()
+    with pytest.raises(storage.StorageError):
+        storage.seed(client, scale=1)
+    assert [_count(client, t) for t in ("users", "projects", "tasks", "attendance_new")] == [0, 0, 0, 0]
+
+    # Kết nối vẫn dùng bình thường (autocommit) sau rollback
+    monkeypatch.setattr(datagen, "generate", real)
+    assert storage.seed(client, scale=1)["tasks"] == _count(client, "tasks")
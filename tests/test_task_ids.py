@@ -0,0 +1,52 @@
+# tests/test_task_ids.py
+# Task thêm / sửa theo tên (như app) phải có project_id / job_id (trigger tasks_resolve_ids)
+# thì các truy vấn lọc theo id mới thấy nó.
+# Chạy: python -m pytest -q tests
+import repository
+import task_stats
+import task_store
+
+
+def _setup(client):
+    client.table("projects").insert([{"name": "P1", "project_type": "public"},
+                                     {"name": "P2", "project_type": "public"}]).execute()
+    client.table("job_catalog").insert([{"name": "Nhóm A"}]).execute()
+    parent = client.table("job_catalog").select("id").eq("name", "Nhóm A").execute().data[0]["id"]
+    client.table("job_catalog").insert([{"name": "Việc 1", "unit": "m", "parent_id": parent}]).execute()
+    repository.invalidate()
+
+
+def _ids(client, project):
+    return client.table("tasks").select("project_id, job_id").eq("project", project).execute().data
+
+
+def test_insert_by_name_resolves_ids(client):
+    _setup(client)
+    client.table("tasks").insert([
+        {"project": "P1", "task": "Việc 1", "assignee": "a", "khoi_luong": 2, "progress": 50},
+    ]).execute()
+
+    projects = repository.load_projects().set_index("name")["id"]
+    jobs = repository.load_job_catalog().set_index("name")["id"]
+    assert _ids(client, "P1") == [{"project_id": projects["P1"], "job_id": jobs["Việc 1"]}]
+
+    tasks = task_store.get_project_tasks("P1")
+    assert tasks["task"].tolist() == ["Việc 1"]
+
+    stats = task_stats.load_task_stats(["P1"])
+    assert stats[["project", "parent_job", "total"]].values.tolist() == [["P1", "Nhóm A", 1]]
+
+
+def test_update_name_re_resolves_ids(client):
+    _setup(client)
+    client.table("tasks").insert([{"project": "P1", "task": "Việc 1", "assignee": "a"}]).execute()
+    client.table("tasks").update({"project": "P2"}).eq("project", "P1").execute()
+
+    projects = repository.load_projects().set_index("name")["id"]
+    assert _ids(client, "P2")[0]["project_id"] == projects["P2"]
+
+
+def test_unknown_names_leave_ids_empty(client):
+    _setup(client)
+    client.table("tasks").insert([{"project": "P9", "task": "Không có", "assignee": "a"}]).execute()
+    assert _ids(client, "P9") == [{"project_id": None, "job_id": None}]
@@ -0,0 +1,93 @@
+# tests/test_task_stats.py
+# aggregate_frame (pandas, khi DB chưa có RPC) và aggregate_sqlite (cùng hợp đồng với RPC task_stats)
+# phải cho cùng bảng thống kê trên cùng dữ liệu.
+# Chạy: python -m pytest -q tests
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import job_catalog
+import task_stats
+from benchmarks import datagen, scenarios
+
+KEYS = task_stats.STAT_KEYS
+NUMERIC = [c for c in task_stats.STAT_COLUMNS if c not in KEYS]
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df = df[task_stats.STAT_COLUMNS].copy()
+    df[KEYS] = df[KEYS].astype(object).where(df[KEYS].notna(), "<null>")
+    df[NUMERIC] = df[NUMERIC].astype(float)
+    return df.sort_values(KEYS).reset_index(drop=True)
+
+
+def _assert_same(conn, projects, by_id: bool = True):
+    """by_id=False: như DB chưa chạy tasks_fk_ids.sql (không có job_id, tra công việc theo tên)."""
+    df_tasks = pd.read_sql_query(
+        f"SELECT id, project, assignee, task, progress, job_id FROM tasks "
+        f"WHERE project IN ({','.join('?' * len(projects))})", conn, params=projects)
+    catalog = job_catalog.JobCatalog(pd.read_sql_query("SELECT * FROM job_catalog ORDER BY id", conn))
+
+    if by_id:
+        frame = task_stats.aggregate_frame(df_tasks, catalog.parent_name, catalog.parent_name_by_id)
+    else:
+        conn.execute("UPDATE tasks SET job_id = NULL")
+        frame = task_stats.aggregate_frame(df_tasks.drop(columns="job_id"), catalog.parent_name)
+    sqlite = task_stats.aggregate_sqlite(conn, projects)
+    pd.testing.assert_frame_equal(_normalize(frame), _normalize(sqlite))
+    return sqlite
+
+
+@pytest.mark.parametrize("by_id", [True, False])
+def test_generated_data(by_id):
+    data = datagen.generate(1, 42)
+    conn = scenarios.sqlite_from(data)
+    projects = [p["name"] for p in data["projects"]]
+    stats = _assert_same(conn, projects, by_id)
+    assert stats["total"].sum() == len(data["tasks"])
+
+
+def _edge_db():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE job_catalog (id INTEGER PRIMARY KEY, name TEXT, unit TEXT, parent_id INT, project_type TEXT);
+        CREATE TABLE tasks (id INTEGER PRIMARY KEY, project TEXT, project_id INT, assignee TEXT,
+                            task TEXT, job_id INT, progress REAL);
+        INSERT INTO job_catalog VALUES
+            (1, 'Đầu mục A', NULL, NULL, 'public'),
+            (2, 'Việc con', 'm', 1, 'public'),
+            (3, 'Việc gốc', 'm', NULL, 'group'),
+            (4, 'Việc con', 'm', 3, 'group'),      -- trùng tên: theo tên thì lấy id nhỏ nhất
+            (5, 'Cha đã xoá', 'm', 99, 'group');
+        INSERT INTO tasks (project, project_id, assignee, task, job_id, progress) VALUES
+            ('P1', 1, 'a', 'Việc con', 2, 100),
+            ('P1', 1, 'a', 'Việc con', 4, 50),     -- job_id thắng tên
+            ('P1', 1, 'a', 'Việc con', NULL, 0),   -- chưa có job_id → theo tên
+            ('P1', 1, 'b', 'Không có trong mục lục', NULL, 30),
+            ('P1', 1, 'b', 'Việc gốc', 3, NULL),   -- chưa nhập tiến độ
+            ('P1', 1, NULL, 'Cha đã xoá', 5, 100),
+            ('P2', 2, 'a', 'Đầu mục A', 1, 100.0),
+            ('P3', 3, 'c', 'Việc gốc', 3, 20);
+    """)
+    return conn
+
+
+def test_edge_cases():
+    stats = _assert_same(_edge_db(), ["P1", "P2"])
+    assert set(stats["project"]) == {"P1", "P2"}
+
+    p1a = stats[(stats["project"] == "P1") & (stats["assignee"] == "a")].set_index("parent_job")
+    assert p1a.loc["Đầu mục A", ["total", "done", "not_done"]].tolist() == [2, 1, 1]
+    assert p1a.loc["Việc gốc", ["total", "progress_sum"]].tolist() == [1, 50]
+
+
+def test_edge_cases_by_name():
+    _assert_same(_edge_db(), ["P1", "P2"], by_id=False)
+
+
+def test_empty():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE tasks (id INT, project TEXT, assignee TEXT, task TEXT, job_id INT, progress REAL)")
+    assert task_stats.aggregate_sqlite(conn, []).empty
+    assert task_stats.aggregate_frame(pd.DataFrame(), {}).empty
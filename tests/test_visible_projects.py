@@ -0,0 +1,70 @@
+# tests/test_visible_projects.py
+# visible_projects_sqlite (cùng hợp đồng với RPC visible_projects) phải cho cùng danh sách
+# với đường dự phòng _visible_fallback (so theo tên dự án) trên cùng dữ liệu.
+# Chạy: python -m pytest -q tests
+import pytest
+
+import project_members
+import project_service
+import repository
+
+USERS = ["an", "binh", "chi", "dung"]
+
+
+@pytest.fixture
+def data(client):
+    client.table("projects").insert([
+        {"name": "Công khai", "project_type": "public"},
+        {"name": "Nhóm 1", "project_type": "group"},
+        {"name": "Nhóm 2", "project_type": "group"},
+        {"name": "Nhóm 3", "project_type": "group"},
+    ]).execute()
+    client.table("users").insert([
+        {"username": "an", "project_manager_of": "Nhóm 1"},
+        {"username": "binh", "project_leader_of": "Nhóm 2|Nhóm 1"},
+        {"username": "chi"},
+        {"username": "dung"},
+    ]).execute()
+    ids = {r["name"]: r["id"] for r in client.table("projects").select("id, name").execute().data}
+    client.table("project_members").insert([
+        {"username": "an", "project_id": ids["Nhóm 1"], "role": "manager"},
+        {"username": "binh", "project_id": ids["Nhóm 2"], "role": "leader"},
+        {"username": "binh", "project_id": ids["Nhóm 1"], "role": "leader"},
+    ]).execute()
+    client.table("tasks").insert([
+        {"project": "Nhóm 2", "task": "Việc", "assignee": "an"},
+        {"project": "Công khai", "task": "Việc", "assignee": "chi"},
+        # Task giao trước khi dự án được tạo: chỉ gắn theo tên, project_id vẫn trống
+        {"project": "Dự án mới", "task": "Việc", "assignee": "dung"},
+    ]).execute()
+    client.table("projects").insert([{"name": "Dự án mới", "project_type": "group"}]).execute()
+    repository.invalidate()
+    return client
+
+
+def _rows(df):
+    return sorted(zip(df["id"].astype(int), df["name"], df["project_type"], df["managed"].astype(bool)))
+
+
+def _assert_same(client):
+    with client.driver.connection() as conn:
+        for username in USERS:
+            for include_managed in (True, False):
+                want = project_service._visible_fallback(username, include_managed)
+                got = project_service.visible_projects_sqlite(conn, username, include_managed)
+                assert _rows(got) == _rows(want), (username, include_managed)
+
+
+def test_matches_fallback(data):
+    assert data.query("SELECT project_id FROM tasks WHERE project = 'Dự án mới'") == [{"project_id": None}]
+    _assert_same(data)
+
+    with data.driver.connection() as conn:
+        names = set(project_service.visible_projects_sqlite(conn, "dung")["name"])
+    assert names == {"Công khai", "Dự án mới"}
+
+
+def test_matches_fallback_on_legacy_csv(data, monkeypatch):
+    # DB chưa có project_members: đường dự phòng đọc CSV users.project_*_of (theo tên dự án)
+    monkeypatch.setattr(project_members, "_table_available", False)
+    _assert_same(data)
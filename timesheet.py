@@ -0,0 +1,191 @@
+# timesheet.py
+import datetime as dt
+import re
+import warnings
+
+import pandas as pd
+
+from auth import get_connection
+import db_client
+
+
+# ==================== GIỜ CÔNG NHẬT ====================
+# Giờ bắt đầu / kết thúc và khoảng ngày của công nhật nằm trong các cột riêng
+# start_time, end_time, end_date của bảng tasks (migrations/tasks_time_fields.sql).
+# Dữ liệu cũ nhét chúng vào note dạng:
+#     ⏰ HH:MM - HH:MM (YYYY-MM-DD → YYYY-MM-DD) ghi chú
+# Module này là nơi DUY NHẤT đọc / ghi định dạng đó, để các trang không tự
+# viết regex riêng (trước đây mỗi nơi chấp nhận "→" hoặc "-" khác nhau).
+
+TIME_COLUMNS = ["start_time", "end_time", "end_date"]
+
+_TIME_PART = r"(\d{1,2}:\d{2})(?::\d{2})?"
+TIME_RE = re.compile(rf"⏰\s*{_TIME_PART}\s*[-–]\s*{_TIME_PART}")
+DATE_RANGE_RE = re.compile(r"\(\s*(\d{4}-\d{2}-\d{2})\s*[→\-–]\s*(\d{4}-\d{2}-\d{2})\s*\)")
+
+# None = chưa biết, True/False = bảng tasks đã / chưa có các cột mới
+_columns_available = None
+
+
+def fmt_hhmm(value) -> str:
+    """time / "8:00" / "08:00:00" → "08:00"; giá trị rỗng hoặc sai → ""."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if isinstance(value, (dt.time, dt.datetime)):
+        return value.strftime("%H:%M")
+    m = re.match(r"^\s*(\d{1,2}):(\d{2})", str(value))
+    return f"{int(m.group(1)):02d}:{m.group(2)}" if m else ""
+
+
+def fmt_date(value) -> str:
+    """date / chuỗi ngày → "YYYY-MM-DD"; rỗng hoặc sai → ""."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    d = pd.to_datetime(value, errors="coerce")
+    return "" if pd.isna(d) else d.strftime("%Y-%m-%d")
+
+
+def fmt_hhmm_series(values: pd.Series) -> pd.Series:
+    """fmt_hhmm cho cả cột: tách giờ bằng .str.extract thay vì gọi hàm cho từng ô."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.strftime("%H:%M").fillna("")
+    parts = values.where(values.notna(), "").astype(str).str.extract(r"^\s*(\d{1,2}):(\d{2})")
+    return (parts[0].str.zfill(2) + ":" + parts[1]).fillna("")
+
+
+def fmt_date_series(values: pd.Series) -> pd.Series:
+    """
+    fmt_date cho cả cột: 1 lần pd.to_datetime cho cả Series.
+    Ô có định dạng khác ô đầu (bị coerce thành NaT) mới đọc lại từng ô bằng fmt_date.
+    """
+    if values.empty:
+        return pd.Series("", index=values.index, dtype=object)
+    with warnings.catch_warnings():
+        # Ô đầu không suy ra được định dạng → pandas tự đọc từng ô (kết quả vẫn đúng)
+        warnings.simplefilter("ignore", UserWarning)
+        parsed = pd.to_datetime(values, errors="coerce")
+    out = parsed.dt.strftime("%Y-%m-%d").astype(object).where(parsed.notna(), "")
+    present = values.notna() & (values.astype(str).str.strip() != "")
+    retry = parsed.isna() & present
+    if retry.any():
+        out[retry] = values[retry].map(fmt_date)
+    return out
+
+
+# ==================== ĐỌC / GHI NOTE (ĐỊNH DẠNG CŨ) ====================
+
+def parse_note(note) -> dict:
+    """Tách note cũ → {start_time, end_time, start_date, end_date, text} (chuỗi, "" nếu không có)."""
+    text = note if isinstance(note, str) else ""
+    out = {"start_time": "", "end_time": "", "start_date": "", "end_date": "", "text": ""}
+
+    m = TIME_RE.search(text)
+    if m:
+        out["start_time"], out["end_time"] = fmt_hhmm(m.group(1)), fmt_hhmm(m.group(2))
+    d = DATE_RANGE_RE.search(text)
+    if d:
+        out["start_date"], out["end_date"] = d.group(1), d.group(2)
+
+    out["text"] = DATE_RANGE_RE.sub("", TIME_RE.sub("", text)).strip()
+    return out
+
+
+def format_note(start_time, end_time, start_date=None, end_date=None, text: str = "") -> str:
+    """Ghép lại note theo định dạng chuẩn (dùng khi DB chưa có cột riêng)."""
+    parts = []
+    s, e = fmt_hhmm(start_time), fmt_hhmm(end_time)
+    if s and e:
+        parts.append(f"⏰ {s} - {e}")
+        sd, ed = fmt_date(start_date), fmt_date(end_date)
+        if sd and ed:
+            parts.append(f"({sd} → {ed})")
+    if text and str(text).strip():
+        parts.append(str(text).strip())
+    return " ".join(parts)
+
+
+def parse_notes(notes: pd.Series) -> pd.DataFrame:
+    """parse_note cho cả cột note (vectorized, index giữ nguyên)."""
+    text = notes.where(notes.map(lambda v: isinstance(v, str)), "").astype(str)
+    times = text.str.extract(TIME_RE.pattern)
+    dates = text.str.extract(DATE_RANGE_RE.pattern)
+    hhmm = r"^(\d):"
+    return pd.DataFrame({
+        "start_time": times[0].fillna("").str.replace(hhmm, r"0\1:", regex=True),
+        "end_time": times[1].fillna("").str.replace(hhmm, r"0\1:", regex=True),
+        "start_date": dates[0].fillna(""),
+        "end_date": dates[1].fillna(""),
+        "text": text.str.replace(TIME_RE.pattern, "", regex=True)
+                    .str.replace(DATE_RANGE_RE.pattern, "", regex=True)
+                    .str.strip(),
+    }, index=notes.index)
+
+
+# ==================== ĐỌC TỪ BẢNG TASKS ====================
+
+def _column_or_blank(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series("", index=df.index)
+    return df[col]
+
+
+def time_fields(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Giờ / ngày công nhật của từng task (index giống df):
+    start_time, end_time ("HH:MM"), start_date, end_date ("YYYY-MM-DD"), text (ghi chú còn lại).
+    Ưu tiên các cột riêng; dòng cũ chưa backfill thì đọc từ note.
+    """
+    legacy = parse_notes(_column_or_blank(df, "note"))
+
+    def pick(col, fmt, fallback):
+        values = fmt(_column_or_blank(df, col))
+        return values.where(values != "", fallback)
+
+    out = pd.DataFrame(index=df.index)
+    out["start_time"] = pick("start_time", fmt_hhmm_series, legacy["start_time"])
+    out["end_time"] = pick("end_time", fmt_hhmm_series, legacy["end_time"])
+    start_date = fmt_date_series(_column_or_blank(df, "start_date"))
+    out["start_date"] = legacy["start_date"].where(legacy["start_date"] != "", start_date)
+    out["end_date"] = pick("end_date", fmt_date_series, legacy["end_date"])
+    out["end_date"] = out["end_date"].where(out["end_date"] != "", out["start_date"])
+    out["text"] = legacy["text"]
+    return out
+
+
+# ==================== GHI VÀO BẢNG TASKS ====================
+
+def has_time_columns() -> bool:
+    """
+    Bảng tasks đã có start_time / end_time / end_date chưa (kiểm tra 1 lần / tiến trình).
+    Chỉ ghi nhớ False khi DB báo thiếu cột; lỗi tạm thời (mạng, timeout) được ném lại
+    để lần sau kiểm tra lại thay vì ghi giờ vào note mãi.
+    """
+    global _columns_available
+    if _columns_available is None:
+        try:
+            get_connection().table("tasks").select(", ".join(TIME_COLUMNS)).limit(1).execute()
+            _columns_available = True
+        except Exception as e:
+            if not db_client.is_missing_column(e):
+                raise
+            _columns_available = False
+    return _columns_available
+
+
+def task_fields(start_time, end_time, start_date=None, end_date=None, text: str = "") -> dict:
+    """
+    Các cột cần ghi cho 1 công nhật.
+    - DB có cột riêng → note chỉ còn ghi chú, giờ / ngày kết thúc nằm ở start_time, end_time, end_date
+    - DB chưa chạy migration → ghép tất cả vào note theo định dạng cũ
+    """
+    s, e = fmt_hhmm(start_time), fmt_hhmm(end_time)
+    if not has_time_columns():
+        return {"note": format_note(s, e, start_date, end_date, text)}
+
+    has_time = bool(s and e)
+    return {
+        "note": str(text or "").strip(),
+        "start_time": s if has_time else None,
+        "end_time": e if has_time else None,
+        "end_date": (fmt_date(end_date) or None) if has_time else None,
+    }
@@ -1,38 +1,24 @@
 # user_app.py
+import math
 import streamlit as st
 import pandas as pd
 from datetime import datetime
 from auth import get_connection, calc_hours
-from supabase import create_client
+import repository
+import task_store
+import job_catalog
+import timesheet
+import presence
+import project_service
+import loader
+import perf
 
-import re
 
-def _load_visible_projects(supabase, username: str) -> pd.DataFrame:
+def _load_visible_projects(username: str) -> pd.DataFrame:
     """
-    Lấy danh sách dự án user đang có nhiệm vụ hoặc là public
+    Lấy danh sách dự án user đang có nhiệm vụ hoặc là public (1 request, cache theo user)
     """
-    data = supabase.table("projects").select("id, name, deadline, project_type").eq("project_type", "public").execute()
-    public_df = pd.DataFrame(data.data)
-
-
-    data = supabase.table("tasks").select("project").eq("assignee", username).execute()
-    assigned_names = list({r["project"] for r in data.data})
-
-
-    if assigned_names:
-        data = supabase.table("projects").select("id, name, deadline, project_type").in_("name", assigned_names).execute()
-        assigned_df = pd.DataFrame(data.data)
-    else:
-        assigned_df = pd.DataFrame(columns=["id", "name", "deadline", "project_type"])
-
-
-    all_df = (
-        pd.concat([public_df, assigned_df], ignore_index=True)
-        .drop_duplicates(subset=["name"])
-        .sort_values("name")
-        .reset_index(drop=True)
-    )
-    return all_df
+    return project_service.visible_projects(username, include_managed=False)
 
 
 def user_app(user):
@@ -47,11 +33,16 @@ def user_app(user):
 
     try:
         username = user[1]
-        supabase.table("users").update({"last_seen": datetime.utcnow().isoformat(timespec="seconds")}).eq("username", username).execute()
+        presence.heartbeat(username)   # ghi nền theo lô, không chặn trang
 
         st.subheader("🧑‍💻 Công việc của tôi")
 
-        projects_df = _load_visible_projects(supabase, username)
+        # Dự án thấy được + mục lục công việc (dùng ở form thêm việc) tải song song
+        loaded = loader.gather({
+            "projects": lambda: _load_visible_projects(username),
+            "catalog": job_catalog.get_catalog,
+        })
+        projects_df = loaded["projects"]
         if projects_df.empty:
             st.info("⚠️ Bạn hiện chưa có dự án nào hoặc chưa được giao việc.")
             return
@@ -65,12 +56,37 @@ def user_app(user):
         proj_type = (prow["project_type"] or "group").strip().lower()
         is_public = True   # ép chạy AG-Grid để test
 
-        # ======= Danh sách task của user =======
-        data = supabase.table("tasks").select(
-            "id, task, khoi_luong, progress, deadline, note, approved, start_date"
-        ).eq("project", project).eq("assignee", username).execute()
-
-        df_tasks = pd.DataFrame(data.data)
+        # ======= Danh sách task của user (lọc + phân trang trên server) =======
+        col_from, col_to, col_status = st.columns(3)
+        date_from = col_from.date_input("Từ ngày", value=None, key=f"user_from_{project}")
+        date_to = col_to.date_input("Đến ngày", value=None, key=f"user_to_{project}")
+        status = col_status.selectbox("Trạng thái", ["Tất cả", "Chưa duyệt", "Đã duyệt"], key=f"user_status_{project}")
+        approved_filter = {"Tất cả": None, "Chưa duyệt": False, "Đã duyệt": True}[status]
+
+        page_key = f"user_page_{project}_{date_from}_{date_to}_{status}"
+        page = int(st.session_state.get(page_key, 1))
+        df_tasks, n_total = task_store.fetch_page(
+            project, assignee=username, date_from=date_from, date_to=date_to,
+            approved=approved_filter, page=page - 1
+        )
+        n_pages = max(1, math.ceil(n_total / task_store.PAGE_SIZE))
+        if page > n_pages:
+            st.session_state.pop(page_key, None)
+            page = 1
+            df_tasks, n_total = task_store.fetch_page(
+                project, assignee=username, date_from=date_from, date_to=date_to,
+                approved=approved_filter, page=0
+            )
+        if n_pages > 1:
+            st.number_input(
+                f"Trang (tổng {n_pages} trang, {n_total} dòng)",
+                min_value=1, max_value=n_pages, value=page, step=1, key=page_key
+            )
+        # Giờ bắt đầu / kết thúc, khoảng ngày và ghi chú (cột riêng, hoặc note với dữ liệu cũ)
+        task_times = timesheet.time_fields(df_tasks)
+        df_tasks = df_tasks[
+            ["id", "task", "khoi_luong", "progress", "deadline", "note", "approved", "start_date"]
+        ].copy()
 
         # === HIỂN THỊ NGÀY CÔNG TỪ start_date ===
         if "start_date" in df_tasks.columns:
@@ -86,17 +102,11 @@ def user_app(user):
         if df_tasks.empty:
             st.warning("⚠️ Bạn chưa có công việc nào trong dự án này.")        
         else:
-            # === Tách giờ bắt đầu và kết thúc từ note nếu có dạng ...
-
-            def extract_times(note):
-                match = re.search(r"(\d{2}:\d{2})\s*-\s*(\d{2}:\d{2})", str(note))
-                if match:
-                    return match.group(1), match.group(2)
-                return "", ""
+            end_dates = dict(zip(df_tasks["id"].astype(int), task_times["end_date"]))
 
-            df_tasks["Giờ bắt đầu"], df_tasks["Giờ kết thúc"] = zip(
-                *df_tasks["note"].map(extract_times)
-            )
+            df_tasks["Giờ bắt đầu"] = task_times["start_time"]
+            df_tasks["Giờ kết thúc"] = task_times["end_time"]
+            df_tasks["note"] = task_times["text"]
 
             # ❗ GIỮ NGUYÊN DẠNG STRING HH:MM – KHÔNG CONVERT
             df_tasks["Giờ bắt đầu"] = df_tasks["Giờ bắt đầu"].fillna("").astype(str)
@@ -226,18 +236,19 @@ def user_app(user):
                 grid_options["suppressRowClickSelection"] = False
 
                 with st.form(f"user_public_form_{project}_{username}", clear_on_submit=False):
-                    grid = AgGrid(
-                        df_show,
-                        gridOptions=grid_options,
-                        key=f"user_public_grid_{project}_{username}",
-                        update_mode=GridUpdateMode.SELECTION_CHANGED,
-                        data_return_mode=DataReturnMode.AS_INPUT,
-                        allow_unsafe_jscode=True,
-                        reload_data=False,
-                        fit_columns_on_grid_load=False,
-                        width="100%",
-                        height=420,
-                    )
+                    with perf.span("grid:user.tasks", rows=len(df_show)):
+                        grid = AgGrid(
+                            df_show,
+                            gridOptions=grid_options,
+                            key=f"user_public_grid_{project}_{username}",
+                            update_mode=GridUpdateMode.SELECTION_CHANGED,
+                            data_return_mode=DataReturnMode.AS_INPUT,
+                            allow_unsafe_jscode=True,
+                            reload_data=False,
+                            fit_columns_on_grid_load=False,
+                            width="100%",
+                            height=420,
+                        )
                     edited = pd.DataFrame(grid["data"])
                     selected_rows = grid.get("selected_rows", [])
 
@@ -249,49 +260,18 @@ def user_app(user):
 
                 # ===== LƯU =====
                 if save_click:
-                    updated = 0
-                    blocked = 0
-
                     selected_ids = {int(r["ID"]) for r in selected_rows}
 
-                    for _, row in edited.iterrows():
-                        if int(row["ID"]) not in selected_ids:
-                            continue
-
-                        # chặn đã duyệt
-                        if bool(row.get("approved", False)):
-                            blocked += 1
-                            continue
-
-                        task_id = int(row["ID"])
+                    def _row_fields(row):
                         update_data = {}
 
                         # giờ + note (giữ logic mày đang làm)
                         start_time = row.get("Giờ bắt đầu", "")
                         end_time = row.get("Giờ kết thúc", "")
-                        note_text = str(row.get("Ghi chú", "")).strip()
-
-                        match_date = re.search(r"\(\d{4}-\d{2}-\d{2}\s*-\s*\d{4}-\d{2}-\d{2}\)", note_text)
-                        date_part = match_date.group(0) if match_date else ""
-
-                        note_text = re.sub(r"^⏰\s*\d{2}:\d{2}(?::\d{2})?\s*-\s*\d{2}:\d{2}(?::\d{2})?", "", note_text)
-                        note_text = re.sub(r"\(\d{4}-\d{2}-\d{2}\s*-\s*\d{4}-\d{2}-\d{2}\)", "", note_text).strip()
+                        note_text = str(row.get("Ghi chú", "") or "").strip()
 
-                        # chuẩn hóa HH:MM
-                        def _fmt_hhmm(x):
-                            s = str(x).strip()
-                            m = re.search(r"(\d{1,2}:\d{2})", s)
-                            return m.group(1) if m else ""
-
-                        start_str = _fmt_hhmm(start_time)
-                        end_str   = _fmt_hhmm(end_time)
-
-                        if start_str and end_str:
-                            new_note = f"⏰ {start_str} - {end_str} {date_part} {note_text}".strip()
-                        else:
-                            new_note = note_text
-
-                        update_data["note"] = new_note
+                        start_str = timesheet.fmt_hhmm(start_time)
+                        end_str   = timesheet.fmt_hhmm(end_time)
 
                         # ✅ start_date: lấy từ start_date trong row nếu có, không thì fallback hôm nay
                         # (khuyến nghị: sau này thêm cột 'Ngày' riêng giống admin để chắc chắn)
@@ -299,6 +279,14 @@ def user_app(user):
                         if start_date_str:
                             update_data["start_date"] = start_date_str
 
+                        # giờ vào cột riêng, giữ khoảng ngày cũ nếu có
+                        end_date_str = end_dates.get(int(row["ID"])) or start_date_str
+                        if start_date_str:
+                            end_date_str = max(end_date_str, start_date_str)
+                        update_data.update(timesheet.task_fields(
+                            start_str, end_str, start_date_str, end_date_str, note_text
+                        ))
+
 
                         # nếu có giờ thì tính lại khối lượng
                         try:
@@ -310,12 +298,28 @@ def user_app(user):
                         except:
                             pass
 
-                        if update_data:
-                            supabase.table("tasks").update(update_data).eq("id", task_id).execute()
-                            updated += 1
+                        return update_data
+
+                    chosen = edited[edited["ID"].astype(int).isin(selected_ids)] if not edited.empty else edited
+
+                    # chặn đã duyệt
+                    if "approved" in chosen.columns:
+                        is_approved = chosen["approved"].fillna(False).astype(bool)
+                    else:
+                        is_approved = pd.Series(False, index=chosen.index)
+                    blocked = int(is_approved.sum())
+
+                    # ✅ Chỉ gửi các dòng thực sự thay đổi so với lúc tải, gộp thành 1 request
+                    changes = repository.diff_task_rows(df_show, chosen[~is_approved], _row_fields)
+                    results = repository.bulk_update_tasks(changes)
+                    task_store.invalidate_project(project)
+                    updated = sum(1 for err in results.values() if not err)
+                    failed = {tid: err for tid, err in results.items() if err}
 
                     if blocked > 0:
                         st.warning(f"⚠️ Có {blocked} dòng đã duyệt nên không thể sửa.")
+                    for tid, err in failed.items():
+                        st.error(f"❌ Lỗi khi cập nhật dòng {tid}: {err}")
                     st.success(f"✅ Đã cập nhật {updated} dòng.")
                     st.rerun()
 
@@ -333,6 +337,7 @@ def user_app(user):
 
                     if ids_to_delete:
                         supabase.table("tasks").delete().in_("id", ids_to_delete).execute()
+                        task_store.invalidate_project(project)
                         st.success(f"✅ Đã xóa {len(ids_to_delete)} dòng.")
                     else:
                         st.warning("⚠️ Chưa chọn dòng nào để xóa.")
@@ -349,40 +354,23 @@ def user_app(user):
             st.markdown("---")
             st.subheader("➕ Thêm công việc / công nhật cho bản thân (Public)")
 
-            # Lấy danh mục công việc
-            supabase.table("job_catalog").update({"project_type": "group"}).is_("project_type", None).execute()
-            
-            
-            data = supabase.table("job_catalog").select("id, name, unit, parent_id").eq("project_type", proj_type).execute()
-            jobs = pd.DataFrame(data.data)
-
-            parent_jobs = jobs[jobs["parent_id"].isnull()].sort_values("name")
+            # Lấy danh mục công việc (chỉ mục dùng chung, project_type NULL được coi là 'group')
+            catalog = job_catalog.get_catalog()
+            jobs = catalog.jobs_of_type(proj_type)
             col_a, col_b = st.columns([3, 3])
             with col_a:
                 parent_choice = st.selectbox(
                     "Đầu mục công việc",
-                    parent_jobs["name"].tolist(),
+                    catalog.root_names(proj_type),
                     key="user_self_parent",
                 )
-            pid = None
-            if not parent_jobs.empty:
-                pid = int(
-                    parent_jobs.loc[
-                        parent_jobs["name"] == parent_choice, "id"
-                    ].iloc[0]
-                )
-            childs = jobs[jobs["parent_id"] == pid].sort_values("name")
             with col_b:
                 child_choice = st.selectbox(
-                    "Công việc chi tiết", childs["name"].tolist(), key="user_self_child"
+                    "Công việc chi tiết", catalog.child_names(parent_choice, proj_type), key="user_self_child"
                 )
 
             task_name = child_choice or parent_choice
-            unit = (
-                jobs.loc[jobs["name"] == task_name, "unit"].iloc[0]
-                if task_name in jobs["name"].values
-                else ""
-            ) or ""
+            unit = catalog.unit_of(task_name) if task_name in jobs["name"].values else ""
 
             # Nếu là công nhật
             if str(unit).strip().lower() == "công":
@@ -408,20 +396,17 @@ def user_app(user):
 
                 if st.button("➕ Thêm công nhật cho tôi", key="add_self_cong_btn"):
                     hours = calc_hours(start_date, end_date, start_time, end_time)
-                    note_txt = f"⏰ {start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')} ({start_date} - {end_date})"
-                    if note:
-                        note_txt += f" {note}"
 
-                    
                     supabase.table("tasks").insert({
                         "project": project,
                         "task": task_name,
                         "assignee": username,
                         "khoi_luong": hours,
-                        "note": note_txt,
+                        **timesheet.task_fields(start_time, end_time, start_date, end_date, note),
                         "progress": 0,
                         "start_date": str(start_date)   # 👈 BẮT BUỘC
                     }).execute()
+                    task_store.invalidate_project(project)
 
                     
                     st.success(
@@ -442,6 +427,7 @@ def user_app(user):
                         "note": "",
                         "progress": 0
                     }).execute()
+                    task_store.invalidate_project(project)
                     
                     st.success("✅ Đã thêm công việc cho bạn")
                     st.rerun()